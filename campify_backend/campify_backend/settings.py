@@ -30,6 +30,28 @@ ALLOWED_HOSTS = []
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загруженные файлы хранятся под sha256 содержимого (core/storage.py):
+# одинаковые загрузки не дублируются, а URL файла не меняется никогда.
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Отдача файлов фронтовым прокси вместо Python (core/downloads.py):
+# None - файлы стримит Django; 'x-accel' - nginx по X-Accel-Redirect
+# (нужен internal-location MEDIA_OFFLOAD_ACCEL_PREFIX с alias на MEDIA_ROOT);
+# 'x-sendfile' - Apache mod_xsendfile / lighttpd по абсолютному пути.
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD') or None
+MEDIA_OFFLOAD_ACCEL_PREFIX = '/protected-media/'
+
+# Блоб без ссылок не удаляется, пока с его сохранения не прошло столько
+# секунд: ссылку на него берут уже после save() (core/storage.py).
+MEDIA_PURGE_GRACE_PERIOD = 15 * 60
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -152,6 +174,18 @@ DATABASES = {
 }
 
 
+# Cache
+# Файловый кэш общий для всех процессов на одной машине: через него
+# процессы узнают о сменах версий данных (например, справочника тегов).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -192,3 +226,26 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Как часто (в секундах) каждый процесс перечитывает матрицу маршрут x тег
+# для рекомендаций целиком, чтобы подхватить изменения из других процессов.
+RECOMMENDATIONS_MATRIX_MAX_AGE = 300
+
+# Фоновые задачи (производные изображений и т.п.) выполняются в пуле потоков
+# процесса (core/workers.py). В режиме EAGER задачи выполняются сразу в
+# вызывающем потоке - удобно для тестов и отладки.
+BACKGROUND_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+
+# Кэш ответов каталога (core/response_cache.py): сколько секунд ответ
+# считается свежим и сколько ещё может отдаваться устаревшим, пока один
+# процесс его пересобирает. Изменения данных сбрасывают кэш сигналами сразу.
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_STALE_TIMEOUT = 60
+
+# Просмотры маршрутов копятся в памяти процесса (core/view_counter.py) и
+# записываются в базу пачкой раз в столько секунд; 0 - писать сразу.
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+
+# Сколько потоков процесса обрабатывают файлы пакетных загрузок фото (общий пул на все запросы)
+UPLOAD_WORKERS = 4
@@ -0,0 +1,262 @@
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from .models import FavoriteRoute, MapPoint, Route, RoutePhoto, RouteReview, Tag, User, UserTagPreference
+from .seeding import LATITUDE_RANGE, LONGITUDE_RANGE
+
+SAMPLE_SIZE = 1000
+SEARCH_QUERIES = ('озеро', 'сосновый бор', 'водопад', 'стоянка у реки', 'пещера', 'маршрут')
+
+
+class Fixtures:
+    """Случайные существующие id для подстановки в URL, чтобы запросы не били в одну строку."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.route_ids = self._sample(Route.objects.filter(is_public=True))
+        self.user_ids = self._sample(User.objects.all())
+        self.point_ids = self._sample(MapPoint.objects.all())
+        self.tag_ids = self._sample(Tag.objects.all())
+
+    @staticmethod
+    def _sample(queryset):
+        return list(queryset.order_by('?').values_list('id', flat=True)[:SAMPLE_SIZE])
+
+    def route(self):
+        return self.rng.choice(self.route_ids)
+
+    def user(self):
+        return self.rng.choice(self.user_ids)
+
+    def point(self):
+        return self.rng.choice(self.point_ids)
+
+    def tags(self, count):
+        return ','.join(map(str, self.rng.sample(self.tag_ids, min(count, len(self.tag_ids)))))
+
+    def location(self):
+        return {
+            'lat': round(self.rng.uniform(*LATITUDE_RANGE), 4),
+            'lon': round(self.rng.uniform(*LONGITUDE_RANGE), 4),
+            'radius_km': self.rng.choice((10, 25, 50)),
+        }
+
+
+# (имя, имя URL из core/urls.py, какие id нужны, функция fixtures -> (kwargs пути, параметры запроса))
+SCENARIOS = (
+    ('routes', 'route-list-create', (), lambda f: ({}, {})),
+    ('routes_equip', 'route-equip-list', (), lambda f: ({}, {})),
+    ('routes_wild', 'route-wild-list', (), lambda f: ({}, {})),
+    ('routes_nearby', 'route-nearby', (), lambda f: ({}, f.location())),
+    ('routes_search', 'route-search', (), lambda f: ({}, {'q': f.rng.choice(SEARCH_QUERIES)})),
+    ('routes_filter', 'route-filter', ('tag_ids',), lambda f: ({}, {'difficulty': '1,2', 'tags': f.tags(1)})),
+    ('route_detail', 'route-detail', ('route_ids',), lambda f: ({'pk': f.route()}, {})),
+    ('route_full', 'route-full', ('route_ids',), lambda f: ({'pk': f.route()}, {})),
+    ('route_reviews', 'route-reviews', ('route_ids',), lambda f: ({'route_id': f.route()}, {})),
+    ('route_photos', 'route-photo-list', ('route_ids',), lambda f: ({'pk': f.route()}, {})),
+    ('route_photos_unchecked', 'route-photo-unchecked', (), lambda f: ({}, {})),
+    ('user_routes', 'route-user', ('user_ids',), lambda f: ({'user_id': f.user()}, {})),
+    ('user_favorites', 'user-favorite-routes', ('user_ids',), lambda f: ({'user_id': f.user()}, {})),
+    ('recommendations', 'route-recommendation', ('user_ids',), lambda f: ({'user_id': f.user()}, {})),
+    ('map_point_detail', 'map_point-detail', ('point_ids',), lambda f: ({'pk': f.point()}, {})),
+    ('tags', 'tags-list', (), lambda f: ({}, {})),
+)
+
+
+def scenario_names():
+    return [name for name, _, _, _ in SCENARIOS]
+
+
+def _build_url(url_name, kwargs, params):
+    url = reverse(url_name, kwargs=kwargs)
+    return f'{url}?{urlencode(params)}' if params else url
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль с линейной интерполяцией по отсортированному списку."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class InProcessTransport:
+    """Запросы через тестовый клиент Django в этом же процессе; считает SQL-запросы."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, url):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client()
+        queries = []
+        with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+            response = client.get(url)
+        return response.status_code, len(queries)
+
+    def finish_thread(self):
+        # У каждого потока своё соединение с базой, закрываем его вместе с потоком
+        connection.close()
+
+
+class HttpTransport:
+    """Запросы к запущенному серверу; число SQL-запросов снаружи не видно."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, url):
+        try:
+            with urllib.request.urlopen(self.base_url + url, timeout=self.timeout) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+    def finish_thread(self):
+        pass
+
+
+def run_scenario(transport, fixtures, scenario, requests, concurrency, warmup):
+    """Прогоняет один сценарий и возвращает сводку: перцентили, пропускная способность, SQL-запросы."""
+    _, url_name, _, make_arguments = scenario
+    # URL строятся заранее и по одному генератору, чтобы прогон был воспроизводим при любом concurrency
+    urls = [_build_url(url_name, *make_arguments(fixtures)) for _ in range(warmup + requests)]
+    for url in urls[:warmup]:
+        transport.get(url)
+    urls = urls[warmup:]
+
+    latencies, statuses, query_counts = [], [], []
+    lock = threading.Lock()
+    cursor = iter(urls)
+
+    def worker():
+        while True:
+            with lock:
+                url = next(cursor, None)
+            if url is None:
+                return
+            start = time.perf_counter()
+            status, queries = transport.get(url)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed * 1000)
+                statuses.append(status)
+                if queries is not None:
+                    query_counts.append(queries)
+
+    def thread_worker():
+        try:
+            worker()
+        finally:
+            transport.finish_thread()
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=thread_worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'url': urls[0],
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'queries_mean': round(statistics.fmean(query_counts), 2) if query_counts else None,
+        'queries_max': max(query_counts) if query_counts else None,
+    }
+
+
+def data_volume():
+    models = (User, Route, Tag, RouteReview, RoutePhoto, MapPoint, FavoriteRoute, UserTagPreference)
+    return {model._meta.model_name: model.objects.count() for model in models}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(transport, names=None, requests=200, concurrency=1, warmup=10, seed=42, on_result=None):
+    """
+    Прогоняет сценарии SCENARIOS (или только names) и возвращает отчёт,
+    пригодный для json.dump: метаданные прогона и сводку по каждому
+    сценарию. Сценарии, для которых в базе нет нужных объектов, пропускаются.
+    """
+    fixtures = Fixtures(seed)
+    results = {}
+    for scenario in SCENARIOS:
+        name, _, needs, _ = scenario
+        if names and name not in names:
+            continue
+        if any(not getattr(fixtures, attribute) for attribute in needs):
+            results[name] = {'skipped': 'нет данных'}
+        else:
+            results[name] = run_scenario(transport, fixtures, scenario, requests, concurrency, warmup)
+        if on_result is not None:
+            on_result(name, results[name])
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'transport': type(transport).__name__,
+            'database': connection.vendor,
+            'requests': requests,
+            'concurrency': concurrency,
+            'warmup': warmup,
+            'seed': seed,
+            'data': data_volume(),
+        },
+        'endpoints': results,
+    }
+
+
+def compare_reports(baseline, current, metrics=('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_mean')):
+    """Строки (сценарий, метрика, было, стало, изменение в %) для двух отчётов run_benchmark."""
+    rows = []
+    for name, result in current['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if not before or 'skipped' in before or 'skipped' in result:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else None
+            rows.append((name, metric, old, new, change))
+    return rows
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as report:
+        return json.load(report)
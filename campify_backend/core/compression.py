@@ -0,0 +1,70 @@
+import gzip
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+
+from django.core.files import File
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него храним только gzip
+    brotli = None
+
+GZIP_SUFFIX = '.gz'
+BROTLI_SUFFIX = '.br'
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+CHUNK_SIZE = 64 * 1024
+# Сжатые данные до этого размера держатся в памяти, дальше - во временном файле
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def _read_chunks(fileobj):
+    if hasattr(fileobj, 'chunks'):
+        yield from fileobj.chunks(CHUNK_SIZE)
+        return
+    while chunk := fileobj.read(CHUNK_SIZE):
+        yield chunk
+
+
+def compress_file(fileobj, name):
+    """
+    Сжимает файл за один проход: gzip и, если установлен brotli, br.
+
+    gzip пишется без имени и времени в заголовке (mtime=0), поэтому
+    одинаковое содержимое всегда даёт одинаковые байты и в хранилище
+    блобов не дублируется. Возвращает (gzip-файл, brotli-файл или None).
+    """
+    gzip_spool = SpooledTemporaryFile(SPOOL_MAX_SIZE)
+    brotli_spool = compressor = None
+    if brotli is not None:
+        brotli_spool = SpooledTemporaryFile(SPOOL_MAX_SIZE)
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+    with gzip.GzipFile(filename='', mode='wb', fileobj=gzip_spool, compresslevel=GZIP_LEVEL, mtime=0) as out:
+        for chunk in _read_chunks(fileobj):
+            out.write(chunk)
+            if compressor is not None:
+                brotli_spool.write(compressor.process(chunk))
+    gzip_spool.seek(0)
+    if compressor is None:
+        return File(gzip_spool, name=name + GZIP_SUFFIX), None
+    brotli_spool.write(compressor.finish())
+    brotli_spool.seek(0)
+    return File(gzip_spool, name=name + GZIP_SUFFIX), File(brotli_spool, name=name + BROTLI_SUFFIX)
+
+
+def save_brotli_variant(field_file, brotli_file):
+    """Кладёт br-вариант рядом с сохранённым gzip-файлом (если хранилище это умеет)."""
+    if brotli_file is not None and hasattr(field_file.storage, 'save_companion'):
+        field_file.storage.save_companion(field_file.name, BROTLI_SUFFIX, brotli_file)
+
+
+@contextmanager
+def open_decompressed(storage, name):
+    """Открывает файл хранилища на чтение, распаковывая gzip на лету."""
+    with storage.open(name, 'rb') as raw:
+        if name.endswith(GZIP_SUFFIX):
+            with gzip.GzipFile(fileobj=raw, mode='rb') as decompressed:
+                yield decompressed
+        else:
+            yield raw
@@ -0,0 +1,281 @@
+import mimetypes
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .compression import BROTLI_SUFFIX, GZIP_SUFFIX, open_decompressed
+from .storage import BLOB_DIR
+
+CHUNK_SIZE = 64 * 1024
+# Больше диапазонов в одном запросе не обслуживаем - отдаём файл целиком
+MAX_RANGES = 16
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+mimetypes.add_type('application/gpx+xml', '.gpx')
+
+
+class FileMeta:
+    """Метаданные файла хранилища: размер, время изменения и ETag, без открытия файла."""
+
+    def __init__(self, storage, name):
+        self.name = name
+        self.size = storage.size(name)
+        self.modified = int(storage.get_modified_time(name).timestamp())
+        if name.startswith(BLOB_DIR + '/'):
+            # Имя блоба - хеш содержимого, он же строгий ETag
+            self.etag = quote_etag(os.path.basename(name).partition('.')[0])
+        else:
+            self.etag = quote_etag(f'{self.modified:x}-{self.size:x}')
+
+
+def parse_ranges(header, size):
+    """
+    Разбирает заголовок Range. Возвращает список (start, end) включительно,
+    отсортированный и без пересечений; None, если заголовок нужно
+    проигнорировать; [] - если ни один диапазон не попадает в файл (416).
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+    ranges = []
+    for part in spec.split(','):
+        match = RANGE_RE.match(part)
+        if not match:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        elif last:
+            start, end = max(size - int(last), 0), size - 1
+            if not int(last):
+                continue
+        else:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _if_range_passes(request, meta):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == meta.etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and date == meta.modified
+
+
+def _stream(storage, name, pieces):
+    """
+    Генератор тела ответа из кусков: bytes отдаются как есть, (start, end) -
+    байты файла. Файл открывается только при первой итерации.
+    """
+    with storage.open(name, 'rb') as fileobj:
+        for piece in pieces:
+            if isinstance(piece, bytes):
+                yield piece
+                continue
+            start, end = piece
+            fileobj.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = fileobj.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _stream_decompressed(storage, name):
+    with open_decompressed(storage, name) as fileobj:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            yield chunk
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding с ненулевым q."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        coding = coding.strip().lower()
+        if coding and quality > 0:
+            accepted.add(coding)
+    if '*' in accepted:
+        accepted |= {'gzip', 'br'}
+    return accepted
+
+
+def _choose_encoding(request, storage, name):
+    """
+    Для файла, хранящегося в gzip, выбирает отдаваемое представление:
+    (имя файла, Content-Encoding или None для распаковки на лету).
+    """
+    accepted = accepted_encodings(request)
+    if 'br' in accepted and storage.exists(name + BROTLI_SUFFIX):
+        return name + BROTLI_SUFFIX, 'br'
+    if 'gzip' in accepted:
+        return name, 'gzip'
+    return name, None
+
+
+def _etag_variant(etag, suffix):
+    return f'{etag[:-1]}-{suffix}"'
+
+
+def offload_response(name, content_type=None):
+    """
+    Ответ без тела, передающий отдачу файла name (путь относительно
+    MEDIA_ROOT) фронтовому прокси согласно MEDIA_OFFLOAD. Прокси сам
+    обрабатывает Range и условные запросы. None, если выгрузка выключена.
+    Путь, выходящий за MEDIA_ROOT, вызывает SuspiciousFileOperation.
+    """
+    mode = getattr(settings, 'MEDIA_OFFLOAD', None)
+    if not mode:
+        return None
+    path = safe_join(settings.MEDIA_ROOT, name)
+    if content_type is None:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel':
+        prefix = settings.MEDIA_OFFLOAD_ACCEL_PREFIX.rstrip('/')
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(relative)}'
+    elif mode == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ImproperlyConfigured(f"Неизвестный режим MEDIA_OFFLOAD: {mode!r}")
+    return response
+
+
+def file_response(request, field_file, content_type, filename=None, as_attachment=False):
+    """Отдаёт файл поля модели, см. storage_response."""
+    return storage_response(request, field_file.storage, field_file.name, content_type, filename, as_attachment)
+
+
+def storage_response(request, storage, name, content_type, filename=None, as_attachment=False):
+    """
+    Отдаёт файл name из хранилища storage с поддержкой условных запросов и Range.
+
+    ETag и Last-Modified берутся из метаданных хранилища. If-None-Match и
+    If-Modified-Since дают 304, Range - 206 с одним диапазоном или
+    multipart/byteranges с несколькими, If-Range проверяется по ETag или
+    дате. Файл открывается только когда тело ответа действительно читается.
+    Если файла нет в хранилище, пробрасывает FileNotFoundError.
+
+    Файлы, хранящиеся в gzip (*.gz), отдаются как есть с Content-Encoding
+    (или br-вариант, если он есть и клиент его принимает). Клиентам без
+    поддержки сжатия файл распаковывается потоково, без Range.
+    При включённом MEDIA_OFFLOAD сжатые представления отдаёт фронтовой прокси.
+    """
+    stored_name = name
+    filename = filename or os.path.basename(name)
+    compressed = name.endswith(GZIP_SUFFIX)
+    encoding = None
+    if compressed:
+        name, encoding = _choose_encoding(request, storage, name)
+
+    def finish(response, headers):
+        for header, value in headers.items():
+            response[header] = value
+        disposition = content_disposition_header(as_attachment, filename)
+        if disposition:
+            response['Content-Disposition'] = disposition
+        return response
+
+    headers = {}
+    if compressed:
+        headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+    if not compressed or encoding:
+        offloaded = offload_response(name, content_type)
+        if offloaded is not None:
+            return finish(offloaded, headers)
+
+    meta = FileMeta(storage, name)
+    if encoding == 'br':
+        meta.etag = _etag_variant(FileMeta(storage, stored_name).etag, 'br')
+    elif compressed and not encoding:
+        meta.etag = _etag_variant(meta.etag, 'identity')
+    headers['ETag'] = meta.etag
+    headers['Last-Modified'] = http_date(meta.modified)
+    headers['Accept-Ranges'] = 'none' if compressed and not encoding else 'bytes'
+
+    conditional_headers = finish(HttpResponse(), headers)
+    conditional = get_conditional_response(request, meta.etag, meta.modified, conditional_headers)
+    if conditional is not conditional_headers:
+        return conditional
+
+    if compressed and not encoding:
+        # Размер распакованного файла заранее неизвестен: без Content-Length и Range
+        return finish(StreamingHttpResponse(_stream_decompressed(storage, name), content_type=content_type), headers)
+
+    range_header = request.META.get('HTTP_RANGE')
+    ranges = None
+    if range_header and request.method in ('GET', 'HEAD') and _if_range_passes(request, meta):
+        ranges = parse_ranges(range_header, meta.size)
+
+    if ranges is None:
+        response = StreamingHttpResponse(_stream(storage, name, [(0, meta.size - 1)]), content_type=content_type)
+        response['Content-Length'] = meta.size
+        return finish(response, headers)
+
+    if not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{meta.size}'
+        return finish(response, headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_stream(storage, name, ranges), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{meta.size}'
+        response['Content-Length'] = end - start + 1
+        return finish(response, headers)
+
+    boundary = uuid.uuid4().hex
+    pieces = []
+    for start, end in ranges:
+        pieces.append((
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{meta.size}\r\n\r\n'
+        ).encode())
+        pieces.append((start, end))
+    pieces.append(f'\r\n--{boundary}--\r\n'.encode())
+    length = sum(len(piece) if isinstance(piece, bytes) else piece[1] - piece[0] + 1 for piece in pieces)
+
+    response = StreamingHttpResponse(
+        _stream(storage, name, pieces), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+    )
+    response['Content-Length'] = length
+    return finish(response, headers)
@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+from django.db.models import Q
+
+from .gpx import haversine_km
+
+# Равномерная сетка по широте/долготе: ячейка 0.1° (около 11 км по широте).
+# Номер ячейки - row * GRID_COLUMNS + col, поэтому ячейки одной полосы широт
+# идут подряд и выбираются индексом как один диапазон.
+GRID_CELL_DEGREES = 0.1
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+GRID_ROWS = int(round(180 / GRID_CELL_DEGREES))
+# При большем числе полос запрос по ячейкам сворачивается в один диапазон
+MAX_GRID_ROWS = 64
+KM_PER_DEGREE = 111.32
+MAX_RADIUS_KM = 1000
+
+
+def _row(lat):
+    return min(int((lat + 90) / GRID_CELL_DEGREES), GRID_ROWS - 1)
+
+
+def _column(lon):
+    return min(int((lon + 180) / GRID_CELL_DEGREES), GRID_COLUMNS - 1)
+
+
+def grid_cell(lat, lon):
+    """Номер ячейки сетки для точки или None, если координаты не заданы."""
+    if lat is None or lon is None:
+        return None
+    return _row(lat) * GRID_COLUMNS + _column(lon)
+
+
+def assign_grid_cells(objects, lat_field='latitude', lon_field='longitude', cell_field='cell'):
+    """Проставляет ячейки объектам перед bulk_create/bulk_update, где save() не вызывается."""
+    for obj in objects:
+        setattr(obj, cell_field, grid_cell(getattr(obj, lat_field), getattr(obj, lon_field)))
+    return objects
+
+
+def parse_bbox(value):
+    """Разбирает bbox вида "min_lon,min_lat,max_lon,max_lat"."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('bbox должен иметь вид min_lon,min_lat,max_lon,max_lat.')
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('Координаты bbox вне допустимого диапазона.')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_circle(lat, lon, radius_km):
+    """Разбирает параметры поиска в радиусе; radius_km ограничен MAX_RADIUS_KM."""
+    try:
+        lat, lon, radius_km = float(lat), float(lon), float(radius_km)
+    except (TypeError, ValueError):
+        raise ValueError('Параметры lat, lon и radius_km должны быть числами.')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('Координаты вне допустимого диапазона.')
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValueError(f'radius_km должен быть в пределах (0, {MAX_RADIUS_KM}].')
+    return lat, lon, radius_km
+
+
+def circle_bbox(lat, lon, radius_km):
+    """Описанный вокруг круга bbox (min_lon, min_lat, max_lon, max_lat); у полюса - вся полоса широт."""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90), min(lat + dlat, 90)
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    if cos_lat <= 0 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        return -180, min_lat, 180, max_lat
+    dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def bbox_center(bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if min_lon > max_lon:
+        max_lon += 360
+    lon = (min_lon + max_lon) / 2
+    return (min_lat + max_lat) / 2, lon - 360 if lon > 180 else lon
+
+
+def _longitude_spans(min_lon, max_lon):
+    # bbox через антимеридиан (min_lon > max_lon) делится на два
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180), (-180, max_lon)]
+
+
+def bbox_q(bbox, lat_field='latitude', lon_field='longitude', cell_field='cell'):
+    """
+    Условие выборки по bbox: грубый отбор диапазонами ячеек (по индексу
+    cell_field) и точная проверка координат внутри отобранных ячеек.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    row_min, row_max = _row(min_lat), _row(max_lat)
+    spans = _longitude_spans(min_lon, max_lon)
+
+    cells = Q()
+    if row_max - row_min >= MAX_GRID_ROWS:
+        cells = Q(**{f'{cell_field}__range': (row_min * GRID_COLUMNS, (row_max + 1) * GRID_COLUMNS - 1)})
+    else:
+        for row in range(row_min, row_max + 1):
+            for span_min, span_max in spans:
+                cells |= Q(**{f'{cell_field}__range': (
+                    row * GRID_COLUMNS + _column(span_min),
+                    row * GRID_COLUMNS + _column(span_max),
+                )})
+
+    longitudes = Q()
+    for span_min, span_max in spans:
+        longitudes |= Q(**{f'{lon_field}__range': (span_min, span_max)})
+    return cells & Q(**{f'{lat_field}__range': (min_lat, max_lat)}) & longitudes
+
+
+def sort_by_distance(objects, lat, lon, radius_km=None, lat_field='latitude', lon_field='longitude'):
+    """
+    Считает расстояние от (lat, lon) до каждого объекта одним векторным
+    haversine, отбрасывает объекты дальше radius_km и возвращает
+    список пар (объект, расстояние в км) по возрастанию расстояния.
+    """
+    objects = list(objects)
+    if not objects:
+        return []
+    lats = np.fromiter((getattr(obj, lat_field) for obj in objects), dtype=np.float64, count=len(objects))
+    lons = np.fromiter((getattr(obj, lon_field) for obj in objects), dtype=np.float64, count=len(objects))
+    distances = haversine_km(lat, lon, lats, lons)
+    order = np.argsort(distances, kind='stable')
+    if radius_km is not None:
+        order = order[distances[order] <= radius_km]
+    return [(objects[i], float(distances[i])) for i in order]
+
+
+def nearest(rows, lat, lon, radius_km, limit):
+    """
+    Ближайшие к (lat, lon) из троек (id, широта, долгота): до limit пар
+    (id, расстояние в км) в пределах radius_km, по возрастанию расстояния
+    (при равенстве - по id). Полностью сортируются только limit ближайших.
+    """
+    table = np.array(list(rows), dtype=np.float64).reshape(-1, 3)
+    distances = haversine_km(lat, lon, table[:, 1], table[:, 2])
+    inside = np.flatnonzero(distances <= radius_km)
+    if len(inside) > limit:
+        inside = inside[np.argpartition(distances[inside], limit - 1)[:limit]]
+    order = inside[np.lexsort((table[inside, 0], distances[inside]))]
+    return [(int(table[i, 0]), float(distances[i])) for i in order]
@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+from django.db.models import Q
+
+from .geo import grid_cell
+from .models import MapPoint, Route, RouteGeometry
+from .response_cache import bump_on_commit
+
+METERS_PER_DEGREE = 111320.0
+
+# (минимальный зум карты, допуск упрощения в метрах) от грубого уровня к точному.
+# Допуск примерно равен размеру пикселя веб-меркатора на этом зуме.
+GEOMETRY_LEVELS = (
+    (0, 5000.0),
+    (6, 1000.0),
+    (9, 150.0),
+    (12, 20.0),
+    (15, 2.0),
+)
+
+
+def level_for_zoom(zoom):
+    """Номер самого точного уровня, доступного на зуме zoom."""
+    level = 0
+    for index, (min_zoom, _) in enumerate(GEOMETRY_LEVELS):
+        if zoom >= min_zoom:
+            level = index
+    return level
+
+
+def douglas_peucker(x, y, tolerance):
+    """Индексы точек ломаной, оставшихся после упрощения Дугласа-Пекера."""
+    count = len(x)
+    if count < 3:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distance_sq = px * px + py * py
+        else:
+            t = np.clip((px * dx + py * dy) / length_sq, 0, 1)
+            distance_sq = (px - t * dx) ** 2 + (py - t * dy) ** 2
+        farthest = int(np.argmax(distance_sq))
+        if distance_sq[farthest] > tolerance_sq:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def encode_polyline(lat, lon, precision=5):
+    """Кодирует точки в формат Encoded Polyline (как в Google Maps / OSRM)."""
+    factor = 10 ** precision
+    coords = np.empty(len(lat) * 2, dtype=np.int64)
+    coords[0::2] = np.round(np.asarray(lat) * factor)
+    coords[1::2] = np.round(np.asarray(lon) * factor)
+    if len(coords) > 2:
+        coords[2:] = coords[2:] - coords[:-2].copy()
+    chunks = []
+    for value in coords.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def simplify_track(lat, lon):
+    """
+    Строит упрощённые версии трека для всех GEOMETRY_LEVELS.
+
+    Координаты переводятся в локальную равнопромежуточную проекцию (метры),
+    каждый следующий, более грубый уровень упрощается из предыдущего.
+    Возвращает список (уровень, мин. зум, допуск, число точек, polyline).
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if not len(lat):
+        return []
+    scale = math.cos(math.radians(float(lat.mean())))
+    x = lon * METERS_PER_DEGREE * scale
+    y = lat * METERS_PER_DEGREE
+
+    indices = np.arange(len(lat))
+    levels = []
+    for level in reversed(range(len(GEOMETRY_LEVELS))):
+        min_zoom, tolerance = GEOMETRY_LEVELS[level]
+        indices = indices[douglas_peucker(x[indices], y[indices], tolerance)]
+        polyline = encode_polyline(lat[indices], lon[indices])
+        levels.append((level, min_zoom, tolerance, len(indices), polyline))
+    levels.reverse()
+    return levels
+
+
+def store_route_geometry(route, lat, lon):
+    """Заменяет сохранённые уровни геометрии маршрута новыми."""
+    RouteGeometry.objects.filter(route=route).delete()
+    RouteGeometry.objects.bulk_create([
+        RouteGeometry(
+            route=route,
+            level=level,
+            min_zoom=min_zoom,
+            tolerance=tolerance,
+            point_count=point_count,
+            polyline=polyline,
+        )
+        for level, min_zoom, tolerance, point_count, polyline in simplify_track(lat, lon)
+    ])
+
+
+def update_route_extent_from_points(route_id):
+    """
+    Для маршрута без GPX берёт старт, финиш и bbox из его точек на карте
+    (старт и финиш - по точкам типов start/end). Маршруты с GPX не трогает:
+    их координаты посчитаны по треку при загрузке.
+    """
+    if Route.objects.filter(pk=route_id).exclude(Q(gpx_url='') | Q(gpx_url__isnull=True)).exists():
+        return
+    points = list(MapPoint.objects.filter(route_id=route_id).values_list('type', 'latitude', 'longitude'))
+    start = next(((lat, lon) for kind, lat, lon in points if kind == 'start'), (None, None))
+    end = next(((lat, lon) for kind, lat, lon in points if kind == 'end'), (None, None))
+    lats = [lat for _, lat, _ in points]
+    lons = [lon for _, _, lon in points]
+    Route.objects.filter(pk=route_id).update(
+        start_latitude=start[0],
+        start_longitude=start[1],
+        start_cell=grid_cell(*start),
+        end_latitude=end[0],
+        end_longitude=end[1],
+        min_latitude=min(lats, default=None),
+        min_longitude=min(lons, default=None),
+        max_latitude=max(lats, default=None),
+        max_longitude=max(lons, default=None),
+    )
+    # update() не шлёт post_save: карточку и списки маршрутов сбрасываем сами
+    bump_on_commit('routes', f'route:{route_id}')
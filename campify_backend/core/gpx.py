@@ -0,0 +1,288 @@
+import math
+from datetime import timezone as dt_timezone
+from xml.parsers import expat
+
+import numpy as np
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+CHUNK_SIZE = 64 * 1024
+POINT_BATCH_SIZE = 4096
+EARTH_RADIUS_KM = 6371.0088
+TRACK_POINT_TAGS = {'trkpt', 'rtept'}
+# Элементы, с которых начинается новый непрерывный отрезок трека
+SEGMENT_TAGS = {'trkseg', 'rte'}
+
+
+class GPXError(ValueError):
+    pass
+
+
+def _read_chunks(fileobj):
+    if hasattr(fileobj, 'chunks'):
+        yield from fileobj.chunks(CHUNK_SIZE)
+        return
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+class PointBatch:
+    """
+    Пачка точек трека. segment_starts - булев массив: True у точки, с которой
+    начинается новый отрезок (trkseg или rte); расстояние и набор высоты
+    от предыдущей точки до неё не считаются.
+    """
+
+    def __init__(self, lat, lon, ele, first_time=None, last_time=None, segment_starts=None):
+        self.lat = lat
+        self.lon = lon
+        self.ele = ele
+        self.first_time = first_time
+        self.last_time = last_time
+        self.segment_starts = np.zeros(len(lat), dtype=bool) if segment_starts is None else segment_starts
+
+    def __len__(self):
+        return len(self.lat)
+
+
+class _PointCollector:
+    """Обработчики expat: собирают координаты, высоту и время точек, не строя дерево документа."""
+
+    def __init__(self):
+        self.lat, self.lon, self.ele = [], [], []
+        self.segment_starts = []
+        self.first_time = self.last_time = None
+        self.seen_root = False
+        self._new_segment = True
+        self._in_point = False
+        self._point = None
+        self._text_target = None
+        self._text = []
+
+    def start(self, name, attrs):
+        name = name.rpartition(' ')[2]
+        if not self.seen_root:
+            if name != 'gpx':
+                raise GPXError('Корневой элемент документа не gpx.')
+            self.seen_root = True
+        if name in SEGMENT_TAGS:
+            self._new_segment = True
+        elif name in TRACK_POINT_TAGS:
+            try:
+                lat, lon = float(attrs['lat']), float(attrs['lon'])
+            except (KeyError, ValueError):
+                return
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                self._in_point = True
+                self._point = [lat, lon, math.nan]
+        elif self._in_point and name in ('ele', 'time'):
+            self._text_target = name
+            self._text = []
+
+    def characters(self, data):
+        if self._text_target is not None:
+            self._text.append(data)
+
+    def end(self, name):
+        name = name.rpartition(' ')[2]
+        if self._text_target == name:
+            text = ''.join(self._text).strip()
+            if name == 'ele':
+                try:
+                    self._point[2] = float(text)
+                except ValueError:
+                    pass
+            elif text:
+                if self.first_time is None:
+                    self.first_time = text
+                self.last_time = text
+            self._text_target = None
+        elif self._in_point and name in TRACK_POINT_TAGS:
+            lat, lon, ele = self._point
+            self.lat.append(lat)
+            self.lon.append(lon)
+            self.ele.append(ele)
+            self.segment_starts.append(self._new_segment)
+            self._new_segment = False
+            self._in_point = False
+
+    def flush(self):
+        batch = PointBatch(
+            np.array(self.lat, dtype=np.float64),
+            np.array(self.lon, dtype=np.float64),
+            np.array(self.ele, dtype=np.float64),
+            self.first_time,
+            self.last_time,
+            np.array(self.segment_starts, dtype=bool),
+        )
+        self.lat, self.lon, self.ele = [], [], []
+        self.segment_starts = []
+        return batch
+
+
+def iter_point_batches(fileobj, batch_size=POINT_BATCH_SIZE):
+    """
+    Потоково разбирает GPX и отдаёт точки трека пачками numpy-массивов.
+
+    Документ подаётся в expat кусками по CHUNK_SIZE, дерево не строится,
+    поэтому память ограничена размером пачки и не зависит от длины трека.
+    Точки маршрута (rtept) учитываются так же, как точки трека.
+    """
+    collector = _PointCollector()
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = collector.start
+    parser.EndElementHandler = collector.end
+    parser.CharacterDataHandler = collector.characters
+    try:
+        for chunk in _read_chunks(fileobj):
+            parser.Parse(chunk, False)
+            if len(collector.lat) >= batch_size:
+                yield collector.flush()
+        parser.Parse(b'', True)
+    except expat.ExpatError as error:
+        raise GPXError(f'Некорректный XML: {expat.ErrorString(error.code)}') from error
+    if not collector.seen_root:
+        raise GPXError('Пустой документ.')
+    if collector.lat:
+        yield collector.flush()
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Векторизованное расстояние по большому кругу в километрах."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _parse_time(value):
+    """Разбирает время точки; время без часового пояса по спецификации GPX считается UTC."""
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+class TrackMetrics:
+    """
+    Накопитель метрик трека по пачкам точек; хранит только последнюю точку
+    предыдущей пачки. Разрыв между отрезками трека не входит ни в длину,
+    ни в набор высоты.
+    """
+
+    def __init__(self):
+        self.point_count = 0
+        self.length_km = 0.0
+        self.elevation_gain = 0.0
+        self.max_height = None
+        self.min_lat = self.min_lon = self.max_lat = self.max_lon = None
+        self.start = self.end = None
+        self.first_time = self.last_time = None
+        self._last_lat = self._last_lon = self._last_ele = None
+        self._segment = self._last_ele_segment = 0
+
+    def add(self, batch):
+        if not len(batch):
+            return
+        lat, lon, ele = batch.lat, batch.lon, batch.ele
+        # Номер отрезка для каждой точки пачки
+        segment = self._segment + np.cumsum(batch.segment_starts)
+        point_segment = segment
+        if self._last_lat is None:
+            self.start = (float(lat[0]), float(lon[0]))
+            self.min_lat, self.max_lat = float(lat.min()), float(lat.max())
+            self.min_lon, self.max_lon = float(lon.min()), float(lon.max())
+            self.first_time = batch.first_time
+        else:
+            lat = np.concatenate(([self._last_lat], lat))
+            lon = np.concatenate(([self._last_lon], lon))
+            point_segment = np.concatenate(([self._segment], segment))
+            self.min_lat, self.max_lat = min(self.min_lat, float(lat.min())), max(self.max_lat, float(lat.max()))
+            self.min_lon, self.max_lon = min(self.min_lon, float(lon.min())), max(self.max_lon, float(lon.max()))
+        steps = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        self.length_km += float(steps[point_segment[1:] == point_segment[:-1]].sum())
+
+        known = ~np.isnan(ele)
+        heights, height_segment = ele[known], segment[known]
+        if len(heights):
+            top = float(heights.max())
+            self.max_height = top if self.max_height is None else max(self.max_height, top)
+            if self._last_ele is not None:
+                heights = np.concatenate(([self._last_ele], heights))
+                height_segment = np.concatenate(([self._last_ele_segment], height_segment))
+            climbs = np.diff(heights)[height_segment[1:] == height_segment[:-1]]
+            self.elevation_gain += float(climbs[climbs > 0].sum())
+            self._last_ele = float(heights[-1])
+            self._last_ele_segment = int(height_segment[-1])
+
+        self.point_count += len(batch)
+        self._segment = int(segment[-1])
+        self._last_lat, self._last_lon = float(lat[-1]), float(lon[-1])
+        self.end = (self._last_lat, self._last_lon)
+        if batch.last_time is not None:
+            self.last_time = batch.last_time
+
+    @property
+    def duration(self):
+        if not self.first_time or not self.last_time:
+            return None
+        start, end = _parse_time(self.first_time), _parse_time(self.last_time)
+        if start is None or end is None or end < start:
+            return None
+        return end - start
+
+    def apply_to(self, route):
+        route.length_in_km = round(self.length_km, 3)
+        # Без <ele> в треке высоты неизвестны: оставляем введённые вручную
+        if self.max_height is not None:
+            route.elevation_gain = round(self.elevation_gain, 1)
+            route.height = self.max_height
+        route.start_latitude, route.start_longitude = self.start
+        route.end_latitude, route.end_longitude = self.end
+        route.min_latitude, route.min_longitude = self.min_lat, self.min_lon
+        route.max_latitude, route.max_longitude = self.max_lat, self.max_lon
+        if self.duration is not None:
+            route.duration = self.duration
+
+
+class TrackPoints:
+    """Накопитель координат всех точек трека (для построения упрощённой геометрии)."""
+
+    def __init__(self):
+        self._lat, self._lon = [], []
+
+    def add(self, batch):
+        if len(batch):
+            self._lat.append(batch.lat)
+            self._lon.append(batch.lon)
+
+    @property
+    def lat(self):
+        return np.concatenate(self._lat) if self._lat else np.zeros(0)
+
+    @property
+    def lon(self):
+        return np.concatenate(self._lon) if self._lon else np.zeros(0)
+
+
+def measure_track(fileobj, *collectors):
+    """
+    Считает метрики трека за один потоковый проход по GPX-файлу.
+    Пачки точек дополнительно передаются в collectors (объекты с методом add).
+    """
+    metrics = TrackMetrics()
+    for batch in iter_point_batches(fileobj):
+        metrics.add(batch)
+        for collector in collectors:
+            collector.add(batch)
+    if not metrics.point_count:
+        raise GPXError('В файле нет точек трека.')
+    return metrics
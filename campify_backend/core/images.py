@@ -0,0 +1,177 @@
+import io
+import logging
+import os
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .media import acquire, derivative_names, discard, release
+from .workers import background
+
+logger = logging.getLogger(__name__)
+
+# Отправляется после записи поля derivatives (через update(), без post_save)
+derivatives_updated = Signal()
+
+# Размер производной - ограничение по длинной стороне в пикселях
+DERIVATIVE_SIZES = {
+    'medium': 1280,
+    'thumb': 320,
+}
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVES_DIR = 'photos/derivatives/'
+# Ошибки, которыми Pillow сообщает, что файл не удаётся прочитать как изображение.
+# OSError здесь - это и ошибки ввода-вывода, поэтому ловить их можно только вокруг декодирования
+IMAGE_ERRORS = (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError)
+
+
+class InvalidImageError(ValueError):
+    """Загруженный файл не удалось декодировать как изображение."""
+
+
+def _to_rgb(image):
+    if image.mode in ('RGB', 'L'):
+        return image.convert('RGB') if image.mode == 'L' else image
+    if 'A' in image.getbands() or image.mode == 'P':
+        image = image.convert('RGBA')
+        background_layer = Image.new('RGB', image.size, (255, 255, 255))
+        background_layer.paste(image, mask=image.getchannel('A'))
+        return background_layer
+    return image.convert('RGB')
+
+
+def render_derivatives(fileobj):
+    """
+    Декодирует изображение один раз и строит все размеры DERIVATIVE_SIZES.
+
+    Для JPEG включается draft-режим: декодер сразу уменьшает картинку в 2-8
+    раз (DCT scaling), не распаковывая полное разрешение. Ориентация из EXIF
+    применяется к пикселям. Каждый следующий размер уменьшается из
+    предыдущего, а не из оригинала. Возвращает {размер: (ширина, высота,
+    {формат: bytes})}.
+    """
+    image = Image.open(fileobj)
+    largest = max(DERIVATIVE_SIZES.values())
+    if image.format == 'JPEG':
+        image.draft('RGB', (largest, largest))
+    image = _to_rgb(ImageOps.exif_transpose(image))
+
+    rendered = {}
+    for size_name, size in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        encoded = {}
+        for format_name, (pil_format, options) in DERIVATIVE_FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            encoded[format_name] = buffer.getvalue()
+        rendered[size_name] = (image.width, image.height, encoded)
+    return rendered
+
+
+def store_derivatives(storage, source_name, rendered):
+    """Сохраняет результат render_derivatives в хранилище. Возвращает значение для поля derivatives."""
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    sizes = {}
+    saved = []
+    try:
+        for size_name, (width, height, encoded) in rendered.items():
+            sizes[size_name] = {'width': width, 'height': height}
+            for format_name, content in encoded.items():
+                name = storage.save(f'{DERIVATIVES_DIR}{stem}_{size_name}.{format_name}', ContentFile(content))
+                saved.append(name)
+                sizes[size_name][format_name] = name
+    except BaseException:
+        # Уже сохранённые копии ссылок не получат
+        discard(saved)
+        raise
+    return {'source': source_name, 'sizes': sizes}
+
+
+def generate_derivatives(model_label, pk, source_name, field_name='image'):
+    """
+    Фоновая задача: строит производные для файла source_name в поле field_name
+    объекта и записывает их в поле derivatives. Если файл уже заменён, ничего
+    не делает; ссылки на прежние производные освобождаются после записи новых.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only('id', field_name, 'derivatives').first()
+    if instance is None:
+        return
+    field_file = getattr(instance, field_name)
+    if field_file.name != source_name or instance.derivatives.get('source') == source_name:
+        return
+
+    try:
+        with field_file.open('rb') as fileobj:
+            rendered = render_derivatives(fileobj)
+    except IMAGE_ERRORS as error:
+        logger.warning('Не удалось построить производные для %s: %s', source_name, error)
+        return
+
+    derivatives = store_derivatives(field_file.storage, source_name, rendered)
+    with transaction.atomic():
+        acquire(derivative_names(derivatives))
+        updated = model.objects.filter(pk=pk, **{field_name: source_name}).update(derivatives=derivatives)
+        # Если файл заменили, пока строились производные, новые копии не нужны
+        release(derivative_names(instance.derivatives if updated else derivatives))
+        if updated:
+            derivatives_updated.send(sender=model, instance=instance)
+
+
+def schedule_derivatives(instance, field_name='image'):
+    """Ставит построение производных в фоновый пул, если файл изменился."""
+    field_file = getattr(instance, field_name)
+    if not field_file or instance.derivatives.get('source') == field_file.name:
+        return
+    background.submit_on_commit(
+        generate_derivatives, instance._meta.label, instance.pk, field_file.name, field_name
+    )
+
+
+def prepare_image_upload(uploaded_file, field):
+    """
+    Обрабатывает загруженное изображение без обращений к базе, поэтому
+    вызывается из пула потоков: декодирует его (это же и проверка, что файл -
+    изображение), строит производные и сохраняет в хранилище оригинал и
+    производные. Возвращает (имя оригинала, значение поля derivatives).
+    Ссылки на файлы не учитываются - это дело вызывающего (media.acquire).
+    Для не-изображений бросает InvalidImageError, ничего не сохраняя.
+    Ошибки хранилища пробрасываются как есть, а уже сохранённые файлы
+    отдаются на удаление (media.discard).
+    """
+    try:
+        rendered = render_derivatives(uploaded_file)
+    except IMAGE_ERRORS as error:
+        raise InvalidImageError(str(error)) from error
+    uploaded_file.seek(0)
+    name = field.storage.save(field.generate_filename(None, uploaded_file.name), uploaded_file)
+    try:
+        return name, store_derivatives(field.storage, name, rendered)
+    except BaseException:
+        discard([name])
+        raise
+
+
+def derivative_urls(field_file, derivatives, request=None):
+    """Ссылки на оригинал и производные по размерам: {'original': url, 'thumb': {'webp': url, ...}}."""
+    if not field_file:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request is not None else url
+
+    urls = {'original': absolute(field_file.url)}
+    if derivatives.get('source') != field_file.name:
+        return urls
+    for size_name, size in derivatives.get('sizes', {}).items():
+        urls[size_name] = {'width': size['width'], 'height': size['height']}
+        for format_name in DERIVATIVE_FORMATS:
+            if size.get(format_name):
+                urls[size_name][format_name] = absolute(field_file.storage.url(size[format_name]))
+    return urls
@@ -0,0 +1,85 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Route, Tag
+from core.serializers import RouteListSerializer, RouteSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+def make_routes(count, tags, seed):
+    rng = random.Random(seed)
+    routes = Route.objects.bulk_create([
+        Route(
+            name=f'Маршрут {index}',
+            description='Описание маршрута ' * rng.randint(1, 20),
+            location_area='Область',
+            length_in_km=rng.uniform(1, 50),
+            duration=timedelta(hours=rng.randint(1, 48)),
+            difficulty=rng.randint(1, 4),
+            type=rng.randint(1, 2),
+            rating_sum=rng.randint(0, 50),
+            rating_count=rng.randint(0, 10),
+        )
+        for index in range(count)
+    ], batch_size=1000)
+    through = Route.tags.through
+    through.objects.bulk_create([
+        through(route_id=route.id, tag_id=tag.id)
+        for route in routes
+        for tag in rng.sample(tags, rng.randint(0, min(5, len(tags))))
+    ], batch_size=1000)
+
+
+def measure(render, repeat):
+    best = None
+    for _ in range(repeat):
+        queries = []
+        with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+            start = time.perf_counter()
+            data = render()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(queries), data
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость выдачи списка маршрутов через RouteSerializer и RouteListSerializer. '
+            'Тестовые маршруты создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000], help='Числа маршрутов')
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов, берётся лучший')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'маршрутов':>10} {'было, с':>9} {'запросов':>9} {'стало, с':>9} {'запросов':>9} {'ускорение':>10}")
+        for count in options['counts']:
+            try:
+                with transaction.atomic():
+                    self.run(count, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, count, options):
+        tags = list(Tag.objects.all()) or Tag.objects.bulk_create([Tag(name=f'тег {i}') for i in range(30)])
+        make_routes(count, tags, options['seed'])
+        legacy, legacy_queries, legacy_data = measure(
+            lambda: RouteSerializer(Route.objects.order_by('id'), many=True).data, options['repeat']
+        )
+        fast, fast_queries, fast_data = measure(
+            lambda: RouteListSerializer(RouteListSerializer.setup_queryset(Route.objects.order_by('id')), many=True).data,
+            options['repeat'],
+        )
+        if [dict(item) for item in legacy_data] != fast_data:
+            raise CommandError('Результаты сериализаторов расходятся')
+        self.stdout.write(
+            f"{count:>10} {legacy:>9.3f} {legacy_queries:>9} {fast:>9.3f} {fast_queries:>9} {legacy / fast:>9.2f}x"
+        )
@@ -0,0 +1,94 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from core.tagging import LONG_TEXT_CHARS, text_matcher
+
+WORDS = (
+    'маршрут тропа поход привал костёр стоянка перевал вершина склон берег долина поляна '
+    'дорога посёлок деревня станция рюкзак снаряжение карта навигатор палатка спальник '
+    'вода озеро озёра река реки речка море морской водоём родник ручей водопад '
+    'лес лесной роща рощи бор сосновый ельник гора горы горный скала ущелье пещера пещеры '
+    'пешком пеший ногами сплав байдарка байдарки фото фотограф пейзаж пейзажи '
+    'йога медитация глэмпинг кемпинг машина машине автомобиль авто колесо колёса '
+    'аренда газовая горелка велосипед история исторический заброшка петроглифы '
+    'малоизвестный секретный один одному друзья дети детям ребёнок ребенка собака собакой пёс '
+    'группа гид летом лето осень осенью зима зимой весна весной экстрим природа природный культура '
+    'красивый живописный длинный короткий тяжёлый лёгкий высокий низкий крутой пологий '
+    'идти пройти подняться спуститься переправиться остановиться увидеть взять '
+    'через вдоль около после перед между над под за по в на с к от до и а но или'
+).split()
+
+
+def make_corpus(count, words_per_text, seed):
+    rng = random.Random(seed)
+    vocabulary = list(WORDS)
+    alphabet = 'абвгдежзийклмнопрстуфхцчшщьыэюя'
+    vocabulary += [
+        ''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 11)))
+        for _ in range(len(WORDS) * 10)
+    ]
+    rng.shuffle(vocabulary)
+    # Частоты слов по закону Ципфа, как в естественном тексте
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    corpus = []
+    for index in range(count):
+        corpus.append({
+            'name': f'Маршрут {index}',
+            'description': ' '.join(rng.choices(vocabulary, weights, k=words_per_text)),
+            'difficulty': rng.randint(1, 4),
+            'type': rng.randint(1, 2),
+            'duration': timedelta(hours=rng.randint(1, 300)),
+        })
+    return corpus
+
+
+def measure(func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in corpus:
+            func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает два способа поиска признаков автотеггера на корпусе длинных описаний: '
+        'по словам с кэшем и поиском подстрок по всему тексту. По результатам выбирается LONG_TEXT_CHARS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Число описаний каждого размера')
+        parser.add_argument('--words', type=int, nargs='+', default=[100, 500, 2000, 5000, 20000],
+                            help='Длины описаний в словах')
+        parser.add_argument('--repeat', type=int, default=3, help='Число повторов, берётся лучший')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'слов':>7} {'символов':>9} {'по словам, мкс':>15} {'без кэша, мкс':>14} "
+            f"{'подстроки, мкс':>15}  способ для этой длины"
+        )
+        for words in options['words']:
+            texts = [
+                f"{data['description']} {data['name']}".lower()
+                for data in make_corpus(options['count'], words, options['seed'])
+            ]
+            # Первый проход по корпусу с пустым кэшем слов
+            text_matcher.clear_cache()
+            cold = measure(text_matcher.match_words, texts, 1)
+            for index, text in enumerate(texts):
+                if text_matcher.match_words(text) != text_matcher.match_substrings(text):
+                    raise CommandError(f"Способы поиска расходятся на описании {index}")
+            chars = sum(map(len, texts)) // len(texts)
+            by_words = measure(text_matcher.match_words, texts, options['repeat'])
+            substrings = measure(text_matcher.match_substrings, texts, options['repeat'])
+            chosen = 'подстроки' if chars > LONG_TEXT_CHARS else 'по словам'
+            self.stdout.write(
+                f"{words:>7} {chars:>9} {by_words * 1e6:>15.1f} {cold * 1e6:>14.1f} "
+                f"{substrings * 1e6:>15.1f}  {chosen}"
+            )
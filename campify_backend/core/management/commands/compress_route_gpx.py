@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.compression import GZIP_SUFFIX, compress_file, save_brotli_variant
+from core.models import Route
+
+
+class Command(BaseCommand):
+    help = 'Пережимает в gzip (и br, если есть brotli) GPX-файлы, загруженные несжатыми.'
+
+    def handle(self, *args, **kwargs):
+        compressed = 0
+        routes = Route.objects.exclude(gpx_url='').exclude(gpx_url__isnull=True).exclude(gpx_url__endswith=GZIP_SUFFIX)
+        for route in routes.only('id', 'gpx_url'):
+            try:
+                with route.gpx_url.open('rb') as raw:
+                    gzip_file, brotli_file = compress_file(raw, route.gpx_url.name)
+            except OSError as error:
+                self.stderr.write(f"Маршрут {route.id}: {error}")
+                continue
+            route.gpx_url = gzip_file
+            with transaction.atomic():
+                route.save(update_fields=['gpx_url'])
+            save_brotli_variant(route.gpx_url, brotli_file)
+            compressed += 1
+        self.stdout.write(self.style.SUCCESS(f"Сжато GPX-файлов: {compressed}."))
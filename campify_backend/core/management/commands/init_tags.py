@@ -1,6 +1,7 @@
 
 from django.core.management.base import BaseCommand
 from core.models import Tag
+from core.tag_registry import tag_registry
 
 TAGS = [
     'новичок', 'кемпинг', 'опытный', 'профи',
@@ -17,9 +18,6 @@ TAGS = [
 
 class Command(BaseCommand):
     def handle(self, *args, **kwargs):
-        created_count = 0
-        for name in TAGS:
-            tag, created = Tag.objects.get_or_create(name=name)
-            if created:
-                created_count += 1
+        existing_count = Tag.objects.filter(name__in=TAGS).count()
+        created_count = len(tag_registry.resolve(TAGS)) - existing_count
         self.stdout.write(self.style.SUCCESS(f"Добавлено {created_count} новых тегов."))
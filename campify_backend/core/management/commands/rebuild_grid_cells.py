@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.geo import assign_grid_cells
+from core.models import MapPoint, Route
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает ячейки пространственной сетки у локаций и стартов маршрутов (после загрузки данных в обход save()).'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        points = assign_grid_cells(list(MapPoint.objects.only('id', 'latitude', 'longitude')))
+        MapPoint.objects.bulk_update(points, ['cell'], batch_size=BATCH_SIZE)
+        routes = assign_grid_cells(
+            list(Route.objects.only('id', 'start_latitude', 'start_longitude')),
+            'start_latitude', 'start_longitude', 'start_cell',
+        )
+        Route.objects.bulk_update(routes, ['start_cell'], batch_size=BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS(
+            f"Ячейки пересчитаны для {len(points)} локаций и {len(routes)} маршрутов."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.images import generate_derivatives
+from core.models import MapPoint, RoutePhoto
+
+
+class Command(BaseCommand):
+    help = 'Строит недостающие уменьшенные копии фото маршрутов и локаций (синхронно).'
+
+    def handle(self, *args, **kwargs):
+        built = 0
+        for model in (RoutePhoto, MapPoint):
+            for pk, name, derivatives in model.objects.exclude(image='').exclude(image__isnull=True).values_list('pk', 'image', 'derivatives'):
+                if derivatives.get('source') != name:
+                    generate_derivatives(model._meta.label, pk, name)
+                    built += 1
+        self.stdout.write(self.style.SUCCESS(f"Обработано изображений: {built}."))
@@ -0,0 +1,35 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.media import rebuild_media_refcounts
+from core.models import MediaBlob
+from core.storage import BLOB_DIR, COMPANION_SUFFIXES
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики ссылок на файлы хранилища по таблицам моделей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Удалить блобы, на которые нет ни одной ссылки')
+
+    def handle(self, *args, **options):
+        count = rebuild_media_refcounts()
+        self.stdout.write(self.style.SUCCESS(f"Счётчики пересчитаны, файлов со ссылками: {count}."))
+        if not options['delete_orphans']:
+            return
+
+        referenced = set(MediaBlob.objects.values_list('name', flat=True))
+        root = default_storage.path(BLOB_DIR)
+        deleted = 0
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(directory, file_name), default_storage.location).replace(os.sep, '/')
+                if name not in referenced and not any(
+                    name.endswith(suffix) and name[:-len(suffix)] in referenced for suffix in COMPANION_SUFFIXES
+                ):
+                    # Только что сохранённые блобы ещё могут получить ссылку
+                    deleted += default_storage.purge_unused(name)
+        self.stdout.write(self.style.SUCCESS(f"Удалено блобов без ссылок: {deleted}."))
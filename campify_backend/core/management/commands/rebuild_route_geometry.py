@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.compression import open_decompressed
+from core.geometry import store_route_geometry
+from core.gpx import GPXError, TrackPoints, measure_track
+from core.models import Route
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает упрощённую геометрию треков по уже загруженным GPX-файлам.'
+
+    def handle(self, *args, **kwargs):
+        built = failed = 0
+        for route in Route.objects.exclude(gpx_url='').exclude(gpx_url__isnull=True).only('id', 'gpx_url'):
+            points = TrackPoints()
+            try:
+                with open_decompressed(route.gpx_url.storage, route.gpx_url.name) as gpx_file:
+                    measure_track(gpx_file, points)
+            except (GPXError, OSError) as error:
+                failed += 1
+                self.stderr.write(f"Маршрут {route.id}: {error}")
+                continue
+            with transaction.atomic():
+                store_route_geometry(route, points.lat, points.lon)
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"Геометрия пересчитана для {built} маршрутов, ошибок: {failed}."))
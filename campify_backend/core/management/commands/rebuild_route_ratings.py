@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.ratings import rebuild_route_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённые агрегаты оценок маршрутов по таблице отзывов.'
+
+    def handle(self, *args, **kwargs):
+        rated_count = rebuild_route_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Агрегаты пересчитаны, маршрутов с отзывами: {rated_count}."))
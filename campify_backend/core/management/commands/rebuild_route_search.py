@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.search import create_search_index, is_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт триггеры полнотекстового поиска маршрутов (если их нет) и перестраивает FTS5-индекс.'
+
+    def handle(self, *args, **kwargs):
+        if not is_supported():
+            raise CommandError('Полнотекстовый индекс поддерживается только для SQLite.')
+        create_search_index()
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Поисковый индекс перестроен, маршрутов: {indexed}."))
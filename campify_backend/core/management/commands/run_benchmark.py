@@ -0,0 +1,89 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.benchmark import (
+    HttpTransport, InProcessTransport, compare_reports, load_report, run_benchmark, scenario_names,
+)
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон основных GET-эндпоинтов core/urls.py: p50/p95/p99, пропускная способность '
+            'и число SQL-запросов. Отчёт в JSON можно сравнить с прошлым прогоном через --compare.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=10, help='Запросов прогрева, в замер не идут')
+        parser.add_argument('--concurrency', type=int, default=1, help='Число параллельных потоков')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--only', nargs='+', choices=scenario_names(), help='Прогнать только эти сценарии')
+        parser.add_argument('--url', help='Адрес запущенного сервера, например http://127.0.0.1:8000; '
+                                          'без него запросы идут в этом процессе')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Не отключать кэш ответов (в этом процессе он по умолчанию отключён)')
+        parser.add_argument('--output', help='Куда записать отчёт JSON (по умолчанию - в stdout)')
+        parser.add_argument('--compare', help='Отчёт прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests и --concurrency должны быть положительными.')
+        baseline = load_report(options['compare']) if options['compare'] else None
+
+        if options['url']:
+            transport = HttpTransport(options['url'])
+            overrides = {}
+        else:
+            transport = InProcessTransport()
+            # Тестовый клиент ходит с хостом testserver
+            overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+            if not options['with_cache']:
+                overrides['CACHES'] = NO_CACHE
+        with override_settings(**overrides):
+            report = run_benchmark(
+                transport,
+                names=options['only'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                warmup=options['warmup'],
+                seed=options['seed'],
+                on_result=self.print_result,
+            )
+        report['meta']['response_cache'] = bool(options['url'] or options['with_cache'])
+
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(text + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Отчёт записан в {options['output']}."))
+        elif baseline is None:
+            self.stdout.write(text)
+        if baseline is not None:
+            self.print_comparison(baseline, report)
+
+    def print_result(self, name, result):
+        if 'skipped' in result:
+            line = f"{name:<24} пропущен: {result['skipped']}"
+        else:
+            queries = '-' if result['queries_mean'] is None else f"{result['queries_mean']:g}"
+            line = (f"{name:<24} p50 {result['p50_ms']:>8.2f} мс  p95 {result['p95_ms']:>8.2f} мс  "
+                    f"p99 {result['p99_ms']:>8.2f} мс  {result['throughput_rps']:>8.1f} rps  "
+                    f"запросов {queries:>5}  ошибок {result['errors']}")
+        # Прогресс - в stderr, чтобы stdout оставался чистым JSON
+        self.stderr.write(line, style_func=lambda text: text)
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(f"Сравнение с {baseline['meta'].get('commit') or 'прошлым прогоном'} "
+                          f"({baseline['meta'].get('created_at')}):")
+        for key in ('transport', 'concurrency', 'response_cache', 'data'):
+            if baseline['meta'].get(key) != report['meta'].get(key):
+                self.stdout.write(self.style.WARNING(f"Прогоны отличаются параметром {key}, сравнение неточное."))
+        for name, metric, old, new, change in compare_reports(baseline, report):
+            change_text = '' if change is None else f"{change:+.1f}%"
+            line = f"{name:<24} {metric:<15} {old:>10g} -> {new:>10g} {change_text:>8}"
+            # Латентность и запросы растут - хуже, пропускная способность растёт - лучше
+            worse = change is not None and abs(change) >= 10 and (change > 0) != (metric == 'throughput_rps')
+            self.stdout.write(self.style.WARNING(line) if worse else line)
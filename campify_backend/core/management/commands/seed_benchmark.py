@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.seeding import DEFAULT_PREFIX, delete_benchmark_data, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими пользователями, маршрутами, тегами, отзывами, фото, точками, '
+            'избранным и предпочтениями для нагрузочных замеров (см. run_benchmark).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--routes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=30)
+        parser.add_argument('--reviews-per-route', type=int, default=3, help='Среднее число отзывов на маршрут')
+        parser.add_argument('--photos-per-route', type=int, default=2, help='Среднее число фото на маршрут')
+        parser.add_argument('--points-per-route', type=int, default=3, help='Среднее число точек на маршрут')
+        parser.add_argument('--favorites-per-user', type=int, default=5, help='Среднее число избранных маршрутов')
+        parser.add_argument('--preferences-per-user', type=int, default=5, help='Среднее число тегов в предпочтениях')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default=DEFAULT_PREFIX,
+                            help='Префикс имён пользователей и тегов, по нему данные потом удаляются')
+        parser.add_argument('--flush', action='store_true',
+                            help='Сначала удалить данные, созданные раньше с этим префиксом')
+        parser.add_argument('--flush-only', action='store_true', help='Только удалить данные и выйти')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['flush'] or options['flush_only']:
+            start = time.perf_counter()
+            deleted = delete_benchmark_data(prefix)
+            self.stdout.write(self.style.SUCCESS(
+                f"Удалено объектов: {sum(deleted.values())} за {time.perf_counter() - start:.1f} с."
+            ))
+            if options['flush_only']:
+                return
+
+        start = time.perf_counter()
+        try:
+            created = seed_benchmark_data(
+                users=options['users'],
+                routes=options['routes'],
+                tags=options['tags'],
+                reviews_per_route=options['reviews_per_route'],
+                photos_per_route=options['photos_per_route'],
+                points_per_route=options['points_per_route'],
+                favorites_per_user=options['favorites_per_user'],
+                preferences_per_user=options['preferences_per_user'],
+                seed=options['seed'],
+                prefix=prefix,
+            )
+        except ValueError as error:
+            raise CommandError(f"{error} Запустите команду с --flush.")
+        elapsed = time.perf_counter() - start
+        for label, count in created.items():
+            self.stdout.write(f"{label:>16}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано объектов: {sum(created.values())} за {elapsed:.1f} с."
+        ))
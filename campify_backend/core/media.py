@@ -0,0 +1,167 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from .models import Checklist, MapPoint, MediaBlob, Route, RoutePhoto
+from .workers import background
+
+# Поля моделей, ссылающиеся на файлы хранилища; на каждый файл ведётся счётчик ссылок
+MEDIA_FIELDS = {
+    Route: 'gpx_url',
+    RoutePhoto: 'image',
+    MapPoint: 'image',
+    Checklist: 'pdf_url',
+}
+# Модели, у которых есть уменьшенные копии изображений (core/images.py)
+DERIVATIVE_MODELS = (RoutePhoto, MapPoint)
+
+UNCHANGED = object()
+
+
+def _grouped_by_count(names):
+    groups = defaultdict(list)
+    for name, count in Counter(name for name in names if name).items():
+        groups[count].append(name)
+    return groups
+
+
+def acquire(names):
+    """Увеличивает счётчики ссылок на файлы; повторы в names считаются отдельно."""
+    groups = _grouped_by_count(names)
+    if not groups:
+        return
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name) for group in groups.values() for name in group],
+        ignore_conflicts=True,
+    )
+    for count, group in groups.items():
+        MediaBlob.objects.filter(name__in=group).update(refcount=F('refcount') + count)
+
+
+def release(names):
+    """
+    Уменьшает счётчики ссылок. Файлы, на которые ссылок не осталось, удаляются
+    в фоне после фиксации транзакции. Файлы без счётчика (загруженные до
+    появления счётчиков) считаются используемыми только освобождающим объектом.
+    """
+    groups = _grouped_by_count(names)
+    if not groups:
+        return
+    for count, group in groups.items():
+        MediaBlob.objects.filter(name__in=group).update(refcount=F('refcount') - count)
+    names = [name for group in groups.values() for name in group]
+    remaining = dict(MediaBlob.objects.filter(name__in=names).values_list('name', 'refcount'))
+    unreferenced = [name for name in names if remaining.get(name, 0) <= 0]
+    if unreferenced:
+        background.submit_on_commit(purge_unreferenced, unreferenced)
+
+
+def discard(names):
+    """
+    Файлы, которые сохранили, но ссылку на них так и не взяли (запрос
+    упал): удаляются после фиксации транзакции, если ссылок на них нет.
+    """
+    names = [name for name in names if name]
+    if names:
+        background.submit_on_commit(purge_unreferenced, names)
+
+
+def is_referenced(name):
+    return MediaBlob.objects.filter(name=name, refcount__gt=0).exists()
+
+
+def _purge(name):
+    purge_unused = getattr(default_storage, 'purge_unused', None)
+    if purge_unused is None:
+        default_storage.delete(name)
+        return True
+    return purge_unused(name)
+
+
+def purge_unreferenced(names):
+    """
+    Удаляет файлы, на которые так и не появилось новых ссылок. Только что
+    сохранённые файлы хранилище оставляет (см. ContentAddressedStorage):
+    для них проверка повторяется, когда истечёт MEDIA_PURGE_GRACE_PERIOD.
+    """
+    kept = []
+    for name in names:
+        with transaction.atomic():
+            if MediaBlob.objects.filter(name=name, refcount__gt=0).exists():
+                continue
+            if _purge(name):
+                MediaBlob.objects.filter(name=name).delete()
+            else:
+                kept.append(name)
+    if kept:
+        background.submit_later(getattr(settings, 'MEDIA_PURGE_GRACE_PERIOD', 0), purge_unreferenced, kept)
+
+
+def derivative_names(derivatives):
+    return [
+        name
+        for size in derivatives.get('sizes', {}).values()
+        for key, name in size.items()
+        if key not in ('width', 'height') and name
+    ]
+
+
+def name_before_save(instance, update_fields=None):
+    """Имя файла в базе до сохранения объекта (для pre_save)."""
+    field_name = MEDIA_FIELDS[type(instance)]
+    if update_fields is not None and field_name not in update_fields:
+        return UNCHANGED
+    if instance._state.adding:
+        return ''
+    return type(instance).objects.filter(pk=instance.pk).values_list(field_name, flat=True).first() or ''
+
+
+def swap_reference(instance, old_name):
+    """Переносит ссылку со старого файла на новый после сохранения объекта."""
+    if old_name is UNCHANGED:
+        return
+    new_name = getattr(instance, MEDIA_FIELDS[type(instance)]).name or ''
+    if new_name != old_name:
+        acquire([new_name])
+        release([old_name])
+
+
+def instance_names(instance):
+    names = [getattr(instance, MEDIA_FIELDS[type(instance)]).name]
+    if isinstance(instance, DERIVATIVE_MODELS):
+        names.extend(derivative_names(instance.derivatives))
+    return names
+
+
+def queryset_names(querysets):
+    """Имена файлов всех объектов querysets вместе с производными, по запросу на queryset."""
+    names = []
+    for queryset in querysets:
+        field_name = MEDIA_FIELDS[queryset.model]
+        if queryset.model not in DERIVATIVE_MODELS:
+            names.extend(queryset.values_list(field_name, flat=True))
+            continue
+        for name, derivatives in queryset.values_list(field_name, 'derivatives'):
+            names.append(name)
+            names.extend(derivative_names(derivatives))
+    return names
+
+
+@transaction.atomic
+def rebuild_media_refcounts():
+    """Пересчитывает все счётчики ссылок по содержимому таблиц. Возвращает число файлов."""
+    counts = Counter()
+    for model, field_name in MEDIA_FIELDS.items():
+        counts.update(name for name in model.objects.values_list(field_name, flat=True) if name)
+    for model in DERIVATIVE_MODELS:
+        for derivatives in model.objects.exclude(derivatives={}).values_list('derivatives', flat=True):
+            counts.update(derivative_names(derivatives))
+    MediaBlob.objects.all().delete()
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, refcount=count) for name, count in counts.items()],
+        batch_size=1000,
+    )
+    return len(counts)
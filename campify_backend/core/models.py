@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from .managers import UserManager
+from .geo import grid_cell
 
 
 # Create your models here.
@@ -85,15 +86,76 @@ class Route(models.Model):
     views = models.IntegerField(null=True, default=0)
     gpx_url = models.FileField(upload_to='gpx_files/')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Агрегаты отзывов, поддерживаются при записи отзывов (см. core/ratings.py)
+    rating_sum = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Метрики трека, считаются при загрузке GPX (см. core/gpx.py)
+    elevation_gain = models.FloatField(null=True, blank=True)
+    start_latitude = models.FloatField(null=True, blank=True)
+    start_longitude = models.FloatField(null=True, blank=True)
+    end_latitude = models.FloatField(null=True, blank=True)
+    end_longitude = models.FloatField(null=True, blank=True)
+    min_latitude = models.FloatField(null=True, blank=True)
+    min_longitude = models.FloatField(null=True, blank=True)
+    max_latitude = models.FloatField(null=True, blank=True)
+    max_longitude = models.FloatField(null=True, blank=True)
+    # Ячейка сетки стартовой точки (core.geo), пересчитывается в save()
+    start_cell = models.PositiveIntegerField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Ключ курсорной пагинации списков маршрутов
+            models.Index(fields=['created_at', 'id']),
+            # Поиск публичных маршрутов рядом с точкой: диапазоны ячеек, is_public
+            # проверяется по индексу (в SQLite булево условие не даёт равенства для префикса)
+            models.Index(fields=['start_cell', 'is_public']),
+            # Фильтр и фасеты маршрутов (core/route_filters.py): отбор по типу и
+            # сложности и лента публичных маршрутов в порядке курсорной пагинации
+            models.Index(fields=['is_public', 'type', 'difficulty']),
+            models.Index(fields=['is_public', 'created_at', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.start_cell = grid_cell(self.start_latitude, self.start_longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start_latitude', 'start_longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'start_cell'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+class RouteGeometry(models.Model):
+    """Упрощённая линия трека для одного уровня детализации карты."""
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='geometry_levels')
+    level = models.PositiveSmallIntegerField()
+    min_zoom = models.PositiveSmallIntegerField()
+    tolerance = models.FloatField()  # допуск упрощения в метрах
+    point_count = models.PositiveIntegerField()
+    polyline = models.TextField()  # Encoded Polyline, точность 1e-5
+
+    class Meta:
+        unique_together = ('route', 'level')
+
 class RoutePhoto(models.Model):
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='photos')
     image = models.ImageField(upload_to='photos/route_photos/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     is_checked = models.BooleanField(default=False)
+    # Уменьшенные копии изображения, строятся в фоне (см. core/images.py)
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Ключ курсорной пагинации списков фото (с фильтром по модерации)
+            models.Index(fields=['is_checked', 'uploaded_at', 'id']),
+        ]
 
 class RouteReview(models.Model):
     id = models.AutoField(primary_key=True)
@@ -133,6 +195,17 @@ class MapPoint(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     image =  models.ImageField(upload_to='photos/point_photos/', null=True)
+    # Уменьшенные копии изображения, строятся в фоне (см. core/images.py)
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Ячейка пространственной сетки (core.geo), пересчитывается в save()
+    cell = models.PositiveIntegerField(null=True, editable=False, db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.cell = grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'cell'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -181,3 +254,12 @@ class ChecklistItems(models.Model):
     item_id = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='checklist_items')
     quantity = models.PositiveIntegerField()
     is_packed = models.BooleanField(default=False)
+
+
+class MediaBlob(models.Model):
+    """Счётчик ссылок на файл хранилища (см. core/media.py)."""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
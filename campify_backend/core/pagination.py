@@ -0,0 +1,161 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная пагинация по паре (cursor_field, id), от новых к старым.
+
+    Курсор - непрозрачная base64-строка с последней выданной парой ключей,
+    поэтому следующая страница выбирается условием WHERE по индексу,
+    без OFFSET и без COUNT(*).
+    """
+    cursor_field = 'created_at'
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            order = (self.cursor_field, 'id')
+        else:
+            order = ('-' + self.cursor_field, '-id')
+        queryset = queryset.order_by(*order)
+        if position is not None:
+            queryset = queryset.filter(self.build_filter(position, reverse))
+
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.first = self.get_position(results[0]) if results else None
+        self.last = self.get_position(results[-1]) if results else None
+        if not results and position is not None:
+            # Пустая страница: ссылки строим от самого курсора
+            self.first = self.last = position
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def build_filter(self, position, reverse):
+        value, pk = position
+        op = 'gt' if reverse else 'lt'
+        return (
+            Q(**{f'{self.cursor_field}__{op}': value})
+            | Q(**{self.cursor_field: value, f'id__{op}': pk})
+        )
+
+    def get_position(self, instance):
+        return getattr(instance, self.cursor_field), instance.pk
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        value, pk = position
+        payload = {'v': value.isoformat(), 'id': pk}
+        if reverse:
+            payload['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            value = parse_datetime(payload['v'])
+            pk = int(payload['id'])
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(value, datetime):
+            raise NotFound(self.invalid_cursor_message)
+        return (value, pk), reverse
+
+    def get_schema_fields(self, view):
+        return []
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы из полей next/previous.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Размер страницы (не больше {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class RouteCursorPagination(KeysetPagination):
+    cursor_field = 'created_at'
+
+
+class RoutePhotoCursorPagination(KeysetPagination):
+    cursor_field = 'uploaded_at'
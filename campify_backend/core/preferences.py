@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import UserTagPreference
+from .tag_registry import tag_registry
+
+VIEW_STEP = 0.1  # Шаг наращивания веса при просмотре маршрута
+VIEW_DECAY_RATE = 0.05  # Затухание весов тегов, не участвовавших в просмотре
+INITIAL_WEIGHT = 0.5  # Вес тегов, выбранных во входном тестировании
+
+
+def _upsert_weights(user_id, weights):
+    UserTagPreference.objects.bulk_create(
+        [UserTagPreference(user_id=user_id, tag_id=tag_id, weight=weight) for tag_id, weight in weights.items()],
+        update_conflicts=True,
+        unique_fields=['user', 'tag'],
+        update_fields=['weight'],
+    )
+
+
+@transaction.atomic
+def apply_route_view(user_id, tag_ids):
+    """
+    Обновляет предпочтения пользователя после просмотра маршрута с тегами tag_ids:
+    веса остальных тегов затухают, веса тегов маршрута растут к 1.
+    Выполняет не больше трёх запросов независимо от числа тегов.
+    """
+    tag_ids = set(tag_ids)
+    UserTagPreference.objects.filter(user_id=user_id).exclude(tag_id__in=tag_ids).update(
+        weight=F('weight') * (1 - VIEW_DECAY_RATE)
+    )
+    if not tag_ids:
+        return
+
+    current = dict(
+        UserTagPreference.objects
+        .filter(user_id=user_id, tag_id__in=tag_ids)
+        .values_list('tag_id', 'weight')
+    )
+    weights = {}
+    for tag_id in tag_ids:
+        weight = current.get(tag_id, 0)
+        weight += VIEW_STEP * (1 - weight)
+        weights[tag_id] = round(min(weight, 1.0), 4)
+    _upsert_weights(user_id, weights)
+
+
+@transaction.atomic
+def set_initial_preferences(user_id, tag_names, weight=INITIAL_WEIGHT):
+    """Выставляет фиксированный вес тегам из входного тестирования, создавая недостающие теги."""
+    tag_ids = tag_registry.resolve(tag_names).values()
+    if not tag_ids:
+        return
+    _upsert_weights(user_id, {tag_id: weight for tag_id in tag_ids})
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import Route, RouteReview
+
+
+def apply_rating_delta(route_id, rating_delta, count_delta):
+    """Атомарно сдвигает сохранённые агрегаты оценок маршрута."""
+    Route.objects.filter(id=route_id).update(
+        rating_sum=F('rating_sum') + rating_delta,
+        rating_count=F('rating_count') + count_delta,
+    )
+
+
+def review_created(review):
+    apply_rating_delta(review.route_id, review.rating, 1)
+
+
+def review_updated(old_route_id, old_rating, review):
+    if old_route_id == review.route_id:
+        if old_rating != review.rating:
+            apply_rating_delta(review.route_id, review.rating - old_rating, 0)
+        return
+    apply_rating_delta(old_route_id, -old_rating, -1)
+    apply_rating_delta(review.route_id, review.rating, 1)
+
+
+def review_deleted(route_id, rating):
+    apply_rating_delta(route_id, -rating, -1)
+
+
+@transaction.atomic
+def rebuild_route_ratings():
+    """Пересчитывает агрегаты всех маршрутов с нуля. Возвращает число маршрутов с отзывами."""
+    Route.objects.update(rating_sum=0, rating_count=0)
+    totals = (
+        RouteReview.objects
+        .values('route_id')
+        .annotate(total=Sum('rating'), count=Count('id'))
+        .order_by()
+    )
+    routes = [
+        Route(id=row['route_id'], rating_sum=row['total'], rating_count=row['count'])
+        for row in totals
+    ]
+    Route.objects.bulk_update(routes, ['rating_sum', 'rating_count'], batch_size=500)
+    return len(routes)
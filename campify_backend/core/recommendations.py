@@ -0,0 +1,276 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .models import Route
+
+DEFAULT_LIMIT = 50
+
+
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array), 64), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class RouteTagMatrix:
+    """
+    Разреженная матрица маршрут x тег в памяти процесса.
+
+    Связи хранятся в COO-виде (массивы строк и столбцов), поэтому скоринг всех
+    маршрутов по вектору предпочтений пользователя - одна свёртка np.bincount.
+    Изменённый маршрут получает новую строку, а старая помечается неактивной;
+    когда неактивных строк становится больше половины, матрица уплотняется.
+    Изменения из других процессов подхватываются полной перезагрузкой раз в
+    RECOMMENDATIONS_MATRIX_MAX_AGE секунд.
+
+    Полная загрузка строит новую матрицу без блокировки и подменяет ею
+    текущую одним присваиванием полей под _lock, так что запросы не ждут
+    чтения базы. Маршруты, изменённые во время построения, перечитываются
+    сразу после подмены.
+    """
+
+    # Поля, которые load() подменяет целиком
+    _STATE = (
+        '_row_of', '_col_of', '_n_rows', '_nnz', '_dead_rows', '_route_ids', '_views', '_public', '_active',
+        '_entry_rows', '_entry_cols',
+    )
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Не даёт нескольким потокам строить матрицу одновременно
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._generation = 0
+        self._building = False
+        self._touched = set()
+        self._reset()
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'RECOMMENDATIONS_MATRIX_MAX_AGE', 300)
+
+    def _reset(self):
+        self._row_of = {}
+        self._col_of = {}
+        self._n_rows = 0
+        self._nnz = 0
+        self._dead_rows = 0
+        self._route_ids = np.zeros(0, dtype=np.int64)
+        self._views = np.zeros(0, dtype=np.int64)
+        self._public = np.zeros(0, dtype=bool)
+        self._active = np.zeros(0, dtype=bool)
+        self._entry_rows = np.zeros(0, dtype=np.int32)
+        self._entry_cols = np.zeros(0, dtype=np.int32)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._generation += 1
+
+    def _touch(self, route_ids):
+        # Вызывается под _lock: запоминает маршруты, изменённые во время построения
+        if self._building:
+            self._touched.update(route_ids)
+
+    @classmethod
+    def _build(cls):
+        routes = list(Route.objects.values_list('id', 'views', 'is_public'))
+        links = list(Route.tags.through.objects.values_list('route_id', 'tag_id'))
+        matrix = cls()
+        for route_id, views, is_public in routes:
+            matrix._append_row(route_id, views, is_public)
+        if links:
+            pairs = np.array(links, dtype=np.int64)
+            known = np.fromiter((route_id in matrix._row_of for route_id in pairs[:, 0]), dtype=bool, count=len(pairs))
+            pairs = pairs[known]
+            rows = np.fromiter((matrix._row_of[route_id] for route_id in pairs[:, 0]), dtype=np.int32, count=len(pairs))
+            cols = np.fromiter((matrix._column(tag_id) for tag_id in pairs[:, 1]), dtype=np.int32, count=len(pairs))
+            matrix._append_entries(rows, cols)
+        return matrix
+
+    def load(self):
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        # Вызывается под _load_lock
+        with self._lock:
+            generation = self._generation
+            self._building = True
+            self._touched = set()
+        try:
+            matrix = self._build()
+        finally:
+            with self._lock:
+                self._building = False
+        with self._lock:
+            for name in self._STATE:
+                setattr(self, name, getattr(matrix, name))
+            # Инвалидация во время построения: снимок базы мог её не застать
+            self._loaded_at = time.monotonic() if generation == self._generation else None
+            touched, self._touched = self._touched, set()
+        if touched:
+            self.refresh_routes(touched)
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.max_age
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        # Устаревшую матрицу перестраивает один поток, остальные пока отвечают
+        # по ней; если матрицы нет или она инвалидирована - ждут построения
+        if not self._load_lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if not self._is_fresh():
+                self._load()
+        finally:
+            self._load_lock.release()
+
+    def _column(self, tag_id):
+        col = self._col_of.get(tag_id)
+        if col is None:
+            col = self._col_of[tag_id] = len(self._col_of)
+        return col
+
+    def _append_row(self, route_id, views, is_public):
+        row = self._n_rows
+        self._n_rows += 1
+        for name in ('_route_ids', '_views', '_public', '_active'):
+            setattr(self, name, _grow(getattr(self, name), self._n_rows))
+        self._route_ids[row] = route_id
+        self._views[row] = views or 0
+        self._public[row] = is_public
+        self._active[row] = True
+        self._row_of[route_id] = row
+        return row
+
+    def _append_entries(self, rows, cols):
+        end = self._nnz + len(rows)
+        self._entry_rows = _grow(self._entry_rows, end)
+        self._entry_cols = _grow(self._entry_cols, end)
+        self._entry_rows[self._nnz:end] = rows
+        self._entry_cols[self._nnz:end] = cols
+        self._nnz = end
+
+    def _deactivate(self, route_id):
+        row = self._row_of.pop(route_id, None)
+        if row is not None:
+            self._active[row] = False
+            self._dead_rows += 1
+        return row
+
+    def _compact(self):
+        if self._dead_rows * 2 <= self._n_rows:
+            return
+        active_rows = np.flatnonzero(self._active[:self._n_rows])
+        new_index = np.full(self._n_rows, -1, dtype=np.int64)
+        new_index[active_rows] = np.arange(len(active_rows))
+        rows = self._entry_rows[:self._nnz]
+        keep = new_index[rows] >= 0
+        self._entry_rows = new_index[rows[keep]].astype(np.int32)
+        self._entry_cols = self._entry_cols[:self._nnz][keep]
+        self._nnz = len(self._entry_rows)
+        self._route_ids = self._route_ids[active_rows]
+        self._views = self._views[active_rows]
+        self._public = self._public[active_rows]
+        self._active = np.ones(len(active_rows), dtype=bool)
+        self._n_rows = len(active_rows)
+        self._dead_rows = 0
+        self._row_of = {int(route_id): row for row, route_id in enumerate(self._route_ids)}
+
+    def update_route(self, route_id, views, is_public):
+        """Обновляет счётчик просмотров и видимость маршрута без перестройки связей."""
+        with self._lock:
+            self._touch([route_id])
+            if self._loaded_at is None:
+                return
+            row = self._row_of.get(route_id)
+            if row is None:
+                self._append_row(route_id, views, is_public)
+            else:
+                self._views[row] = views or 0
+                self._public[row] = is_public
+
+    def add_views(self, counts):
+        with self._lock:
+            self._touch(counts)
+            if self._loaded_at is None:
+                return
+            for route_id, count in counts.items():
+                row = self._row_of.get(route_id)
+                if row is not None:
+                    self._views[row] += count
+
+    def refresh_routes(self, route_ids):
+        """Перечитывает из базы маршруты вместе с тегами и заменяет их строки."""
+        route_ids = set(route_ids)
+        with self._lock:
+            self._touch(route_ids)
+            if self._loaded_at is None:
+                return
+        routes = list(Route.objects.filter(id__in=route_ids).values_list('id', 'views', 'is_public'))
+        links = list(Route.tags.through.objects.filter(route_id__in=route_ids).values_list('route_id', 'tag_id'))
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for route_id in route_ids:
+                self._deactivate(route_id)
+            for route_id, views, is_public in routes:
+                self._append_row(route_id, views, is_public)
+            links = [(route_id, tag_id) for route_id, tag_id in links if route_id in self._row_of]
+            if links:
+                rows = np.array([self._row_of[route_id] for route_id, _ in links], dtype=np.int32)
+                cols = np.array([self._column(tag_id) for _, tag_id in links], dtype=np.int32)
+                self._append_entries(rows, cols)
+            self._compact()
+
+    def remove_route(self, route_id):
+        with self._lock:
+            self._touch([route_id])
+            if self._loaded_at is None:
+                return
+            self._deactivate(route_id)
+            self._compact()
+
+    def recommend(self, preferences, limit=DEFAULT_LIMIT, offset=0):
+        """
+        Возвращает id публичных маршрутов, у которых есть хотя бы один тег из
+        preferences ({tag_id: вес}), по убыванию суммы весов, затем просмотров:
+        limit штук, начиная с позиции offset. limit=None - все маршруты.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            n = self._n_rows
+            weights = np.zeros(len(self._col_of), dtype=np.float64)
+            wanted = np.zeros(len(self._col_of), dtype=np.float64)
+            for tag_id, weight in preferences.items():
+                col = self._col_of.get(tag_id)
+                if col is not None:
+                    weights[col] = weight
+                    wanted[col] = 1
+            rows = self._entry_rows[:self._nnz]
+            cols = self._entry_cols[:self._nnz]
+            scores = np.bincount(rows, weights=weights[cols], minlength=n)
+            hits = np.bincount(rows, weights=wanted[cols], minlength=n)
+            candidates = np.flatnonzero(self._active[:n] & self._public[:n] & (hits > 0))
+
+            candidate_scores = scores[candidates]
+            end = len(candidates) if limit is None else offset + limit
+            if 0 < end < len(candidates):
+                top = np.argpartition(-candidate_scores, end - 1)[:end]
+                # Оставляем всех с баллом на границе, чтобы тай-брейк по просмотрам был честным
+                threshold = candidate_scores[top].min()
+                candidates = candidates[candidate_scores >= threshold]
+                candidate_scores = scores[candidates]
+            order = np.lexsort((-self._views[candidates], -candidate_scores))[offset:end]
+            return self._route_ids[candidates[order]].tolist()
+
+
+recommendation_engine = RouteTagMatrix()
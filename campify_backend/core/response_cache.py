@@ -0,0 +1,194 @@
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import transaction
+from rest_framework.response import Response
+
+VERSION_KEY = 'response_cache:ns:{}'
+ENTRY_KEY = 'response_cache:entry:{}'
+LOCK_KEY = 'response_cache:lock:{}'
+# Сколько держится блокировка пересборки и сколько её ждут остальные запросы
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+# Файловых блокировок фиксированное число: ключ выбирает одну по своему хешу
+LOCK_DIR = 'locks'
+LOCK_STRIPES = 256
+
+try:
+    import fcntl
+except ImportError:  # не POSIX: остаётся блокировка через cache.add
+    fcntl = None
+
+
+def _new_version():
+    # Версия с привязкой ко времени: после вытеснения ключа из кэша она
+    # не совпадёт ни с одной из прежних, и старые записи не оживут
+    return time.time_ns() // 1000
+
+
+def namespace_versions(namespaces):
+    """Текущие версии пространств имён одним обращением к кэшу."""
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*namespaces):
+    """Делает недействительными все записи, зависящие от пространств имён."""
+    for namespace in namespaces:
+        key = VERSION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def bump_on_commit(*namespaces):
+    # До фиксации транзакции параллельный запрос мог бы закэшировать старые данные под новой версией
+    transaction.on_commit(lambda: bump(*namespaces))
+
+
+class CacheLock:
+    """
+    Блокировка через cache.add. Атомарна в Redis, Memcached и LocMemCache
+    (в пределах процесса), но не в FileBasedCache - там add() проверяет и
+    записывает файл в два шага.
+    """
+    def __init__(self, key):
+        self.key = LOCK_KEY.format(key)
+
+    def try_acquire(self):
+        return cache.add(self.key, 1, LOCK_TIMEOUT)
+
+    def release(self):
+        cache.delete(self.key)
+
+
+class FileLock:
+    """
+    Блокировка через flock на файле рядом с файлами FileBasedCache.
+    Исключает и процессы, и потоки (у каждого свой открытый файл), а при
+    падении процесса снимается системой. Файлы не удаляются: удаление
+    занятого файла дало бы второму процессу блокировку на новом.
+    """
+    def __init__(self, key, directory):
+        stripe = int(hashlib.sha256(key.encode()).hexdigest(), 16) % LOCK_STRIPES
+        self.path = os.path.join(directory, f'{stripe}.lock')
+        self.file = None
+
+    def try_acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        file = open(self.path, 'a')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+
+def rebuild_lock(key):
+    """Блокировка пересборки ключа, общая для всех процессов с этим кэшем."""
+    backend = caches['default']
+    if fcntl is not None and isinstance(backend, FileBasedCache):
+        return FileLock(key, os.path.join(backend._dir, LOCK_DIR))
+    return CacheLock(key)
+
+
+def _acquire(lock, timeout):
+    deadline = time.time() + timeout
+    while not lock.try_acquire():
+        if time.time() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+    return True
+
+
+def get_or_build(key, build, timeout=None, stale_timeout=None):
+    """
+    Значение из кэша или результат build().
+
+    Запись живёт timeout секунд свежей и ещё stale_timeout секунд
+    устаревшей. Пересобирает её только тот, кто взял блокировку
+    (rebuild_lock); остальные в это время получают устаревшее значение, а
+    если его нет - ждут блокировку и берут то, что собрал предыдущий
+    владелец.
+    """
+    if timeout is None:
+        timeout = settings.RESPONSE_CACHE_TIMEOUT
+    if stale_timeout is None:
+        stale_timeout = settings.RESPONSE_CACHE_STALE_TIMEOUT
+    entry_key = ENTRY_KEY.format(key)
+
+    entry = cache.get(entry_key)
+    if entry is not None and entry['fresh_until'] > time.time():
+        return entry['value']
+
+    def rebuild():
+        value = build()
+        cache.set(entry_key, {'value': value, 'fresh_until': time.time() + timeout}, timeout + stale_timeout)
+        return value
+
+    lock = rebuild_lock(key)
+    if lock.try_acquire():
+        try:
+            return rebuild()
+        finally:
+            lock.release()
+
+    if entry is not None:
+        return entry['value']
+    if _acquire(lock, LOCK_TIMEOUT):
+        try:
+            # Пока ждали, запись обычно уже собрал владелец блокировки
+            entry = cache.get(entry_key)
+            if entry is not None:
+                return entry['value']
+            return rebuild()
+        finally:
+            lock.release()
+    # Пересборка заняла слишком долго - считаем сами, не кэшируя
+    return build()
+
+
+class CachedResponseMixin:
+    """
+    Кэширует ответы GET представления DRF.
+
+    Ключ - полный URL запроса плюс версии пространств имён из
+    cache_namespaces (шаблоны форматируются аргументами URL, например
+    'route:{pk}'). Сигналы моделей увеличивают версии (core/signals.py),
+    поэтому изменившиеся данные перестают совпадать с ключом сразу после
+    фиксации транзакции, без перебора старых записей.
+    """
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return [namespace.format(**self.kwargs) for namespace in self.cache_namespaces]
+
+    def get(self, request, *args, **kwargs):
+        namespaces = self.get_cache_namespaces()
+        versions = namespace_versions(namespaces)
+        raw_key = '|'.join([request.build_absolute_uri(), *(f'{n}={v}' for n, v in zip(namespaces, versions))])
+        key = hashlib.sha256(raw_key.encode()).hexdigest()
+
+        def build():
+            response = super(CachedResponseMixin, self).get(request, *args, **kwargs)
+            return response.status_code, response.data
+
+        status_code, data = get_or_build(key, build)
+        return Response(data, status=status_code)
@@ -0,0 +1,166 @@
+from datetime import timedelta
+
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from .models import Route
+
+# Корзины длительности и длины: (значение, нижняя граница включительно, верхняя не включительно)
+DURATION_BUCKETS = (
+    ('short', None, timedelta(hours=3)),
+    ('half_day', timedelta(hours=3), timedelta(hours=8)),
+    ('day', timedelta(hours=8), timedelta(hours=24)),
+    ('multi_day', timedelta(hours=24), None),
+)
+LENGTH_BUCKETS = (
+    ('up_to_5', None, 5),
+    ('5_15', 5, 15),
+    ('15_30', 15, 30),
+    ('over_30', 30, None),
+)
+TAG_MODES = ('all', 'any')
+TAG_FACET_LIMIT = 50
+MAX_TAGS = 20
+
+
+def _range_q(field, low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(**{f'{field}__gte': low})
+    if high is not None:
+        q &= Q(**{f'{field}__lt': high})
+    return q
+
+
+def _bucket_case(field, buckets):
+    """Номер корзины (индекс в buckets) для значения поля; NULL - вне корзин."""
+    return Case(
+        *(When(_range_q(field, low, high), then=Value(index)) for index, (_, low, high) in enumerate(buckets)),
+        default=None,
+        output_field=IntegerField(),
+    )
+
+
+def _int_list(params, name, allowed=None):
+    raw = params.get(name)
+    if not raw:
+        return []
+    try:
+        values = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise ValueError(f"Параметр {name} должен быть списком целых чисел через запятую.")
+    if allowed is not None and not set(values) <= set(allowed):
+        raise ValueError(f"Недопустимое значение {name}, возможные: {', '.join(map(str, allowed))}.")
+    return values
+
+
+def _float(params, name):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError(f"Параметр {name} должен быть числом.")
+
+
+class RouteFilter:
+    """
+    Фильтр публичных маршрутов по сложности, типу, корзинам длительности,
+    диапазону длины и тегам (все или любой из), и счётчики фасетов.
+
+    Счётчик фасета считается с учётом всех условий, кроме условия по этому
+    же измерению - так видно, сколько маршрутов даст выбор другого
+    значения. Каждое измерение считается одним запросом с GROUP BY.
+    """
+    def __init__(self, conditions, tag_ids=(), tag_mode='all'):
+        self.conditions = conditions
+        self.tag_ids = list(tag_ids)
+        self.tag_mode = tag_mode
+
+    @classmethod
+    def from_params(cls, params):
+        """Разбирает параметры запроса. При ошибке бросает ValueError с текстом для клиента."""
+        conditions = {}
+        difficulties = _int_list(params, 'difficulty', [value for value, _ in Route.DIFFICULTY_CHOICES])
+        if difficulties:
+            conditions['difficulty'] = Q(difficulty__in=difficulties)
+        types = _int_list(params, 'type', [value for value, _ in Route.TYPES])
+        if types:
+            conditions['type'] = Q(type__in=types)
+
+        durations = [part for part in params.get('duration', '').split(',') if part]
+        buckets = {name: (low, high) for name, low, high in DURATION_BUCKETS}
+        if not set(durations) <= set(buckets):
+            raise ValueError(f"Недопустимое значение duration, возможные: {', '.join(buckets)}.")
+        if durations:
+            q = Q()
+            for name in durations:
+                q |= _range_q('duration', *buckets[name])
+            conditions['duration'] = q
+
+        length_min, length_max = _float(params, 'length_min'), _float(params, 'length_max')
+        if length_min is not None and length_max is not None and length_min > length_max:
+            raise ValueError("length_min не может быть больше length_max.")
+        if length_min is not None or length_max is not None:
+            conditions['length'] = Q()
+            if length_min is not None:
+                conditions['length'] &= Q(length_in_km__gte=length_min)
+            if length_max is not None:
+                conditions['length'] &= Q(length_in_km__lte=length_max)
+
+        tag_ids = list(dict.fromkeys(_int_list(params, 'tags')))
+        if len(tag_ids) > MAX_TAGS:
+            raise ValueError(f"Можно указать не больше {MAX_TAGS} тегов.")
+        tag_mode = params.get('tags_mode') or 'all'
+        if tag_mode not in TAG_MODES:
+            raise ValueError(f"tags_mode может быть {' или '.join(TAG_MODES)}.")
+        return cls(conditions, tag_ids, tag_mode)
+
+    def _tags_q(self):
+        if not self.tag_ids:
+            return Q()
+        links = Route.tags.through.objects.filter(tag_id__in=self.tag_ids)
+        if self.tag_mode == 'all' and len(self.tag_ids) > 1:
+            links = links.values('route_id').annotate(matched=Count('tag_id')).filter(matched=len(self.tag_ids))
+        return Q(id__in=links.values('route_id'))
+
+    def queryset(self, exclude=None):
+        # is_public__in, а не is_public=True: в SQLite второе превращается в
+        # голый столбец и не может быть префиксом составного индекса
+        routes = Route.objects.filter(is_public__in=[True])
+        for dimension, q in self.conditions.items():
+            if dimension != exclude:
+                routes = routes.filter(q)
+        if exclude != 'tags':
+            routes = routes.filter(self._tags_q())
+        return routes
+
+    def _grouped(self, dimension, expression):
+        rows = (
+            self.queryset(exclude=dimension)
+            .annotate(facet=expression)
+            .values('facet')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        return {row['facet']: row['count'] for row in rows if row['facet'] is not None}
+
+    def facets(self):
+        difficulty = self._grouped('difficulty', F('difficulty'))
+        route_type = self._grouped('type', F('type'))
+        duration = self._grouped('duration', _bucket_case('duration', DURATION_BUCKETS))
+        length = self._grouped('length', _bucket_case('length_in_km', LENGTH_BUCKETS))
+        tags = (
+            Route.tags.through.objects
+            .filter(route_id__in=self.queryset(exclude='tags').values('id'))
+            .values('tag_id')
+            .annotate(count=Count('route_id'))
+            .order_by('-count', 'tag_id')[:TAG_FACET_LIMIT]
+        )
+        return {
+            'difficulty': [{'value': value, 'count': difficulty.get(value, 0)} for value, _ in Route.DIFFICULTY_CHOICES],
+            'type': [{'value': value, 'count': route_type.get(value, 0)} for value, _ in Route.TYPES],
+            'duration': [{'value': name, 'count': duration.get(index, 0)} for index, (name, _, _) in enumerate(DURATION_BUCKETS)],
+            'length': [{'value': name, 'count': length.get(index, 0)} for index, (name, _, _) in enumerate(LENGTH_BUCKETS)],
+            'tags': [{'value': row['tag_id'], 'count': row['count']} for row in tags],
+        }
@@ -0,0 +1,168 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.db.models import Q
+
+from .models import Route
+
+FTS_TABLE = 'core_route_fts'
+# Колонки индекса и их веса в bm25: совпадение в названии важнее, чем в описании
+FTS_COLUMNS = (('name', 10.0), ('location_area', 5.0), ('description', 1.0))
+# Поля, по которым можно сузить поиск точным совпадением
+FILTER_FIELDS = ('type', 'difficulty')
+TRIGGERS = ('core_route_fts_insert', 'core_route_fts_update', 'core_route_fts_delete')
+MAX_TERMS = 8
+# Больше совпадений не ранжируем по bm25 (см. search_route_ids)
+RANKED_MATCH_LIMIT = 2000
+MIN_STEM = 3
+
+# Частые окончания существительных и прилагательных, от длинных к коротким.
+# Это не стеммер: окончание просто отрезается, а основа ищется по префиксу,
+# поэтому «озёра», «озеро» и «озерах» находят друг друга.
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ой', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ам', 'ям', 'ом', 'ем', 'ую', 'юю', 'ия', 'ии', 'ию',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+TERM_RE = re.compile(r'\w+')
+
+
+def _normalized(column):
+    # unicode61 сам приводит регистр, но «ё» и «е» для него разные буквы
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _indexed_values(prefix):
+    return ', '.join(_normalized(f'{prefix}.{name}') for name, _ in FTS_COLUMNS)
+
+
+def _column_names():
+    return ', '.join(name for name, _ in FTS_COLUMNS)
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def create_search_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Создаёт FTS5-таблицу и триггеры, поддерживающие её в актуальном
+    состоянии при любых изменениях core_route (в том числе bulk_create и
+    update(), которые не шлют сигналов). Вызывается после migrate. SQLite
+    пересоздаёт таблицу при изменении схемы, и триггеры пропадают вместе со
+    старой таблицей - тогда они создаются заново, а индекс перестраивается.
+    """
+    database = connections[using]
+    if database.vendor != 'sqlite':
+        return
+    with database.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)", TRIGGERS)
+        if len(cursor.fetchall()) == len(TRIGGERS):
+            return
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"{_column_names()}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except DatabaseError:
+            # SQLite собран без FTS5: поиск работает через LIKE
+            return
+        for trigger in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute(
+            f"CREATE TRIGGER {TRIGGERS[0]} AFTER INSERT ON core_route BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, {_column_names()}) VALUES (new.id, {_indexed_values('new')}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {TRIGGERS[1]} AFTER UPDATE OF {_column_names()} ON core_route BEGIN "
+            f"UPDATE {FTS_TABLE} SET ({_column_names()}) = ({_indexed_values('new')}) WHERE rowid = new.id; END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {TRIGGERS[2]} AFTER DELETE ON core_route BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END"
+        )
+    rebuild_search_index(using)
+
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    """Заполняет индекс заново по таблице маршрутов. Возвращает число маршрутов."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, {_column_names()}) "
+            f"SELECT id, {_indexed_values('core_route')} FROM core_route"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def _stem(term):
+    for ending in ENDINGS:
+        if term.endswith(ending) and len(term) - len(ending) >= MIN_STEM:
+            return term[:-len(ending)]
+    return term
+
+
+def query_terms(query):
+    """Основы слов запроса в нижнем регистре, без повторов."""
+    terms = TERM_RE.findall(query.lower().replace('ё', 'е'))
+    return list(dict.fromkeys(_stem(term) for term in terms))[:MAX_TERMS]
+
+
+def match_expression(terms):
+    """Выражение MATCH: все основы по префиксу. Кавычки исключают синтаксис FTS5 из ввода."""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_route_ids(query, filters=None, limit=20, offset=0):
+    """
+    id публичных маршрутов, подходящих под запрос, от лучших к худшим по
+    bm25. filters - точные условия на поля из FILTER_FIELDS.
+
+    bm25 считается для каждого совпадения, поэтому для запросов, под которые
+    подходит больше RANKED_MATCH_LIMIT маршрутов (слова вроде «маршрут»,
+    которые есть почти везде и почти не влияют на ранг), результаты идут от
+    новых к старым - этот порядок FTS5 отдаёт без сортировки. Без FTS5
+    ищет подстроки через icontains и сортирует по просмотрам.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    filters = {name: value for name, value in (filters or {}).items() if name in FILTER_FIELDS}
+    if not is_supported():
+        return _fallback_search(terms, filters, limit, offset)
+
+    match = match_expression(terms)
+    conditions = [f'{FTS_TABLE} MATCH %s', 'core_route.is_public'] + [f'core_route.{name} = %s' for name in filters]
+    weights = ', '.join(str(weight) for _, weight in FTS_COLUMNS)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)',
+                [match, RANKED_MATCH_LIMIT],
+            )
+            ranked = cursor.fetchone()[0] < RANKED_MATCH_LIMIT
+            order = f'bm25({FTS_TABLE}, {weights})' if ranked else f'{FTS_TABLE}.rowid DESC'
+            cursor.execute(
+                f'SELECT core_route.id FROM {FTS_TABLE} '
+                f'JOIN core_route ON core_route.id = {FTS_TABLE}.rowid '
+                f'WHERE {" AND ".join(conditions)} '
+                f'ORDER BY {order} LIMIT %s OFFSET %s',
+                [match, *filters.values(), limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        # Индекса нет (база не прошла migrate после обновления) - ищем без него
+        return _fallback_search(terms, filters, limit, offset)
+
+
+def _fallback_search(terms, filters, limit, offset):
+    routes = Route.objects.filter(is_public=True, **filters)
+    for term in terms:
+        any_column = Q()
+        for name, _ in FTS_COLUMNS:
+            any_column |= Q(**{f'{name}__icontains': term})
+        routes = routes.filter(any_column)
+    return list(routes.order_by('-views', '-id').values_list('id', flat=True)[offset:offset + limit])
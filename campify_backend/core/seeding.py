@@ -0,0 +1,237 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from PIL import Image
+
+from . import media
+from .geo import assign_grid_cells
+from .models import (
+    Checklist, ChecklistItems, FavoriteRoute, MapPoint, PointReview, Route, RouteGeometry, RoutePhoto, RouteReview,
+    Tag, User, UserTagPreference,
+)
+from .recommendations import recommendation_engine
+from .response_cache import bump_on_commit
+from .tag_registry import tag_registry
+
+DEFAULT_PREFIX = 'bench_'
+BATCH_SIZE = 1000
+# Область, в которой разбрасываются старты маршрутов (примерно Центральная Россия)
+LATITUDE_RANGE = (53.0, 58.0)
+LONGITUDE_RANGE = (33.0, 42.0)
+
+NAME_WORDS = (
+    'Озёрная', 'Лесная', 'Горная', 'Речная', 'Сосновая', 'Берёзовая', 'Каменная', 'Северная',
+    'тропа', 'петля', 'дорога', 'стоянка', 'поляна', 'роща', 'гряда', 'долина',
+)
+DESCRIPTION_WORDS = (
+    'маршрут', 'вдоль', 'берега', 'озера', 'через', 'сосновый', 'бор', 'к', 'водопаду', 'стоянка',
+    'у', 'реки', 'с', 'детьми', 'летом', 'зимой', 'палатка', 'костёр', 'подъём', 'смотровая',
+    'площадка', 'родник', 'байдарка', 'велосипед', 'пешком', 'гора', 'ущелье', 'пещера',
+)
+AREAS = ('Тверская область', 'Московская область', 'Ярославская область', 'Владимирская область', 'Калужская область')
+COMMENTS = ('Отличный маршрут', 'Красиво, но грязно', 'Много комаров', 'Рекомендую', 'Сложнее, чем описано', '')
+
+
+def _text(rng, words, low, high):
+    return ' '.join(rng.choice(words) for _ in range(rng.randint(low, high)))
+
+
+def _spread(rng, average):
+    # Равномерно от 0 до 2*average - в среднем average, но с разбросом между объектами
+    return rng.randint(0, 2 * average) if average > 0 else 0
+
+
+def placeholder_image():
+    """Крошечный PNG, на который ссылаются все сгенерированные фото (блоб один, см. core/storage.py)."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), (90, 140, 60)).save(buffer, format='PNG')
+    return default_storage.save('photos/route_photos/benchmark.png', ContentFile(buffer.getvalue()))
+
+
+@transaction.atomic
+def seed_benchmark_data(users=100, routes=1000, tags=30, reviews_per_route=3, photos_per_route=2,
+                        points_per_route=3, favorites_per_user=5, preferences_per_user=5,
+                        seed=42, prefix=DEFAULT_PREFIX, batch_size=BATCH_SIZE):
+    """
+    Наполняет базу синтетическими данными для нагрузочных замеров.
+
+    Все объекты создаются через bulk_create, поэтому сигналы моделей не
+    срабатывают: производные поля (ячейки сетки, агрегаты отзывов, счётчики
+    ссылок на файлы) заполняются здесь же, поисковый индекс обновляют
+    триггеры (core/search.py). Пользователи и теги получают имена с
+    префиксом prefix, по нему же их удаляет delete_benchmark_data.
+    Значения *_per_* - средние, у каждого объекта число случайно от 0 до
+    удвоенного среднего. Возвращает словарь модель -> число созданных строк.
+    """
+    rng = random.Random(seed)
+    if User.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f"Данные с префиксом {prefix!r} уже есть, сначала удалите их.")
+    created = {}
+
+    tag_names = [f'{prefix}тег {index}' for index in range(tags)]
+    Tag.objects.bulk_create([Tag(name=name) for name in tag_names], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.filter(name__in=tag_names).values_list('id', flat=True))
+    created['tags'] = len(tag_ids)
+
+    # Хеш пароля считается один раз: PBKDF2 на каждого пользователя занял бы минуты
+    password = make_password(None)
+    user_objects = User.objects.bulk_create([
+        User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', password=password)
+        for index in range(users)
+    ], batch_size=batch_size)
+    user_ids = [user.id for user in user_objects]
+    created['users'] = len(user_ids)
+
+    route_objects = []
+    route_ratings = []
+    for index in range(routes):
+        latitude, longitude = rng.uniform(*LATITUDE_RANGE), rng.uniform(*LONGITUDE_RANGE)
+        end_latitude, end_longitude = latitude + rng.uniform(-0.1, 0.1), longitude + rng.uniform(-0.1, 0.1)
+        ratings = [rng.randint(1, 5) for _ in range(_spread(rng, reviews_per_route))]
+        route_ratings.append(ratings)
+        route_objects.append(Route(
+            author_id=rng.choice(user_ids) if user_ids else None,
+            name=f'{_text(rng, NAME_WORDS, 1, 3)} {index}',
+            description=_text(rng, DESCRIPTION_WORDS, 5, 60),
+            location_area=rng.choice(AREAS),
+            length_in_km=round(rng.uniform(1, 60), 1),
+            height=round(rng.uniform(0, 1500)),
+            duration=timedelta(minutes=rng.randint(30, 72 * 60)),
+            difficulty=rng.randint(1, 4),
+            type=rng.randint(1, 2),
+            is_public=rng.random() < 0.9,
+            views=rng.randint(0, 5000),
+            rating_sum=sum(ratings),
+            rating_count=len(ratings),
+            start_latitude=latitude,
+            start_longitude=longitude,
+            end_latitude=end_latitude,
+            end_longitude=end_longitude,
+            min_latitude=min(latitude, end_latitude),
+            min_longitude=min(longitude, end_longitude),
+            max_latitude=max(latitude, end_latitude),
+            max_longitude=max(longitude, end_longitude),
+        ))
+    assign_grid_cells(route_objects, 'start_latitude', 'start_longitude', 'start_cell')
+    route_objects = Route.objects.bulk_create(route_objects, batch_size=batch_size)
+    route_ids = [route.id for route in route_objects]
+    created['routes'] = len(route_ids)
+
+    through = Route.tags.through
+    created['route_tags'] = len(through.objects.bulk_create([
+        through(route_id=route_id, tag_id=tag_id)
+        for route_id in route_ids
+        for tag_id in rng.sample(tag_ids, min(rng.randint(0, 5), len(tag_ids)))
+    ], batch_size=batch_size))
+
+    if user_ids:
+        created['route_reviews'] = len(RouteReview.objects.bulk_create([
+            RouteReview(route_id=route_id, user_id=rng.choice(user_ids), rating=rating, comment=rng.choice(COMMENTS))
+            for route_id, ratings in zip(route_ids, route_ratings)
+            for rating in ratings
+        ], batch_size=batch_size))
+
+    photos = [
+        RoutePhoto(route_id=route_id, is_checked=rng.random() < 0.8)
+        for route_id in route_ids
+        for _ in range(_spread(rng, photos_per_route))
+    ]
+    if photos:
+        image_name = placeholder_image()
+        for photo in photos:
+            photo.image.name = image_name
+        created['route_photos'] = len(RoutePhoto.objects.bulk_create(photos, batch_size=batch_size))
+        media.acquire([image_name] * len(photos))
+
+    points = []
+    for route in route_objects:
+        for _ in range(_spread(rng, points_per_route)):
+            points.append(MapPoint(
+                route_id=route.id,
+                type=rng.choice(MapPoint.POINT_TYPES)[0],
+                latitude=route.start_latitude + rng.uniform(-0.05, 0.05),
+                longitude=route.start_longitude + rng.uniform(-0.05, 0.05),
+                name=_text(rng, NAME_WORDS, 1, 2),
+                description=_text(rng, DESCRIPTION_WORDS, 0, 15),
+            ))
+    assign_grid_cells(points)
+    created['map_points'] = len(MapPoint.objects.bulk_create(points, batch_size=batch_size))
+
+    created['favorite_routes'] = len(FavoriteRoute.objects.bulk_create([
+        FavoriteRoute(user_id=user_id, route_id=route_id)
+        for user_id in user_ids
+        for route_id in rng.sample(route_ids, min(_spread(rng, favorites_per_user), len(route_ids)))
+    ], batch_size=batch_size))
+
+    created['tag_preferences'] = len(UserTagPreference.objects.bulk_create([
+        UserTagPreference(user_id=user_id, tag_id=tag_id, weight=round(rng.random(), 3))
+        for user_id in user_ids
+        for tag_id in rng.sample(tag_ids, min(_spread(rng, preferences_per_user), len(tag_ids)))
+    ], batch_size=batch_size))
+
+    _after_bulk_changes()
+    return created
+
+
+def _delete(queryset):
+    # DELETE ... WHERE id IN (подзапрос) одной командой: QuerySet.delete() при
+    # подключённых сигналах загружает и удаляет объекты по одному
+    sql, params = queryset.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {queryset.model._meta.db_table} WHERE id IN ({sql})', params)
+        return cursor.rowcount
+
+
+@transaction.atomic
+def delete_benchmark_data(prefix=DEFAULT_PREFIX):
+    """
+    Удаляет пользователей и теги с префиксом prefix, их маршруты и всё,
+    что от них зависит. Удаление идёт SQL-командами от дочерних таблиц к
+    родительским, без сигналов: ссылки на файлы освобождаются одним вызовом
+    media.release. Возвращает число удалённых строк по таблицам.
+    """
+    users = User.objects.filter(username__startswith=prefix)
+    tags = Tag.objects.filter(name__startswith=prefix)
+    routes = Route.objects.filter(author__in=users)
+    points = MapPoint.objects.filter(route__in=routes)
+    checklists = Checklist.objects.filter(route_id__in=routes)
+    released = media.queryset_names([routes, RoutePhoto.objects.filter(route__in=routes), points, checklists])
+
+    steps = (
+        PointReview.objects.filter(Q(point__in=points) | Q(user__in=users)),
+        ChecklistItems.objects.filter(checklist_id__in=checklists),
+        checklists,
+        points,
+        RoutePhoto.objects.filter(route__in=routes),
+        RouteGeometry.objects.filter(route__in=routes),
+        RouteReview.objects.filter(Q(route__in=routes) | Q(user__in=users)),
+        FavoriteRoute.objects.filter(Q(route__in=routes) | Q(user__in=users)),
+        UserTagPreference.objects.filter(Q(user__in=users) | Q(tag__in=tags)),
+        Route.tags.through.objects.filter(Q(route__in=routes) | Q(tag__in=tags)),
+        User.groups.through.objects.filter(user__in=users),
+        User.user_permissions.through.objects.filter(user__in=users),
+        routes,
+        users,
+        tags,
+    )
+    deleted = {}
+    for queryset in steps:
+        count = _delete(queryset)
+        if count:
+            deleted[queryset.model._meta.label] = count
+    media.release(released)
+    _after_bulk_changes()
+    return deleted
+
+
+def _after_bulk_changes():
+    # bulk-операции не шлют сигналов, кэши этого процесса сбрасываем сами
+    transaction.on_commit(tag_registry.invalidate)
+    transaction.on_commit(recommendation_engine.invalidate)
+    bump_on_commit('routes', 'tags')
@@ -1,7 +1,23 @@
+from collections import defaultdict
 from datetime import timedelta
 
+from django.db import models
+from django.utils.duration import duration_string
 from rest_framework import serializers
 from .models import *
+from .images import derivative_urls
+
+
+class ImageDerivativesField(serializers.Field):
+    """Ссылки на оригинал и уменьшенные копии поля image, по размерам."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return derivative_urls(instance.image, instance.derivatives, self.context.get('request'))
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -41,21 +57,108 @@ class RouteSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Route
-        fields = '__all__'
+        exclude = ['start_cell']
+        read_only_fields = (
+            'rating_sum', 'rating_count', 'elevation_gain',
+            'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
+            'min_latitude', 'min_longitude', 'max_latitude', 'max_longitude',
+        )
         extra_kwargs = {
             'gpx_url': {'required': False, 'allow_null': True}
         }
 
+class RouteListListSerializer(serializers.ListSerializer):
+    """Загружает id тегов всех маршрутов страницы одним запросом к связующей таблице."""
+
+    def to_representation(self, data):
+        routes = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        tag_ids = defaultdict(list)
+        rows = Route.tags.through.objects.filter(route_id__in=[route.pk for route in routes]).order_by('tag_id')
+        for route_id, tag_id in rows.values_list('route_id', 'tag_id'):
+            tag_ids[route_id].append(tag_id)
+        for route in routes:
+            route.tag_ids = tag_ids[route.pk]
+        return [self.child.to_representation(route) for route in routes]
+
+
+class RouteListSerializer(serializers.BaseSerializer):
+    """
+    Быстрый сериализатор списков маршрутов, только для чтения.
+
+    Отдаёт те же поля, что RouteSerializer, но собирает словарь напрямую,
+    без построения и обхода полей DRF для каждого объекта. Теги - только
+    id, без создания объектов Tag (см. RouteListListSerializer), автор - id
+    из внешнего ключа, без запроса к пользователям.
+    """
+    plain_fields = (
+        'id', 'name', 'description', 'location_area', 'difficulty', 'type',
+        'is_public', 'chat_link', 'views', 'rating_count',
+    )
+    float_fields = (
+        'length_in_km', 'height', 'rating_sum', 'elevation_gain',
+        'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude',
+        'min_latitude', 'min_longitude', 'max_latitude', 'max_longitude',
+    )
+    # Столбцы, которые нужно загрузить: всё, что выводится, и ничего больше
+    only_fields = plain_fields + float_fields + ('author', 'duration', 'gpx_url', 'created_at')
+    datetime_field = serializers.DateTimeField()
+
+    class Meta:
+        list_serializer_class = RouteListListSerializer
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        return queryset.only(*cls.only_fields)
+
+    def to_representation(self, route):
+        data = {name: getattr(route, name) for name in self.plain_fields}
+        for name in self.float_fields:
+            value = getattr(route, name)
+            data[name] = None if value is None else float(value)
+        data['author'] = route.author_id
+        data['duration'] = None if route.duration is None else duration_string(route.duration)
+        data['created_at'] = self.datetime_field.to_representation(route.created_at)
+        data['gpx_url'] = None
+        if route.gpx_url:
+            request = self.context.get('request')
+            url = route.gpx_url.url
+            data['gpx_url'] = request.build_absolute_uri(url) if request is not None else url
+        tag_ids = getattr(route, 'tag_ids', None)
+        data['tags'] = tag_ids if tag_ids is not None else [tag.pk for tag in route.tags.all()]
+        data['average_rating'] = route.average_rating
+        return data
+
 class RoutePhotoSerializer(serializers.ModelSerializer):
+    images = ImageDerivativesField()
+
     class Meta:
         model = RoutePhoto
-        fields = ['id', 'route', 'image', 'uploaded_at', 'is_checked']
+        fields = ['id', 'route', 'image', 'images', 'uploaded_at', 'is_checked']
 
 class ValidationRoutePhotoSerializer(serializers.ModelSerializer):
     class Meta:
         model = RoutePhoto
         fields = ['is_checked']
 
+class PhotoVerdictSerializer(serializers.Serializer):
+    APPROVE = 'approve'
+    REJECT = 'reject'
+
+    id = serializers.IntegerField(min_value=1)
+    verdict = serializers.ChoiceField(choices=[APPROVE, REJECT])
+
+class PhotoModerationSerializer(serializers.Serializer):
+    MAX_ITEMS = 1000
+
+    items = PhotoVerdictSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+
+    def validate_items(self, items):
+        verdicts = {}
+        for item in items:
+            if verdicts.setdefault(item['id'], item['verdict']) != item['verdict']:
+                raise serializers.ValidationError(f"Для фото {item['id']} указаны разные решения.")
+        return verdicts
+
 class RouteReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = RouteReview
@@ -67,9 +170,11 @@ class FavoriteRouteSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class MapPointSerializer(serializers.ModelSerializer):
+    images = ImageDerivativesField()
+
     class Meta:
         model = MapPoint
-        fields = '__all__'
+        exclude = ['cell', 'derivatives']
         extra_kwargs = {
             'image': {'required': False}
         }
@@ -97,4 +202,34 @@ class ChecklistItemsSerializer(serializers.ModelSerializer):
 class TagsItemsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+class AuthorSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
+class RouteFullSerializer(RouteSerializer):
+    """
+    Маршрут со всем содержимым страницы. Ожидает объект, загруженный
+    RouteFullView: проверенные фото в checked_photos и первые
+    reviews_page_size + 1 отзывов в first_reviews.
+    """
+    reviews_page_size = 10
+
+    author = AuthorSummarySerializer(read_only=True)
+    tags = TagsItemsSerializer(many=True, read_only=True)
+    photos = RoutePhotoSerializer(source='checked_photos', many=True, read_only=True)
+    points = MapPointSerializer(many=True, read_only=True)
+    checklists = ChecklistSerializer(many=True, read_only=True)
+    reviews = serializers.SerializerMethodField()
+
+    class Meta(RouteSerializer.Meta):
+        pass
+
+    def get_reviews(self, obj):
+        page = obj.first_reviews[:self.reviews_page_size]
+        return {
+            'count': obj.rating_count,
+            'has_more': len(obj.first_reviews) > self.reviews_page_size,
+            'results': RouteReviewSerializer(page, many=True, context=self.context).data,
+        }
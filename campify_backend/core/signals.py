@@ -0,0 +1,193 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import media, ratings
+from .geometry import update_route_extent_from_points
+from .images import derivatives_updated, schedule_derivatives
+from .models import Checklist, MapPoint, Route, RoutePhoto, RouteReview, Tag
+from .recommendations import recommendation_engine
+from .response_cache import bump_on_commit
+from .tag_registry import tag_registry
+
+
+@receiver(post_save, sender=Route)
+def route_saved(sender, instance, created, **kwargs):
+    transaction.on_commit(
+        lambda: recommendation_engine.update_route(instance.id, instance.views, instance.is_public)
+    )
+
+
+@receiver(post_delete, sender=Route)
+def route_deleted(sender, instance, **kwargs):
+    route_id = instance.id
+    transaction.on_commit(lambda: recommendation_engine.remove_route(route_id))
+
+
+@receiver(m2m_changed, sender=Route.tags.through)
+def route_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        route_ids = {instance.pk}
+    elif pk_set:
+        route_ids = set(pk_set)
+    else:
+        # Тег отвязан от всех маршрутов сразу, проще перечитать матрицу целиком
+        transaction.on_commit(recommendation_engine.invalidate)
+        return
+    transaction.on_commit(lambda: recommendation_engine.refresh_routes(route_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(tag_registry.invalidate)
+
+
+def _deleted_with_route(sender, origin):
+    # Удаление началось не с объектов этой модели: фото, точки и чек-листы
+    # удаляются каскадом только через свой маршрут (см. route_deleting)
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not sender
+
+
+@receiver(post_save, sender=MapPoint)
+@receiver(post_delete, sender=MapPoint)
+def map_point_changed(sender, instance, origin=None, **kwargs):
+    # Маршрут, удаляемый вместе с точками, пересчитывать незачем
+    if instance.route_id is not None and not _deleted_with_route(sender, origin):
+        update_route_extent_from_points(instance.route_id)
+
+
+@receiver(post_delete, sender=RouteReview)
+def route_review_deleted(sender, instance, origin=None, **kwargs):
+    # Отзывы удаляют не только через API: QuerySet.delete() и каскад от
+    # пользователя тоже должны сдвигать агрегаты. Агрегаты удаляемого
+    # маршрута пересчитывать незачем
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is not Route:
+        ratings.review_deleted(instance.route_id, instance.rating)
+
+
+@receiver(post_save, sender=RoutePhoto)
+@receiver(post_save, sender=MapPoint)
+def image_saved(sender, instance, **kwargs):
+    schedule_derivatives(instance)
+
+
+@receiver(pre_save, sender=Route)
+@receiver(pre_save, sender=RoutePhoto)
+@receiver(pre_save, sender=MapPoint)
+@receiver(pre_save, sender=Checklist)
+def media_owner_saving(sender, instance, update_fields=None, **kwargs):
+    instance._media_name_before_save = media.name_before_save(instance, update_fields)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=RoutePhoto)
+@receiver(post_save, sender=MapPoint)
+@receiver(post_save, sender=Checklist)
+def media_owner_saved(sender, instance, **kwargs):
+    media.swap_reference(instance, getattr(instance, '_media_name_before_save', media.UNCHANGED))
+
+
+@receiver(pre_delete, sender=Route)
+def route_deleting(sender, instance, **kwargs):
+    # Файлы фото, точек и чек-листов маршрута освобождаются одним вызовом,
+    # а не по объекту в media_owner_deleted: иначе удаление маршрута делает
+    # запросы на каждый дочерний объект
+    media.release(media.queryset_names([
+        RoutePhoto.objects.filter(route_id=instance.pk),
+        MapPoint.objects.filter(route_id=instance.pk),
+        Checklist.objects.filter(route_id=instance.pk),
+    ]))
+
+
+@receiver(pre_delete, sender=RoutePhoto)
+@receiver(pre_delete, sender=MapPoint)
+@receiver(pre_delete, sender=Checklist)
+def media_queryset_deleting(sender, instance, origin=None, **kwargs):
+    # QuerySet.delete() шлёт сигналы по каждому объекту; файлы всего запроса
+    # освобождаем при первом из них
+    if isinstance(origin, QuerySet) and origin.model is sender and not getattr(origin, '_media_released', False):
+        origin._media_released = True
+        media.release(media.queryset_names([origin]))
+
+
+@receiver(post_delete, sender=Route)
+@receiver(post_delete, sender=RoutePhoto)
+@receiver(post_delete, sender=MapPoint)
+@receiver(post_delete, sender=Checklist)
+def media_owner_deleted(sender, instance, origin=None, **kwargs):
+    if sender is not Route and (isinstance(origin, QuerySet) or _deleted_with_route(sender, origin)):
+        return
+    media.release(media.instance_names(instance))
+
+
+# Кэш ответов (core/response_cache.py). Пространства имён:
+# routes - списки маршрутов, route:<id> - карточка маршрута,
+# route_reviews:<id> и route_photos:<id> - отзывы и фото маршрута, tags - теги.
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def route_cache_changed(sender, instance, **kwargs):
+    bump_on_commit('routes', f'route:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Route.tags.through)
+def route_tags_cache_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        namespaces = [f'route:{instance.pk}']
+    elif pk_set:
+        namespaces = [f'route:{route_id}' for route_id in pk_set]
+    else:
+        # Затронутые маршруты неизвестны; карточки зависят и от версии тегов
+        namespaces = ['tags']
+    bump_on_commit('routes', *namespaces)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_cache_changed(sender, **kwargs):
+    bump_on_commit('tags')
+
+
+@receiver(pre_save, sender=RouteReview)
+@receiver(pre_save, sender=RoutePhoto)
+def route_child_saving(sender, instance, update_fields=None, **kwargs):
+    # Объект могут перенести на другой маршрут - сбросить нужно оба
+    if instance._state.adding or (update_fields is not None and not {'route', 'route_id'} & set(update_fields)):
+        instance._route_id_before_save = None
+        return
+    instance._route_id_before_save = sender.objects.filter(pk=instance.pk).values_list('route_id', flat=True).first()
+
+
+def _affected_route_ids(instance):
+    return {instance.route_id, getattr(instance, '_route_id_before_save', None)} - {None}
+
+
+@receiver(post_save, sender=RouteReview)
+@receiver(post_delete, sender=RouteReview)
+def route_review_cache_changed(sender, instance, **kwargs):
+    # Отзывы меняют и средний рейтинг в карточке и списках маршрутов
+    namespaces = ['routes']
+    for route_id in _affected_route_ids(instance):
+        namespaces += [f'route:{route_id}', f'route_reviews:{route_id}']
+    bump_on_commit(*namespaces)
+
+
+@receiver(post_save, sender=RoutePhoto)
+@receiver(post_delete, sender=RoutePhoto)
+def route_photo_cache_changed(sender, instance, **kwargs):
+    bump_on_commit(*(f'route_photos:{route_id}' for route_id in _affected_route_ids(instance)))
+
+
+@receiver(derivatives_updated, sender=RoutePhoto)
+def route_photo_derivatives_updated(sender, instance, **kwargs):
+    bump_on_commit(f'route_photos:{instance.route_id}')
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from .compression import GZIP_SUFFIX
+from .media import is_referenced
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками процесса
+    fcntl = None
+
+BLOB_DIR = 'blobs'
+TEMP_DIR = '.incoming'
+LOCK_FILE = f'{TEMP_DIR}/.lock'
+# Суффиксы производных вариантов блоба, которые хранятся рядом с ним
+COMPANION_SUFFIXES = ('.br',)
+
+
+def blob_extension(name):
+    """Расширение для имени блоба; у сжатых файлов сохраняется и исходное (.gpx.gz)."""
+    stem, extension = os.path.splitext(name)
+    if extension.lower() == GZIP_SUFFIX:
+        extension = os.path.splitext(stem)[1] + extension
+    return extension.lower()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, в котором имя файла - sha256 его содержимого:
+    blobs/ab/cd/<digest><расширение>.
+
+    Содержимое хешируется во время записи во временный файл (один проход по
+    загрузке), затем временный файл атомарно переносится на место блоба.
+    Если такой блоб уже есть, повторная загрузка ничего не пишет. Блоб по
+    имени никогда не меняется, поэтому его URL можно кэшировать навсегда.
+
+    Один блоб могут использовать несколько объектов, поэтому delete() не
+    удаляет блоб, на который есть ссылки (см. core/media.py): удаление
+    происходит, когда счётчик ссылок в MediaBlob падает до нуля.
+
+    save() отдаёт имя блоба раньше, чем вызывающий возьмёт на него ссылку,
+    поэтому блоб, сохранённый (или найденный готовым) меньше
+    MEDIA_PURGE_GRACE_PERIOD секунд назад, не удаляется даже без ссылок.
+    Проверка и удаление идут под той же блокировкой, что и сохранение.
+    """
+    _thread_lock = threading.Lock()
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, коллизий имён не бывает
+        return name
+
+    def _write_temp(self, content):
+        """Пишет содержимое во временный файл, попутно хешируя. Возвращает (путь, sha256)."""
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return temp_path, hasher.hexdigest()
+
+    @contextmanager
+    def _blob_lock(self):
+        # Потоки процесса - через threading.Lock, процессы - через flock на общем файле
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.path(TEMP_DIR), exist_ok=True)
+            with open(self.path(LOCK_FILE), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def _place(self, temp_path, name):
+        """
+        Переносит временный файл на место name. Если такой файл уже есть,
+        обновляет время его изменения: это защищает его от purge_unused.
+        """
+        path = self.path(name)
+        with self._blob_lock():
+            if os.path.exists(path):
+                os.utime(path)
+                os.unlink(temp_path)
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+            # os.replace сохраняет время временного файла, а оно могло отстать
+            os.utime(path)
+
+    def _save(self, name, content):
+        extension = blob_extension(name)
+        temp_path, digest = self._write_temp(content)
+        try:
+            blob_name = f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+            self._place(temp_path, blob_name)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return blob_name
+
+    def save_companion(self, name, suffix, content):
+        """
+        Сохраняет производный вариант блоба (например, br-сжатие) под именем
+        name + suffix. Вариант живёт и удаляется вместе с основным блобом.
+        """
+        temp_path, _ = self._write_temp(content)
+        try:
+            self._place(temp_path, name + suffix)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name + suffix
+
+    def delete(self, name):
+        if is_referenced(name):
+            return
+        self.purge_unused(name)
+
+    def purge_unused(self, name):
+        """
+        Удаляет блоб, если его не сохраняли последние MEDIA_PURGE_GRACE_PERIOD
+        секунд. Счётчик ссылок проверяет вызывающий. Возвращает True, если
+        файла больше нет.
+        """
+        grace = getattr(settings, 'MEDIA_PURGE_GRACE_PERIOD', 0)
+        with self._blob_lock():
+            try:
+                modified = os.path.getmtime(self.path(name))
+            except FileNotFoundError:
+                modified = None
+            if modified is not None and time.time() - modified < grace:
+                return False
+            self.purge(name)
+        return True
+
+    def purge(self, name):
+        """Физически удаляет файл вместе с вариантами, не глядя на счётчик ссылок."""
+        super().delete(name)
+        for suffix in COMPANION_SUFFIXES:
+            super().delete(name + suffix)
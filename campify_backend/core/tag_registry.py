@@ -0,0 +1,76 @@
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Tag
+from .response_cache import bump_on_commit
+
+
+class TagRegistry:
+    """
+    Словарь имя тега -> id в памяти процесса.
+
+    Таблица тегов маленькая и почти не меняется, поэтому загружается целиком
+    один раз. Неизвестные имена дочитываются одним запросом, а недостающие
+    теги создаются одним bulk_create(ignore_conflicts=True); кэш ответов со
+    списком тегов сбрасывается, только если создавать что-то пришлось. Сигналы модели Tag
+    увеличивают номер версии в общем кэше, и остальные процессы перечитывают
+    словарь при следующем обращении.
+    """
+    version_key = 'tag_registry_version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = None
+        self._version = None
+
+    def _ensure_loaded(self):
+        version = cache.get(self.version_key, 0)
+        with self._lock:
+            if self._ids is not None and self._version == version:
+                return
+        ids = dict(Tag.objects.values_list('name', 'id'))
+        with self._lock:
+            self._ids, self._version = ids, version
+
+    def _remember(self, ids):
+        with self._lock:
+            if self._ids is not None:
+                self._ids.update(ids)
+
+    def invalidate(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+        with self._lock:
+            self._ids = None
+
+    def resolve(self, names, create=True):
+        """Возвращает {имя: id} для переданных имён, при create=True создавая недостающие теги."""
+        names = list(dict.fromkeys(names))
+        self._ensure_loaded()
+        with self._lock:
+            ids = {name: self._ids[name] for name in names if name in self._ids}
+        missing = [name for name in names if name not in ids]
+        if not missing:
+            return ids
+
+        # Сначала дочитываем теги, которые уже создал другой процесс
+        found = dict(Tag.objects.filter(name__in=missing).values_list('name', 'id'))
+        absent = [name for name in missing if name not in found]
+        if create and absent:
+            # Тег, вставленный кем-то между SELECT и INSERT, ignore_conflicts пропустит, а SELECT ниже найдёт.
+            # bulk_create не шлёт post_save, поэтому кэш ответов со списком тегов сбрасываем сами,
+            # но только когда действительно было что создавать
+            Tag.objects.bulk_create([Tag(name=name) for name in absent], ignore_conflicts=True)
+            bump_on_commit('tags')
+            found.update(Tag.objects.filter(name__in=absent).values_list('name', 'id'))
+        ids.update(found)
+        # Запоминаем только закоммиченные теги, иначе откат оставит в словаре несуществующие id
+        transaction.on_commit(lambda: self._remember(found))
+        return ids
+
+
+tag_registry = TagRegistry()
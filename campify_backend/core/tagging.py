@@ -0,0 +1,233 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+
+class TagRule(NamedTuple):
+    """
+    Правило автотегов по тексту маршрута.
+
+    features - слова (подстроки) и регулярные выражения; правило срабатывает,
+    если в тексте найден хотя бы один признак. Правило без признаков
+    срабатывает всегда. requires/excludes - слово, которое обязано
+    присутствовать / отсутствовать в тексте.
+    """
+    tags: tuple
+    features: tuple = ()
+    requires: Optional[str] = None
+    excludes: Optional[str] = None
+
+
+DIFFICULTY_TAGS = {
+    1: ('новичок', 'легко'),
+    2: ('средне',),
+    3: ('опытный', 'сложно'),
+    4: ('профи', 'сложно'),
+}
+
+TYPE_TAGS = {
+    1: ('обустроенный',),
+    2: ('дикий', 'экстрим'),
+}
+
+# (верхняя граница длительности в часах включительно, тег)
+DURATION_TAGS = (
+    (8, '1_день'),
+    (18, 'выходные'),
+    (150, 'неделя'),
+    (None, 'экспедиция'),
+)
+
+# Порядок правил определяет порядок тегов в результате
+TEXT_RULES = (
+    TagRule(('пеший',), ('пешком', 'пеший', 'ногами')),
+    TagRule(('сплав',), ('сплав', 'байдарк', 'SUP')),
+    TagRule(('фото',), ('фото', 'пейзаж')),
+    TagRule(('пещеры',), ('пещер', 'ущель')),
+    TagRule(('релакс',), ('йог', 'медитац')),
+    TagRule(('глэмпинг', 'укрытие'), ('глэмпинг',)),
+    TagRule(('кемпинг',), ('кемпинг',)),
+    TagRule(('комфорт_авто', 'транспорт'), ('машин', 'авто', 'колес')),
+    TagRule(('аренда_снаряжение',), ('палатка', 'спальник'), requires='аренда'),
+    TagRule(('аренда_кухня',), ('газов', 'горелк'), requires='аренда'),
+    TagRule(('аренда_транспорт',), ('байдар', 'велосипед'), requires='аренда'),
+    TagRule(('без_аренды',), excludes='аренда'),
+    TagRule(('горы',), ('гора', 'горы')),
+    TagRule(('вода',), ('озер', 'рек', 'мор', 'водоем')),
+    TagRule(('лес',), ('лес', re.compile(r'\bрощ[аеиуыюя]\b'), 'бор')),
+    TagRule(('история',), ('истор', 'заброшк', 'петроглиф')),
+    TagRule(('секретные',), ('малоизвест', 'секрет')),
+    TagRule(('взрослые',), ('один', 'друзья')),
+    TagRule(('дети',), (re.compile(r'\bдет(и|ям|ями|ях)\b'), re.compile(r'\bреб(ё|е)н(ка|ок|ку|ке)\b'))),
+    TagRule(('с_собакой',), ('собак', 'пёс')),
+    TagRule(('группа',), ('групп', 'гид')),
+    TagRule(('лето',), ('летом', 'лет')),
+    TagRule(('осень',), ('осень',)),
+    TagRule(('зима',), ('зим',)),
+    TagRule(('весна',), ('весн',)),
+    TagRule(('экстрим',), ('экстрим',)),
+    TagRule(('природа',), ('природ',)),
+    TagRule(('культура',), ('культур',)),
+)
+
+
+def _trie_pattern(words):
+    """
+    Собирает из слов одно регулярное выражение в виде префиксного дерева.
+    Продолжения перебираются раньше конца слова, поэтому в каждой позиции
+    находится самое длинное слово из набора.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in node.items() if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return build(trie)
+
+
+# Сколько результатов разбора отдельных слов держит TagMatcher
+WORD_CACHE_SIZE = 50_000
+# Тексты длиннее (в символах) проверяются поиском подстрок по всему тексту:
+# на них разбиение на слова дороже, чем проходы str.find, которые к тому же
+# останавливаются на первом вхождении (см. benchmark_tagger)
+LONG_TEXT_CHARS = 20_000
+
+
+class TagMatcher:
+    """
+    Компилирует таблицу TagRule один раз при импорте в одно регулярное
+    выражение, которое за один проход находит все признаки правил и слова
+    условий requires/excludes.
+
+    Слова собраны в префиксное дерево под одной опережающей проверкой:
+    в каждой позиции берётся самое длинное слово, а более короткие слова,
+    начинающиеся там же, восстанавливаются по его префиксам. Регулярные
+    признаки проверяются в той же позиции отдельными необязательными
+    опережающими проверками, поэтому перекрывающиеся вхождения не теряются.
+
+    Признаки не содержат пробелов, поэтому текст за один проход делится на
+    слова, и выражение применяется к каждому уникальному слову. Результат
+    для слова кэшируется: словоформы повторяются и внутри описания, и между
+    маршрутами. Длинные тексты (LONG_TEXT_CHARS) на слова не делятся: признаки
+    правил ищутся в тексте целиком, с остановкой на первом найденном.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._words = tuple(dict.fromkeys(
+            [feature for rule in rules for feature in rule.features if isinstance(feature, str)]
+            + [word for rule in rules for word in (rule.requires, rule.excludes) if word is not None]
+        ))
+        regexes = tuple(dict.fromkeys(
+            feature for rule in rules for feature in rule.features if not isinstance(feature, str)
+        ))
+        lookaheads = [('words', _trie_pattern(self._words))] + [
+            (f'regex{index}', regex.pattern) for index, regex in enumerate(regexes)
+        ]
+        # Ветка i начинается с обязательной проверки i-го шаблона и пробует
+        # все следующие; шаблоны до i в этой позиции уже не совпали
+        branches = []
+        for start, (first, pattern) in enumerate(lookaheads):
+            parts = [f'(?=(?P<{first}_{start}>{pattern}))']
+            parts += [f'(?:(?=(?P<{name}_{start}>{rest})))?' for name, rest in lookaheads[start + 1:]]
+            branches.append(''.join(parts))
+        self._pattern = re.compile('|'.join(branches))
+        # Позиция группы в кортеже findall -> признак (None для группы слов)
+        features = {'words': None}
+        features.update((f'regex{index}', regex) for index, regex in enumerate(regexes))
+        self._columns = tuple(
+            (index - 1, features[name.rpartition('_')[0]])
+            for name, index in self._pattern.groupindex.items()
+        )
+        self._compiled = tuple(
+            (rule.tags, rule.features, rule.requires, rule.excludes) for rule in rules
+        )
+        self._word_features = lru_cache(maxsize=WORD_CACHE_SIZE)(self._scan)
+
+    def _scan(self, word):
+        """Признаки и слова условий, найденные в одном слове текста."""
+        matches = self._pattern.findall(word)
+        if not matches:
+            return frozenset()
+        columns = tuple(zip(*matches))
+        found = set()
+        for index, feature in self._columns:
+            column = columns[index]
+            if feature is not None:
+                if any(column):
+                    found.add(feature)
+                continue
+            # Самое длинное слово в позиции покрывает все свои префиксы из набора
+            for match in set(column) - {''}:
+                found.update(word for word in self._words if match.startswith(word))
+        return frozenset(found)
+
+    def clear_cache(self):
+        self._word_features.cache_clear()
+
+    def find(self, text):
+        """Возвращает множество признаков и слов условий, найденных в тексте."""
+        return set().union(*map(self._word_features, set(text.split())))
+
+    def match(self, text):
+        """Возвращает теги текстовых правил в порядке таблицы правил."""
+        if len(text) > LONG_TEXT_CHARS:
+            return self.match_substrings(text)
+        return self.match_words(text)
+
+    def match_words(self, text):
+        """match() через поиск по словам с кэшем (для текстов до LONG_TEXT_CHARS)."""
+        return self._tags(self.find(text).__contains__)
+
+    def match_substrings(self, text):
+        """match() через поиск подстрок по всему тексту (для длинных текстов)."""
+        return self._tags(self._substring_lookup(text))
+
+    @staticmethod
+    def _substring_lookup(text):
+        seen = {}
+
+        def contains(feature):
+            if feature not in seen:
+                seen[feature] = feature in text if isinstance(feature, str) else feature.search(text) is not None
+            return seen[feature]
+        return contains
+
+    def _tags(self, contains):
+        tags = []
+        for rule_tags, features, requires, excludes in self._compiled:
+            if requires is not None and not contains(requires):
+                continue
+            if excludes is not None and contains(excludes):
+                continue
+            if not features or any(map(contains, features)):
+                tags.extend(rule_tags)
+        return tags
+
+
+text_matcher = TagMatcher(TEXT_RULES)
+
+
+def create_tags_for_route(data):
+    tags = list(DIFFICULTY_TAGS.get(data.get('difficulty'), ()))
+    tags.extend(TYPE_TAGS.get(data.get('type'), ()))
+
+    if data.get('duration'):
+        total_hours = data['duration'].total_seconds() // 3600
+        for max_hours, tag in DURATION_TAGS:
+            if max_hours is None or total_hours <= max_hours:
+                tags.append(tag)
+                break
+
+    text = f"{data.get('description', '') or ''} {data.get('name', '') or ''}".lower()
+    tags.extend(text_matcher.match(text))
+    return tags
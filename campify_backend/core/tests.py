@@ -1,3 +1,2303 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+import numpy as np
+from PIL import Image
+from rest_framework.test import APIClient
+
+from . import media, search, urls
+from .models import (
+    Checklist, ChecklistItems, FavoriteRoute, Item, MapPoint, MediaBlob, PointReview, Role, Route, RoutePhoto,
+    RouteGeometry, RouteReview, Tag, User, UserTagPreference,
+)
+from .gpx import TrackMetrics, haversine_km, iter_point_batches, measure_track
+from .downloads import MAX_RANGES, parse_ranges
+from .geo import assign_grid_cells, nearest
+from .geometry import (
+    GEOMETRY_LEVELS, douglas_peucker, encode_polyline, level_for_zoom, simplify_track, store_route_geometry,
+)
+from .images import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, generate_derivatives, render_derivatives
+from .preferences import apply_route_view, set_initial_preferences
+from .recommendations import RouteTagMatrix, recommendation_engine
+from .response_cache import CacheLock, FileLock, get_or_build, namespace_versions, rebuild_lock
+from .route_filters import DURATION_BUCKETS, LENGTH_BUCKETS, MAX_TAGS
+from .seeding import seed_benchmark_data
+from .serializers import PhotoModerationSerializer, RouteListSerializer, RouteSerializer
+from .storage import ContentAddressedStorage
+from .tag_registry import tag_registry
+from .tagging import LONG_TEXT_CHARS, TEXT_RULES, create_tags_for_route, text_matcher
+from .view_counter import ViewCounter, view_counter
+from .views.media_views import IMMUTABLE_CACHE_CONTROL
+
+
+# Прежняя реализация из RouteListCreateView с отдельной проверкой каждого
+# слова: эталон для тестов эквивалентности автотеггера.
+def create_tags_for_route_legacy(data):
+    tags = []
+
+    if data.get('difficulty') == 1:
+        tags.append('новичок')
+        tags.append('легко')
+    elif data.get('difficulty') == 2:
+        tags.append('средне')
+    elif data.get('difficulty') == 3:
+        tags.append('опытный')
+        tags.append('сложно')
+    elif data.get('difficulty') == 4:
+        tags.append('профи')
+        tags.append('сложно')
+
+    if data.get('type') == 1:
+        tags.append('обустроенный')
+    elif data.get('type') == 2:
+        tags.append('дикий')
+        tags.append('экстрим')
+
+    if data.get('duration'):
+        duration = data['duration']
+        total_hours = duration.total_seconds() // 3600
+        if total_hours <= 8:
+            tags.append('1_день')
+        elif 8 < total_hours <= 18:
+            tags.append('выходные')
+        elif 18 < total_hours <= 150:
+            tags.append('неделя')
+        else:
+            tags.append('экспедиция')
+
+    text = f"{data.get('description', '') or ''} {data.get('name', '') or ''}".lower()
+
+    if 'пешком' in text or 'пеший' in text or 'ногами' in text:
+        tags.append('пеший')
+    if 'сплав' in text or 'байдарк' in text or 'SUP' in text:
+        tags.append('сплав')
+    if 'фото' in text or 'пейзаж' in text:
+        tags.append('фото')
+    if 'пещер' in text or 'ущель' in text:
+        tags.append('пещеры')
+    if 'йог' in text or 'медитац' in text:
+        tags.append('релакс')
+
+    if 'глэмпинг' in text:
+        tags.append('глэмпинг')
+        tags.append('укрытие')
+    if 'кемпинг' in text:
+        tags.append('кемпинг')
+
+
+    if 'машин' in text or 'авто' in text or 'колес' in text:
+        tags.append('комфорт_авто')
+        tags.append('транспорт')
+
+    if 'аренда' in text:
+        if 'палатка' in text or 'спальник' in text:
+            tags.append('аренда_снаряжение')
+        if 'газов' in text or 'горелк' in text:
+            tags.append('аренда_кухня')
+        if 'байдар' in text or 'велосипед' in text:
+            tags.append('аренда_транспорт')
+    else:
+        tags.append('без_аренды')
+
+    if 'гора' in text or 'горы' in text:
+        tags.append('горы')
+    if 'озер' in text or 'рек' in text or 'мор' in text  or 'водоем' in text:
+        tags.append('вода')
+    if 'лес' in text or re.search(r'\bрощ[аеиуыюя]\b', text) or 'бор' in text:
+        tags.append('лес')
+    if 'истор' in text or 'заброшк' in text or 'петроглиф' in text:
+        tags.append('история')
+    if 'малоизвест' in text or 'секрет' in text:
+        tags.append('секретные')
+
+    if 'один' in text or 'друзья' in text:
+        tags.append('взрослые')
+    if (re.search(r'\bдет(и|ям|ями|ях)\b', text) or
+            re.search(r'\bреб(ё|е)н(ка|ок|ку|ке)\b', text)):
+        tags.append('дети')
+    if 'собак' in text or 'пёс' in text:
+        tags.append('с_собакой')
+    if 'групп' in text or 'гид' in text:
+        tags.append('группа')
+
+    if 'летом' in text or 'лет' in text:
+        tags.append('лето')
+    if 'осень' in text:
+        tags.append('осень')
+    if 'зим' in text:
+        tags.append('зима')
+    if 'весн' in text:
+        tags.append('весна')
+
+    if 'экстрим' in text:
+        tags.append('экстрим')
+    if 'природ' in text:
+        tags.append('природа')
+    if 'культур' in text:
+        tags.append('культура')
+
+    return tags
+
+
+class CreateTagsForRouteTests(SimpleTestCase):
+    """Табличный автотеггер должен давать ровно тот же список тегов, что и прежняя функция."""
+
+    EDGE_TEXTS = [
+        '',
+        'Роща у реки, дети и собака',
+        'рощами не считается, детишки тоже, ребёнка берём',
+        'Ребенок, ребёнок: дети! деть',
+        'Аренда: палатка, газовая горелка и байдарка',
+        'аренда велосипеда',
+        'SUP-сплав по озеру',
+        'Поедем на машине, колесо запасное',
+        'гораздо интереснее летом, чем осенью',
+        'ГЛЭМПИНГ и КЕМПИНГ зимой',
+        'экстрим, природа, культура, история, петроглифы',
+        'малоизвестный секретный бор; один или с друзьями; группа с гидом',
+        'пешком ногами пеший',
+        'йога и медитация на фоне пейзажа, пещеры и ущелья',
+        'лесной бор летом, байдарками по рекам; аренда байдарки',
+        'роща\xa0дети\tребёнка\nрощу—детям',
+        'горыгора пешкомпеший озёра-озеро',
+    ]
+
+    def make_corpus(self):
+        words = [feature for rule in TEXT_RULES for feature in rule.features if isinstance(feature, str)]
+        words += [
+            'роща', 'рощу', 'рощами', 'дети', 'детям', 'детский', 'ребёнка', 'ребенок', 'ребята',
+            'аренда', 'маршрут', 'тропа', 'берег', 'озеро', 'Горы', 'ЛЕС', 'летом', 'вдоль', 'к',
+        ]
+        separators = [' ', ', ', '. ', '-', '', '\n', '!']
+        rng = random.Random(20240501)
+        corpus = []
+        for _ in range(500):
+            parts = []
+            for _ in range(rng.randint(0, 40)):
+                parts.append(rng.choice(words))
+                parts.append(rng.choice(separators))
+            corpus.append(''.join(parts))
+        return corpus
+
+    def assertSameTags(self, data):
+        self.assertEqual(create_tags_for_route(data), create_tags_for_route_legacy(data), data)
+
+    def test_edge_texts(self):
+        for text in self.EDGE_TEXTS:
+            with self.subTest(text=text):
+                self.assertSameTags({'description': text, 'name': text[::-1]})
+
+    def test_random_corpus(self):
+        rng = random.Random(7)
+        for text in self.make_corpus():
+            self.assertSameTags({
+                'name': rng.choice(['', None, 'Поход']),
+                'description': text,
+                'difficulty': rng.choice([None, 1, 2, 3, 4, 5]),
+                'type': rng.choice([None, 1, 2, 3]),
+            })
+
+    def test_both_search_paths_agree(self):
+        for text in self.EDGE_TEXTS + self.make_corpus():
+            text = text.lower()
+            with self.subTest(text=text):
+                self.assertEqual(text_matcher.match_words(text), text_matcher.match_substrings(text))
+
+    def test_long_texts(self):
+        corpus = self.make_corpus()
+        rng = random.Random(11)
+        for _ in range(20):
+            text = ' '.join(rng.sample(corpus, 300))
+            # Без «аренды» и с ней: правила requires/excludes на длинном тексте
+            for description in (text.replace('аренда', 'прокат'), text + ' аренда велосипеда'):
+                self.assertGreater(len(description), LONG_TEXT_CHARS)
+                self.assertSameTags({'description': description, 'name': 'Поход'})
+        with mock.patch.object(text_matcher, 'match_words') as match_words:
+            create_tags_for_route({'description': 'лес ' * LONG_TEXT_CHARS})
+        match_words.assert_not_called()
+
+    def test_missing_fields(self):
+        self.assertSameTags({})
+        self.assertSameTags({'description': None, 'name': None})
+
+    def test_duration_boundaries(self):
+        for hours in [0, 1, 8, 8.99, 9, 18, 18.5, 19, 150, 150.99, 151, 1000]:
+            with self.subTest(hours=hours):
+                self.assertSameTags({'duration': timedelta(hours=hours), 'description': 'лес'})
+        self.assertSameTags({'duration': timedelta(0)})
+
+
+def gpx_document(*segments, times=()):
+    """GPX с отрезками из точек (lat, lon, ele); times - время точек по порядку."""
+    times = iter(times)
+    body = ''
+    for segment in segments:
+        points = ''
+        for lat, lon, ele in segment:
+            moment = next(times, None)
+            points += (f'<trkpt lat="{lat}" lon="{lon}"><ele>{ele}</ele>'
+                       + (f'<time>{moment}</time>' if moment else '') + '</trkpt>')
+        body += f'<trkseg>{points}</trkseg>'
+    return f'<?xml version="1.0"?><gpx version="1.1"><trk>{body}</trk></gpx>'.encode()
+
+
+class TrackMetricsTests(SimpleTestCase):
+    FIRST = [(56.0, 37.0, 100), (56.01, 37.0, 120), (56.02, 37.0, 110)]
+    # Второй отрезок начинается в 100 км и на 500 м выше конца первого
+    SECOND = [(57.0, 37.0, 610), (57.01, 37.0, 630)]
+
+    def path_km(self, points):
+        lat, lon = np.array([p[0] for p in points]), np.array([p[1] for p in points])
+        return float(haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+    def test_gap_between_segments_is_not_counted(self):
+        document = gpx_document(self.FIRST, self.SECOND)
+        expected_km = self.path_km(self.FIRST) + self.path_km(self.SECOND)
+        # Граница отрезка внутри пачки и на стыке пачек
+        for batch_size in (1, 2, 3, 4096):
+            with self.subTest(batch_size=batch_size):
+                metrics = TrackMetrics()
+                for batch in iter_point_batches(io.BytesIO(document), batch_size):
+                    metrics.add(batch)
+                self.assertAlmostEqual(metrics.length_km, expected_km, places=6)
+                self.assertEqual(metrics.elevation_gain, 40)
+                self.assertEqual(metrics.point_count, 5)
+                self.assertEqual(metrics.max_height, 630)
+
+    def test_single_segment_unchanged(self):
+        metrics = measure_track(io.BytesIO(gpx_document(self.FIRST + self.SECOND)))
+        self.assertAlmostEqual(metrics.length_km, self.path_km(self.FIRST + self.SECOND), places=6)
+        self.assertEqual(metrics.elevation_gain, 540)
+
+    def test_mixed_naive_and_aware_times(self):
+        cases = [
+            (('2024-05-01T08:00:00Z', '2024-05-01T10:30:00'), timedelta(hours=2, minutes=30)),
+            (('2024-05-01T08:00:00', '2024-05-01T12:00:00+03:00'), timedelta(hours=1)),
+            (('2024-05-01T08:00:00+03:00', '2024-05-01T08:00:00'), timedelta(hours=3)),
+            (('2024-05-01T10:00:00Z', '2024-05-01T08:00:00'), None),
+            (('2024-05-01T08:00:00', 'вчера'), None),
+        ]
+        for times, expected in cases:
+            with self.subTest(times=times):
+                points = [(56.0, 37.0, 100), (56.01, 37.0, 120)]
+                metrics = measure_track(io.BytesIO(gpx_document(points, times=times)))
+                self.assertEqual(metrics.duration, expected)
+
+    def test_track_without_elevation_keeps_route_heights(self):
+        document = (
+            '<?xml version="1.0"?><gpx version="1.1"><trk><trkseg>'
+            '<trkpt lat="56.0" lon="37.0"></trkpt><trkpt lat="56.01" lon="37.0"></trkpt>'
+            '</trkseg></trk></gpx>'
+        ).encode()
+        route = Route(height=850, elevation_gain=420.0, duration=timedelta(hours=5), length_in_km=99)
+        metrics = measure_track(io.BytesIO(document))
+        self.assertIsNone(metrics.max_height)
+        metrics.apply_to(route)
+        self.assertEqual((route.height, route.elevation_gain, route.duration), (850, 420.0, timedelta(hours=5)))
+        self.assertAlmostEqual(route.length_in_km, 1.112, places=3)
+        self.assertEqual((route.start_latitude, route.end_latitude), (56.0, 56.01))
+
+        measure_track(io.BytesIO(gpx_document(self.FIRST))).apply_to(route)
+        self.assertEqual((route.height, route.elevation_gain), (120, 20.0))
+
+
+def png_bytes(color=(30, 90, 160)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def decode_polyline(encoded, precision=5):
+    values, value, shift = [], 0, 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    coords = np.cumsum(np.array(values).reshape(-1, 2), axis=0) / 10 ** precision
+    return coords[:, 0], coords[:, 1]
+
+
+class TrackGeometryTests(SimpleTestCase):
+    def test_google_polyline_vector(self):
+        lat, lon = [38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]
+        self.assertEqual(encode_polyline(lat, lon), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(encode_polyline([], []), '')
+        decoded_lat, decoded_lon = decode_polyline(encode_polyline(lat, lon))
+        np.testing.assert_allclose(decoded_lat, lat)
+        np.testing.assert_allclose(decoded_lon, lon)
+
+    def test_douglas_peucker_drops_collinear_points(self):
+        x = np.arange(10, dtype=np.float64)
+        self.assertEqual(douglas_peucker(x, 2 * x, 0.01).tolist(), [0, 9])
+        self.assertEqual(douglas_peucker(x[:2], x[:2], 1).tolist(), [0, 1])
+
+    def test_douglas_peucker_keeps_endpoints_and_corners(self):
+        x = np.array([0, 1, 2, 3, 4, 5, 6], dtype=np.float64)
+        y = np.array([0, 0.1, 0, 5, 0, -0.1, 0], dtype=np.float64)
+        self.assertEqual(douglas_peucker(x, y, 1).tolist(), [0, 2, 3, 4, 6])
+        self.assertEqual(douglas_peucker(x, y, 0.05).tolist(), [0, 1, 2, 3, 4, 5, 6])
+        self.assertEqual(douglas_peucker(x, y, 10).tolist(), [0, 6])
+        # Замкнутая петля: начало и конец совпадают, расстояние считается до точки
+        loop = douglas_peucker(np.array([0.0, 3, 3, 0]), np.array([0.0, 0, 3, 0]), 1)
+        self.assertEqual(loop.tolist(), [0, 1, 2, 3])
+
+    def test_levels_coarsen_monotonically(self):
+        steps = np.arange(2000)
+        lat = 56 + steps * 1e-4
+        lon = 37 + 0.01 * np.sin(steps / 40)
+        levels = simplify_track(lat, lon)
+        self.assertEqual([level for level, *_ in levels], list(range(len(GEOMETRY_LEVELS))))
+        counts = [point_count for _, _, _, point_count, _ in levels]
+        self.assertEqual(counts, sorted(counts))
+        self.assertLess(counts[0], counts[-1])
+        self.assertLessEqual(counts[-1], len(steps))
+        for _, _, _, point_count, polyline in levels:
+            decoded_lat, decoded_lon = decode_polyline(polyline)
+            self.assertEqual(len(decoded_lat), point_count)
+            self.assertEqual((decoded_lat[0], decoded_lon[0]), (round(lat[0], 5), round(lon[0], 5)))
+            self.assertEqual((decoded_lat[-1], decoded_lon[-1]), (round(lat[-1], 5), round(lon[-1], 5)))
+        self.assertEqual(simplify_track([], []), [])
+
+    def test_level_for_zoom(self):
+        for zoom, level in ((-1, 0), (0, 0), (5, 0), (6, 1), (8, 1), (9, 2), (12, 3), (15, 4), (22, 4)):
+            with self.subTest(zoom=zoom):
+                self.assertEqual(level_for_zoom(zoom), level)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class RouteGeometryViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='geometry', email='geometry@example.com', password='password')
+        cls.route = Route.objects.create(name='Трек', location_area='Область', author=cls.user, is_public=True)
+        steps = np.arange(2000)
+        store_route_geometry(cls.route, 56 + steps * 1e-4, 37 + 0.01 * np.sin(steps / 40))
+        cls.levels = {geometry.level: geometry for geometry in RouteGeometry.objects.filter(route=cls.route)}
+
+    def geometry(self, route_id, **params):
+        return self.client.get(reverse('route-geometry', kwargs={'pk': route_id}), params)
+
+    def test_zoom_picks_level(self):
+        for params, level in (({}, len(GEOMETRY_LEVELS) - 1), ({'zoom': 3}, 0), ({'zoom': 10}, 2), ({'zoom': 30}, 4)):
+            with self.subTest(params=params):
+                response = self.geometry(self.route.id, **params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['level'], level)
+                self.assertEqual(response.data['polyline'], self.levels[level].polyline)
+                self.assertEqual(response.data['point_count'], self.levels[level].point_count)
+        self.assertEqual(self.geometry(self.route.id, zoom='близко').status_code, 400)
+
+    def test_missing_geometry(self):
+        bare = Route.objects.create(name='Без трека', location_area='Область', author=self.user)
+        response = self.geometry(bare.id)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['detail'], 'Геометрия трека не рассчитана.')
+        response = self.geometry(bare.id + 1000)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['detail'], 'Маршрут не найден.')
+
+    def test_restore_replaces_levels(self):
+        store_route_geometry(self.route, [56.0, 56.1], [37.0, 37.1])
+        response = self.geometry(self.route.id, zoom=3)
+        self.assertEqual(response.data['point_count'], 2)
+        self.assertEqual(RouteGeometry.objects.filter(route=self.route).count(), len(GEOMETRY_LEVELS))
+
+
+def gpx_bytes(points=50):
+    track = ''.join(
+        f'<trkpt lat="{56 + i * 0.001:.5f}" lon="{37 + i * 0.0015:.5f}"><ele>{150 + i % 7}</ele></trkpt>'
+        for i in range(points)
+    )
+    return (
+        '<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        f'<trk><trkseg>{track}</trkseg></trk></gpx>'
+    ).encode()
+
+
+PDF_BYTES = b'%PDF-1.4\n%%EOF\n'
+unique = count()
+
+
+def route_data(test, scale):
+    return {'name': 'Маршрут у озера', 'description': 'Сосновый бор, стоянка у реки, с детьми',
+            'location_area': 'Тверская область', 'difficulty': 2, 'type': 1, 'length_in_km': 12.5,
+            'author': test.user.id, 'is_public': True}
+
+
+def fresh_route(test, scale):
+    """Маршрут с зависимыми объектами, число которых растёт вместе с данными (для проверки каскадов)."""
+    route = Route.objects.create(name='Удаляемый', location_area='Область', author=test.user)
+    route.tags.set(test.tags[:scale])
+    for _ in range(scale):
+        RouteReview.objects.create(route=route, user=test.user, rating=4)
+        RoutePhoto.objects.create(route=route, image=test.image_name)
+        point = MapPoint.objects.create(route=route, type='camp', latitude=56, longitude=37, name='Точка')
+        PointReview.objects.create(point=point, user=test.user, rating=5)
+        Checklist.objects.create(name=f'Удаляемый {next(unique)}', pdf_url=test.pdf_name, route_id=route)
+    return route
+
+
+def fresh_point(test, scale, with_image=False):
+    point = MapPoint.objects.create(route=test.route, type='camp', latitude=56.1, longitude=37.1, name='Точка')
+    for _ in range(scale):
+        PointReview.objects.create(point=point, user=test.user, rating=5)
+    if with_image:
+        point.image = test.image_name
+        point.save()
+    return point
+
+
+def fresh_checklist(test, scale):
+    checklist = Checklist.objects.create(name=f'Удаляемый {next(unique)}', pdf_url=test.pdf_name, route_id=test.route)
+    ChecklistItems.objects.bulk_create(
+        [ChecklistItems(checklist_id=checklist, item_id=test.item, quantity=1) for _ in range(scale)]
+    )
+    return checklist
+
+
+def upload(name, content):
+    return SimpleUploadedFile(name, content)
+
+
+def format_queries(queries):
+    return '\n'.join(f'{number:>4}. {sql}' for number, sql in enumerate(queries, 1))
+
+
+# Запрос к эндпоинту: (шаблон URL, метод) -> функция (тест, масштаб) -> (аргументы URL, данные запроса)
+ENDPOINT_REQUESTS = {
+    ('login/', 'POST'): lambda t, s: ({}, {'email': t.user.email, 'password': 'password'}),
+    ('register/', 'POST'): lambda t, s: ({}, {'username': f'new{next(unique)}', 'email': f'new{next(unique)}@example.com',
+                                              'password': 'password'}),
+    ('users/<str:user_id>/', 'GET'): lambda t, s: ({'user_id': t.user.id}, {}),
+    ('users/<int:user_id>/favorite_routes/', 'GET'): lambda t, s: ({'user_id': t.user.id}, {}),
+    ('user/preferences/create', 'POST'): lambda t, s: ({}, {'user_id': t.user.id, 'tags': [tag.name for tag in t.tags]}),
+    ('user/preferences/update', 'POST'): lambda t, s: ({}, {'user_id': t.user.id, 'route_id': t.route.id}),
+    ('roles/', 'GET'): lambda t, s: ({}, {}),
+    ('roles/', 'POST'): lambda t, s: ({}, {'name': 'Гид'}),
+    ('roles/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.role.id}, {}),
+    ('roles/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.role.id}, {'name': 'Модератор'}),
+    ('roles/<int:pk>/', 'DELETE'): lambda t, s: ({'pk': Role.objects.create(name='Временная').id}, {}),
+    ('routes/', 'GET'): lambda t, s: ({}, {}),
+    ('routes/', 'POST'): lambda t, s: ({}, route_data(t, s)),
+    ('routes/equip/', 'GET'): lambda t, s: ({}, {}),
+    ('routes/wild/', 'GET'): lambda t, s: ({}, {}),
+    ('routes/nearby/', 'GET'): lambda t, s: ({}, {'lat': 56, 'lon': 37, 'radius_km': 500}),
+    ('routes/search/', 'GET'): lambda t, s: ({}, {'q': 'маршрут'}),
+    ('routes/filter/', 'GET'): lambda t, s: ({}, {'difficulty': '1,2,3,4', 'tags': t.tags[0].id, 'tags_mode': 'any'}),
+    ('routes/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('routes/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.route.id}, route_data(t, s)),
+    ('routes/<int:pk>/', 'PATCH'): lambda t, s: ({'pk': t.route.id}, {'name': 'Новое название'}),
+    ('routes/<int:pk>/', 'DELETE'): lambda t, s: ({'pk': fresh_route(t, s).id}, {}),
+    ('routes/<int:pk>/full/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('routes/<int:route_id>/reviews/', 'GET'): lambda t, s: ({'route_id': t.route.id}, {}),
+    ('routes/<int:id>/upload_gpx/', 'POST'): lambda t, s: ({'id': t.route.id}, {'gpx_file': upload('track.gpx', gpx_bytes())}),
+    ('routes/<int:pk>/geometry/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('routes/<int:pk>/gpx/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('routes/<int:pk>/checklist/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('routes/<int:pk>/download/gpx/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('routes/user/<int:user_id>/', 'GET'): lambda t, s: ({'user_id': t.user.id}, {}),
+    ('routes/recommendation/<int:user_id>', 'GET'): lambda t, s: ({'user_id': t.user.id}, {}),
+    ('route_photo/', 'GET'): lambda t, s: ({}, {}),
+    ('route_photo/unchecked/', 'GET'): lambda t, s: ({}, {}),
+    ('route_photo/moderate/', 'POST'): lambda t, s: ({}, {'items': [
+        {'id': photo.id, 'verdict': verdict}
+        for verdict in ('approve', 'reject')
+        for photo in RoutePhoto.objects.bulk_create([RoutePhoto(route=t.route, image=t.image_name) for _ in range(s)])
+    ]}),
+    ('route_photo/<int:pk>/', 'DELETE'): lambda t, s: ({'pk': RoutePhoto.objects.create(route=t.route, image=t.image_name).id}, {}),
+    ('routes/<int:pk>/photos/', 'GET'): lambda t, s: ({'pk': t.route.id}, {}),
+    ('route_photo/<int:id>/upload_image/', 'POST'): lambda t, s: ({'id': t.route.id}, {'image': upload('photo.png', png_bytes())}),
+    ('route_photo/<int:pk>/check/', 'PATCH'): lambda t, s: ({'pk': t.photo.id}, {'is_checked': True}),
+    ('route_reviews/', 'POST'): lambda t, s: ({}, {'route': t.route.id, 'user': t.user.id, 'rating': 4, 'comment': 'Хорошо'}),
+    ('route_reviews/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.review.id}, {}),
+    ('route_reviews/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.review.id}, {'route': t.route.id, 'user': t.user.id, 'rating': 3}),
+    ('route_reviews/<int:pk>/', 'DELETE'): lambda t, s: (
+        {'pk': RouteReview.objects.create(route=t.route, user=t.user, rating=5).id}, {}),
+    ('map_points/', 'GET'): lambda t, s: ({}, {}),
+    ('map_points/', 'POST'): lambda t, s: ({}, {'route': t.route.id, 'type': 'camp', 'latitude': 56.2, 'longitude': 37.2,
+                                                'name': 'Стоянка'}),
+    ('map_points/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.point.id}, {}),
+    ('map_points/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.point.id}, {'route': t.route.id, 'type': 'water',
+                                                                        'latitude': 56.3, 'longitude': 37.3, 'name': 'Родник'}),
+    ('map_points/<int:pk>/', 'PATCH'): lambda t, s: ({'pk': t.point.id}, {'name': 'Родник'}),
+    ('map_points/<int:pk>/', 'DELETE'): lambda t, s: ({'pk': fresh_point(t, s).id}, {}),
+    ('map_points/<int:map_points_id>/reviews/', 'GET'): lambda t, s: ({'map_points_id': t.point.id}, {}),
+    ('map_points/<int:pk>/photo/delete/', 'DELETE'): lambda t, s: ({'pk': fresh_point(t, s, with_image=True).id}, {}),
+    ('map_points/<int:pk>/photo_by_id/', 'GET'): lambda t, s: ({'pk': t.point.id}, {}),
+    ('map_points/<int:pk>/photo', 'POST'): lambda t, s: ({'pk': t.point.id}, {'image': upload('point.png', png_bytes())}),
+    ('point_reviews/', 'POST'): lambda t, s: ({}, {'point': t.point.id, 'user': t.user.id, 'rating': 4}),
+    ('point_reviews/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.point_review.id}, {}),
+    ('point_reviews/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.point_review.id}, {'point': t.point.id, 'user': t.user.id,
+                                                                                  'rating': 2}),
+    ('point_reviews/<int:pk>/', 'DELETE'): lambda t, s: (
+        {'pk': PointReview.objects.create(point=t.point, user=t.user, rating=1).id}, {}),
+    ('items/', 'GET'): lambda t, s: ({}, {}),
+    ('items/', 'POST'): lambda t, s: ({}, {'category': 'food', 'name': 'Гречка'}),
+    ('items/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.item.id}, {}),
+    ('items/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.item.id}, {'category': 'safety', 'name': 'Аптечка'}),
+    ('items/<int:pk>/', 'PATCH'): lambda t, s: ({'pk': t.item.id}, {'name': 'Аптечка'}),
+    ('items/<int:pk>/', 'DELETE'): lambda t, s: ({'pk': Item.objects.create(category='food', name='Соль').id}, {}),
+    ('checklists/upload/', 'POST'): lambda t, s: ({}, {'pdf_file': upload(f'checklist_{next(unique)}.pdf', PDF_BYTES)}),
+    ('checklists/', 'GET'): lambda t, s: ({}, {}),
+    ('checklists/', 'POST'): lambda t, s: ({}, {'name': 'Поход', 'pdf_url': upload('list.pdf', PDF_BYTES)}),
+    ('checklists/<int:pk>/', 'GET'): lambda t, s: ({'pk': t.checklist.id}, {}),
+    ('checklists/<int:pk>/', 'PUT'): lambda t, s: ({'pk': t.checklist.id}, {'name': t.checklist.name,
+                                                                             'pdf_url': upload('list.pdf', PDF_BYTES)}),
+    ('checklists/<int:pk>/', 'PATCH'): lambda t, s: ({'pk': t.checklist.id}, {'description': 'На выходные'}),
+    ('checklists/<int:pk>/', 'DELETE'): lambda t, s: ({'pk': fresh_checklist(t, s).id}, {}),
+    ('checklists/<int:checklist_id>/items/', 'GET'): lambda t, s: ({'checklist_id': t.checklist.id}, {}),
+    ('tags/', 'GET'): lambda t, s: ({}, {}),
+    ('tags/', 'POST'): lambda t, s: ({}, {'name': f'новый тег {next(unique)}'}),
+}
+
+# Эндпоинты, которые не проверяются, и почему
+UNCHECKED_ENDPOINTS = {
+    ('users/<str:username>/', 'GET'): 'перекрыт шаблоном users/<str:user_id>/ и недостижим',
+}
+
+# Бюджет SQL-запросов на один вызов эндпоинта. Бюджет поднимают только
+# осознанно: лишний запрос на каждый вызов - повод посмотреть SQL в ошибке
+QUERY_BUDGETS = {
+    ('login/', 'POST'): 6,
+    ('register/', 'POST'): 3,
+    ('users/<str:user_id>/', 'GET'): 1,
+    ('users/<int:user_id>/favorite_routes/', 'GET'): 1,
+    ('user/preferences/create', 'POST'): 7,
+    ('user/preferences/update', 'POST'): 8,
+    ('roles/', 'GET'): 1,
+    ('roles/', 'POST'): 1,
+    ('roles/<int:pk>/', 'GET'): 1,
+    ('roles/<int:pk>/', 'PUT'): 2,
+    ('roles/<int:pk>/', 'DELETE'): 3,
+    ('routes/', 'GET'): 2,
+    ('routes/', 'POST'): 5,
+    ('routes/equip/', 'GET'): 2,
+    ('routes/wild/', 'GET'): 2,
+    ('routes/nearby/', 'GET'): 3,
+    ('routes/search/', 'GET'): 4,
+    ('routes/filter/', 'GET'): 7,
+    ('routes/<int:pk>/', 'GET'): 5,
+    ('routes/<int:pk>/', 'PUT'): 5,
+    ('routes/<int:pk>/', 'PATCH'): 4,
+    ('routes/<int:pk>/', 'DELETE'): 20,
+    ('routes/<int:pk>/full/', 'GET'): 9,
+    ('routes/<int:route_id>/reviews/', 'GET'): 1,
+    ('routes/<int:id>/upload_gpx/', 'POST'): 7,
+    ('routes/<int:pk>/geometry/', 'GET'): 1,
+    ('routes/<int:pk>/gpx/', 'GET'): 1,
+    ('routes/<int:pk>/checklist/', 'GET'): 3,
+    ('routes/<int:pk>/download/gpx/', 'GET'): 1,
+    ('routes/user/<int:user_id>/', 'GET'): 2,
+    ('routes/recommendation/<int:user_id>', 'GET'): 3,
+    ('route_photo/', 'GET'): 1,
+    ('route_photo/unchecked/', 'GET'): 1,
+    ('route_photo/moderate/', 'POST'): 9,
+    ('route_photo/<int:pk>/', 'DELETE'): 4,
+    ('routes/<int:pk>/photos/', 'GET'): 1,
+    ('route_photo/<int:id>/upload_image/', 'POST'): 7,
+    ('route_photo/<int:pk>/check/', 'PATCH'): 4,
+    ('route_reviews/', 'POST'): 6,
+    ('route_reviews/<int:pk>/', 'GET'): 1,
+    ('route_reviews/<int:pk>/', 'PUT'): 7,
+    ('route_reviews/<int:pk>/', 'DELETE'): 5,
+    ('map_points/', 'GET'): 1,
+    ('map_points/', 'POST'): 3,
+    ('map_points/<int:pk>/', 'GET'): 1,
+    ('map_points/<int:pk>/', 'PUT'): 5,
+    ('map_points/<int:pk>/', 'PATCH'): 4,
+    ('map_points/<int:pk>/', 'DELETE'): 4,
+    ('map_points/<int:map_points_id>/reviews/', 'GET'): 1,
+    ('map_points/<int:pk>/photo/delete/', 'DELETE'): 9,
+    ('map_points/<int:pk>/photo_by_id/', 'GET'): 1,
+    ('map_points/<int:pk>/photo', 'POST'): 5,
+    ('point_reviews/', 'POST'): 3,
+    ('point_reviews/<int:pk>/', 'GET'): 1,
+    ('point_reviews/<int:pk>/', 'PUT'): 4,
+    ('point_reviews/<int:pk>/', 'DELETE'): 2,
+    ('items/', 'GET'): 1,
+    ('items/', 'POST'): 1,
+    ('items/<int:pk>/', 'GET'): 1,
+    ('items/<int:pk>/', 'PUT'): 2,
+    ('items/<int:pk>/', 'PATCH'): 2,
+    ('items/<int:pk>/', 'DELETE'): 3,
+    ('checklists/upload/', 'POST'): 4,
+    ('checklists/', 'GET'): 1,
+    ('checklists/', 'POST'): 3,
+    ('checklists/<int:pk>/', 'GET'): 1,
+    ('checklists/<int:pk>/', 'PUT'): 3,
+    ('checklists/<int:pk>/', 'PATCH'): 3,
+    ('checklists/<int:pk>/', 'DELETE'): 5,
+    ('checklists/<int:checklist_id>/items/', 'GET'): 1,
+    ('tags/', 'GET'): 1,
+    ('tags/', 'POST'): 2,
+}
+
+
+class TempMediaTestCase(TestCase):
+    """Тесты с файлами: MEDIA_ROOT - временный каталог, удаляемый после класса."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.addClassCleanup(cls.media_settings.disable)
+        super().setUpClass()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    VIEW_COUNTER_FLUSH_INTERVAL=0,
+    BACKGROUND_TASKS_EAGER=True,
+)
+class QueryBudgetTests(TempMediaTestCase):
+    """
+    Число SQL-запросов каждого эндпоинта core/urls.py не должно расти вместе с
+    данными: каждый эндпоинт вызывается на маленьком наборе данных и на
+    наборе в несколько раз больше (в том числе у тех самых объектов, что
+    стоят в URL), и оба раза должен уложиться в свой бюджет из QUERY_BUDGETS,
+    сделав одинаковое число запросов. Кэш ответов отключён, а кэши процесса
+    прогреваются одним запросом перед замером.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_benchmark_data(users=3, routes=6, tags=6, reviews_per_route=1, photos_per_route=1, points_per_route=1,
+                            favorites_per_user=1, preferences_per_user=1, prefix='small_')
+        cls.image_name = default_storage.save('photos/probe.png', ContentFile(png_bytes()))
+        cls.pdf_name = default_storage.save('pdf_files/probe.pdf', ContentFile(PDF_BYTES))
+        cls.user = User.objects.create_user(username='probe', email='probe@example.com', password='password')
+        cls.tags = list(Tag.objects.order_by('id')[:3])
+        cls.route = Route.objects.create(name='Проба', location_area='Область', author=cls.user, is_public=True)
+        cls.route.tags.set(cls.tags[:1])
+        cls.photo = RoutePhoto.objects.create(route=cls.route, image=cls.image_name, is_checked=True)
+        cls.review = RouteReview.objects.create(route=cls.route, user=cls.user, rating=4)
+        cls.point = MapPoint.objects.create(route=cls.route, type='start', latitude=56, longitude=37, name='Старт',
+                                            image=cls.image_name)
+        cls.point_review = PointReview.objects.create(point=cls.point, user=cls.user, rating=5)
+        cls.role = Role.objects.create(name='Турист')
+        cls.item = Item.objects.create(category='food', name='Чай')
+        cls.checklist = Checklist.objects.create(name='wild_checklist', pdf_url=cls.pdf_name, route_id=cls.route)
+        ChecklistItems.objects.create(checklist_id=cls.checklist, item_id=cls.item, quantity=1)
+        FavoriteRoute.objects.create(user=cls.user, route=cls.route)
+        UserTagPreference.objects.create(user=cls.user, tag=cls.tags[0], weight=0.5)
+        response = APIClient().post(reverse('upload-gpx', kwargs={'id': cls.route.id}),
+                                    {'gpx_file': upload('track.gpx', gpx_bytes())}, format='multipart')
+        assert response.status_code == 200, response.content
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def grow(self):
+        """Увеличивает данные в несколько раз, в том числе у объектов, которые стоят в URL."""
+        seed_benchmark_data(users=10, routes=30, tags=12, reviews_per_route=3, photos_per_route=3, points_per_route=3,
+                            favorites_per_user=4, preferences_per_user=4, prefix='large_', seed=7)
+        self.tags = list(Tag.objects.order_by('id')[:6])
+        self.route.tags.set(self.tags)
+        for _ in range(5):
+            RoutePhoto.objects.create(route=self.route, image=self.image_name, is_checked=True)
+            RouteReview.objects.create(route=self.route, user=self.user, rating=3)
+            point = MapPoint.objects.create(route=self.route, type='camp', latitude=56.01, longitude=37.01, name='Лагерь')
+            PointReview.objects.create(point=self.point, user=self.user, rating=4)
+            ChecklistItems.objects.create(checklist_id=self.checklist, item_id=Item.objects.create(name='Вещь'), quantity=2)
+            Checklist.objects.create(name=f'Список {point.id}', pdf_url=self.pdf_name, route_id=self.route)
+            Route.objects.create(name='Ещё', location_area='Область', author=self.user, is_public=True)
+            Role.objects.create(name='Роль')
+        for route in Route.objects.exclude(favorited_by__user=self.user)[:5]:
+            FavoriteRoute.objects.create(user=self.user, route=route)
+        UserTagPreference.objects.bulk_create(
+            [UserTagPreference(user=self.user, tag=tag, weight=0.3) for tag in self.tags], ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def endpoints():
+        """(шаблон URL, метод) для каждого обработчика из core/urls.py."""
+        for pattern in urls.urlpatterns:
+            callback = pattern.callback
+            view_class = getattr(callback, 'cls', None) or callback.view_class
+            view = view_class(**(getattr(callback, 'view_initkwargs', None) or {}))
+            for method in view.allowed_methods:
+                if method not in ('OPTIONS', 'HEAD'):
+                    yield str(pattern.pattern), pattern.name, method
+
+    def call(self, route, name, method, scale):
+        kwargs, data = ENDPOINT_REQUESTS[route, method](self, scale)
+        url = reverse(name, kwargs=kwargs)
+        self.assertTrue(resolve(url).route.endswith(route), f'{url} не попадает в {route}')
+        files = any(isinstance(value, SimpleUploadedFile) for value in data.values())
+        request_format = 'multipart' if files else 'json'
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'GET':
+                response = self.client.get(url, data)
+            else:
+                response = getattr(self.client, method.lower())(url, data, format=request_format)
+        self.assertLess(response.status_code, 400, f'{method} {url}: {getattr(response, "data", response)}')
+        return [query['sql'] for query in queries.captured_queries]
+
+    def measure(self, route, name, method, scale):
+        tag_registry.invalidate()
+        recommendation_engine.invalidate()
+        # Внутри TestCase транзакция не фиксируется, поэтому колбэки on_commit,
+        # которые пополняют кэши процесса, для прогревочного запроса выполняем сами
+        with self.captureOnCommitCallbacks(execute=True):
+            self.call(route, name, method, scale)
+        return self.call(route, name, method, scale)
+
+    def test_every_endpoint_is_covered(self):
+        for route, _, method in self.endpoints():
+            with self.subTest(endpoint=f'{method} {route}'):
+                if (route, method) in UNCHECKED_ENDPOINTS:
+                    continue
+                self.assertIn((route, method), ENDPOINT_REQUESTS, 'нет запроса для проверки')
+                self.assertIn((route, method), QUERY_BUDGETS, 'нет бюджета запросов')
+
+    def test_query_count_does_not_grow_with_data(self):
+        checked = [endpoint for endpoint in self.endpoints() if (endpoint[0], endpoint[2]) in ENDPOINT_REQUESTS]
+        small, large = {}, {}
+        for endpoint in checked:
+            with self.subTest(endpoint=f'{endpoint[2]} {endpoint[0]}', size='small'):
+                small[endpoint] = self.measure(*endpoint, scale=1)
+        self.grow()
+        for endpoint in checked:
+            with self.subTest(endpoint=f'{endpoint[2]} {endpoint[0]}', size='large'):
+                large[endpoint] = self.measure(*endpoint, scale=4)
+        for endpoint in checked:
+            route, _, method = endpoint
+            budget = QUERY_BUDGETS.get((route, method))
+            if budget is None or endpoint not in small or endpoint not in large:
+                # Ошибка уже в отчёте: нет бюджета (test_every_endpoint_is_covered) или упал сам вызов
+                continue
+            with self.subTest(endpoint=f'{method} {route}'):
+                self.assertTrue(
+                    len(small[endpoint]) == len(large[endpoint]) and len(large[endpoint]) <= budget,
+                    f'{method} {route}: бюджет {budget}, запросов {len(small[endpoint])} на малых данных '
+                    f'и {len(large[endpoint])} на больших\n'
+                    f'малые данные:\n{format_queries(small[endpoint])}\n'
+                    f'большие данные:\n{format_queries(large[endpoint])}',
+                )
+
+
+class ChecklistItemsByIdTests(TestCase):
+    def test_lists_items_of_checklist(self):
+        checklist = Checklist.objects.create(name='Поход', pdf_url='pdf_files/hike.pdf')
+        other = Checklist.objects.create(name='Другой', pdf_url='pdf_files/other.pdf')
+        tent, stove, boots = (
+            Item.objects.create(category=category, name=name)
+            for category, name in (('sleeping_equipment', 'Палатка'), ('kitchen_equipment', 'Горелка'),
+                                   ('clothes', 'Ботинки'))
+        )
+        ChecklistItems.objects.create(checklist_id=checklist, item_id=tent, quantity=1)
+        ChecklistItems.objects.create(checklist_id=checklist, item_id=stove, quantity=2, is_packed=True)
+        ChecklistItems.objects.create(checklist_id=other, item_id=boots, quantity=1)
+
+        response = APIClient().get(reverse('point-reviews', kwargs={'checklist_id': checklist.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted((item['id'], item['name'], item['category']) for item in response.data),
+            [(tent.id, 'Палатка', 'sleeping_equipment'), (stove.id, 'Горелка', 'kitchen_equipment')],
+        )
+
+    def test_unknown_checklist_has_no_items(self):
+        response = APIClient().get(reverse('point-reviews', kwargs={'checklist_id': 999}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class MediaCascadeReleaseTests(TestCase):
+    """Удаление маршрута и QuerySet.delete() освобождают файлы один раз и числом запросов, не зависящим от объектов."""
+
+    def route_with_children(self, count):
+        route = Route.objects.create(name='Каскад', location_area='Область', gpx_url='gpx_files/track.gpx')
+        for index in range(count):
+            RoutePhoto.objects.create(route=route, image=f'photos/route_photos/{route.id}-{index}.jpg')
+            MapPoint.objects.create(route=route, type='camp', latitude=56.0, longitude=37.0, name='Лагерь',
+                                    image=f'photos/point_photos/{route.id}-{index}.jpg')
+            Checklist.objects.create(name='Список', route_id=route, pdf_url=f'pdf_files/{route.id}-{index}.pdf')
+        # Общий с другим маршрутом файл должен остаться со своей ссылкой
+        RoutePhoto.objects.create(route=route, image='photos/route_photos/shared.jpg')
+        return route
+
+    def refcounts(self):
+        return dict(MediaBlob.objects.values_list('name', 'refcount'))
+
+    def test_route_delete_releases_children_once(self):
+        keeper = Route.objects.create(name='Сосед', location_area='Область')
+        RoutePhoto.objects.create(route=keeper, image='photos/route_photos/shared.jpg')
+        route = self.route_with_children(3)
+        route.delete()
+        refcounts = self.refcounts()
+        self.assertEqual(refcounts.pop('photos/route_photos/shared.jpg'), 1)
+        self.assertEqual(len(refcounts), 3 * 3 + 1)
+        self.assertEqual(set(refcounts.values()), {0})
+
+    def test_route_delete_query_count_does_not_grow(self):
+        counts = []
+        for children in (1, 6):
+            route = self.route_with_children(children)
+            with CaptureQueriesContext(connection) as queries:
+                route.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_queryset_delete_releases_each_file(self):
+        route = Route.objects.create(name='Фото', location_area='Область')
+        counts = []
+        for rows in (1, 4):
+            for index in range(rows):
+                RoutePhoto.objects.create(route=route, image=f'photos/route_photos/{rows}-{index}.jpg')
+                # Точки без маршрута: пересчёт границ маршрута здесь ни при чём
+                MapPoint.objects.create(type='camp', latitude=56.0, longitude=37.0, name='Лагерь',
+                                        image=f'photos/point_photos/{rows}-{index}.jpg')
+                Checklist.objects.create(name='Список', pdf_url=f'pdf_files/{rows}-{index}.pdf')
+            RoutePhoto.objects.create(route=route, image='photos/route_photos/shared.jpg')
+            RoutePhoto.objects.create(route=route, image='photos/route_photos/shared.jpg')
+            run = []
+            for model in (RoutePhoto, MapPoint, Checklist):
+                with CaptureQueriesContext(connection) as queries:
+                    model.objects.all().delete()
+                run.append(len(queries))
+            counts.append(run)
+            self.assertEqual(set(self.refcounts().values()), {0})
+        self.assertEqual(counts[0], counts[1])
+
+    def test_single_point_delete_updates_route_extent(self):
+        route = Route.objects.create(name='Точки', location_area='Область')
+        start = MapPoint.objects.create(route=route, type='start', latitude=56.0, longitude=37.0, name='Старт')
+        route.refresh_from_db()
+        self.assertEqual(route.start_latitude, 56.0)
+        start.delete()
+        route.refresh_from_db()
+        self.assertIsNone(route.start_latitude)
+
+
+class CompressedGpxTests(TempMediaTestCase):
+    """GPX хранится в gzip и по любой ссылке отдаётся с учётом Accept-Encoding."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = Route.objects.create(name='Трек', location_area='Область')
+        cls.track = gpx_bytes()
+        response = APIClient().post(reverse('upload-gpx', kwargs={'id': cls.route.id}),
+                                    {'gpx_file': upload('track.gpx', cls.track)}, format='multipart')
+        assert response.status_code == 200, response.content
+        cls.route.refresh_from_db()
+        cls.media_url = cls.route.gpx_url.url
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_blob_keeps_gpx_extension(self):
+        self.assertTrue(self.route.gpx_url.name.endswith('.gpx.gz'))
+
+    def test_media_url_is_negotiated(self):
+        response, body = self.get(self.media_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Type'], 'application/gpx+xml')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), self.track)
+
+        response, body = self.get(self.media_url)
+        self.assertEqual(response['Content-Type'], 'application/gpx+xml')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(body, self.track)
+
+    def test_download_is_negotiated(self):
+        url = reverse('route-gpx-download', kwargs={'pk': self.route.id})
+        _, body = self.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(body), self.track)
+        response, body = self.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(body, self.track)
+
+    def test_offload_only_for_encoded_variant(self):
+        with self.settings(MEDIA_OFFLOAD='x-sendfile'):
+            response = self.client.get(self.media_url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertTrue(response['X-Sendfile'].endswith('.gpx.gz'))
+            self.assertEqual(response['Content-Type'], 'application/gpx+xml')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+
+            response, body = self.get(self.media_url)
+            self.assertNotIn('X-Sendfile', response)
+            self.assertEqual(body, self.track)
+
+
+class MediaServeTests(TempMediaTestCase):
+    """/media/ отдаёт блобы и старые файлы, но не служебные файлы хранилища."""
+
+    def setUp(self):
+        self.blob = default_storage.save('photos/route_photos/photo.png', ContentFile(png_bytes()))
+        # Незавершённая загрузка в .incoming/ появляется при любом сохранении
+        default_storage._write_temp(ContentFile(b'half-written upload'))
+        self.incoming = [
+            f'.incoming/{name}' for name in os.listdir(os.path.join(settings.MEDIA_ROOT, '.incoming'))
+        ]
+        path = os.path.join(settings.MEDIA_ROOT, 'photos', 'legacy.png')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            out.write(png_bytes())
+
+    def get(self, path):
+        return self.client.get(settings.MEDIA_URL + path)
+
+    def test_blobs_and_legacy_files_are_served(self):
+        response = self.get(self.blob)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(self.get('photos/legacy.png').status_code, 200)
+
+    def test_storage_internals_are_hidden(self):
+        self.assertIn('.incoming/.lock', self.incoming)
+        self.assertGreater(len(self.incoming), 1)
+        hidden = self.incoming + [
+            '.incoming/', 'photos/../.incoming/.lock', 'blobs/../.incoming/.lock', './.incoming/.lock',
+        ]
+        for path in hidden:
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).status_code, 404)
+        with self.settings(MEDIA_OFFLOAD='x-sendfile'):
+            for path in self.incoming:
+                with self.subTest(path=path, offload=True):
+                    response = self.get(path)
+                    self.assertEqual(response.status_code, 404)
+                    self.assertNotIn('X-Sendfile', response)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'response-cache-tests'}},
+    VIEW_COUNTER_FLUSH_INTERVAL=0,
+)
+class ResponseCacheTests(TestCase):
+    """Закэшированные ответы сбрасываются после изменений, в том числе сделанных без сигналов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cache', email='cache@example.com', password='password')
+        cls.route = Route.objects.create(name='Кэш', location_area='Область', author=cls.user, is_public=True)
+
+    def setUp(self):
+        cache.clear()
+        tag_registry.invalidate()
+        self.client = APIClient()
+
+    def write(self, method, name, data, **kwargs):
+        # Версии пространств имён увеличиваются в on_commit, который TestCase сам не выполняет
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(reverse(name, kwargs=kwargs), data, format='json')
+        self.assertLess(response.status_code, 400, response.data)
+        return response
+
+    def tag_names(self):
+        return {tag['name'] for tag in self.client.get(reverse('tags-list')).data}
+
+    def test_tags_created_by_registry_reset_tag_list(self):
+        self.assertEqual(self.tag_names(), set())
+        self.write('post', 'route-list-create', route_data(self, 1))
+        self.assertEqual(self.tag_names(), set(Tag.objects.values_list('name', flat=True)))
+        self.assertTrue(self.tag_names())
+
+    def test_registry_bumps_tags_only_when_creating(self):
+        tag_registry.resolve([])
+        before = namespace_versions(['tags'])
+        # Тег создан другим процессом уже после того, как словарь загрузился
+        Tag.objects.bulk_create([Tag(name='лес')])
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = tag_registry.resolve(['лес'])
+        self.assertEqual(set(ids), {'лес'})
+        self.assertEqual(namespace_versions(['tags']), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = tag_registry.resolve(['лес', 'горы'])
+        self.assertEqual(set(ids), {'лес', 'горы'})
+        self.assertNotEqual(namespace_versions(['tags']), before)
+
+    def test_route_extent_from_points_resets_route_detail(self):
+        url = reverse('route-detail', kwargs={'pk': self.route.id})
+        self.assertIsNone(self.client.get(url).data['start_latitude'])
+        self.write('post', 'map_point-list-create', {'route': self.route.id, 'type': 'start', 'latitude': 55.0,
+                                                      'longitude': 37.0, 'name': 'Старт'})
+        self.assertEqual(self.client.get(url).data['start_latitude'], 55.0)
+
+    def test_review_resets_route_detail(self):
+        url = reverse('route-detail', kwargs={'pk': self.route.id})
+        self.client.get(url)
+        self.write('post', 'route_review-list-create', {'route': self.route.id, 'user': self.user.id, 'rating': 4})
+        self.assertEqual(self.client.get(url).data['rating_count'], 1)
+
+
+class ResponseCacheLockTests(SimpleTestCase):
+    """Запись пересобирает один воркер, в том числе с FileBasedCache, где cache.add не атомарен."""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir,
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.builds = []
+
+    def slow_build(self, value='ответ'):
+        def build():
+            self.builds.append(value)
+            time.sleep(0.2)
+            return value
+        return build
+
+    def test_file_cache_uses_flock(self):
+        self.assertIsInstance(rebuild_lock('ключ'), FileLock)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertIsInstance(rebuild_lock('ключ'), CacheLock)
+
+    def test_concurrent_misses_build_once(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def request():
+            barrier.wait()
+            results.append(get_or_build('ключ', self.slow_build(), timeout=60, stale_timeout=60))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(self.builds, ['ответ'])
+        self.assertEqual(results, ['ответ'] * 8)
+
+    def test_stale_entry_served_during_rebuild(self):
+        get_or_build('ключ', lambda: 'старый', timeout=0, stale_timeout=60)
+        lock = rebuild_lock('ключ')
+        self.assertTrue(lock.try_acquire())
+        try:
+            self.assertEqual(get_or_build('ключ', self.slow_build('новый'), timeout=60, stale_timeout=60), 'старый')
+        finally:
+            lock.release()
+        self.assertEqual(self.builds, [])
+        self.assertEqual(get_or_build('ключ', self.slow_build('новый'), timeout=60, stale_timeout=60), 'новый')
+
+    def test_lock_excludes_other_processes(self):
+        lock = rebuild_lock('ключ')
+        probe = (
+            'import fcntl, sys\n'
+            'file = open(sys.argv[1], "a")\n'
+            'try:\n'
+            '    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)\n'
+            'except BlockingIOError:\n'
+            '    sys.exit(1)\n'
+        )
+        self.assertTrue(lock.try_acquire())
+        try:
+            self.assertEqual(subprocess.run([sys.executable, '-c', probe, lock.path]).returncode, 1)
+        finally:
+            lock.release()
+        self.assertEqual(subprocess.run([sys.executable, '-c', probe, lock.path]).returncode, 0)
+
+
+class BlobPurgeTests(TempMediaTestCase):
+    """Файл, только что отданный save(), не удаляется отложенной очисткой до того, как на него возьмут ссылку."""
+
+    def age(self, name, seconds):
+        past = time.time() - seconds
+        os.utime(default_storage.path(name), (past, past))
+
+    def test_fresh_blob_survives_purge(self):
+        name = default_storage.save('photos/fresh.png', ContentFile(png_bytes()))
+        with mock.patch.object(media.background, 'submit_later') as submit_later:
+            media.purge_unreferenced([name])
+        self.assertTrue(default_storage.exists(name))
+        # Проверка повторится, когда истечёт отсрочка
+        submit_later.assert_called_once_with(settings.MEDIA_PURGE_GRACE_PERIOD, media.purge_unreferenced, [name])
+
+    def test_deduplicated_save_refreshes_blob(self):
+        name = default_storage.save('photos/old.png', ContentFile(png_bytes()))
+        self.age(name, settings.MEDIA_PURGE_GRACE_PERIOD + 60)
+        # Такое же содержимое сохраняется повторно, пока очистка ещё стоит в очереди
+        self.assertEqual(default_storage.save('photos/again.png', ContentFile(png_bytes())), name)
+        media.purge_unreferenced([name])
+        self.assertTrue(default_storage.exists(name))
+
+    def test_stale_unreferenced_blob_is_purged(self):
+        name = default_storage.save('photos/stale.png', ContentFile(png_bytes()))
+        media.acquire([name])
+        media.release([name])
+        self.age(name, settings.MEDIA_PURGE_GRACE_PERIOD + 60)
+        media.purge_unreferenced([name])
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_referenced_blob_is_kept(self):
+        name = default_storage.save('photos/kept.png', ContentFile(png_bytes()))
+        media.acquire([name])
+        self.age(name, settings.MEDIA_PURGE_GRACE_PERIOD + 60)
+        media.purge_unreferenced([name])
+        self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class RoutePhotoBatchUploadTests(TempMediaTestCase):
+    """Пакетная загрузка: плохой файл - ответ по нему, сбой хранилища - ошибка без осиротевших файлов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = Route.objects.create(name='Фото', location_area='Область')
+        cls.url = reverse('upload-file', kwargs={'id': cls.route.id})
+
+    def post(self, *files):
+        return APIClient().post(self.url, {'image': list(files)}, format='multipart')
+
+    def test_invalid_file_is_reported_and_others_are_saved(self):
+        response = self.post(upload('good.png', png_bytes()), upload('bad.png', b'not an image'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([('photo_id' in item) for item in response.data['results']], [True, False])
+        photo = RoutePhoto.objects.get(route=self.route)
+        self.assertEqual(MediaBlob.objects.get(name=photo.image.name).refcount, 1)
+
+    def test_storage_error_is_not_reported_as_invalid_image(self):
+        original_save = ContentAddressedStorage._save
+
+        def failing_save(storage, name, content):
+            if name.startswith('photos/route_photos/second'):
+                raise OSError(28, 'No space left on device')
+            return original_save(storage, name, content)
+
+        with mock.patch.object(ContentAddressedStorage, '_save', failing_save), \
+                mock.patch('core.views.image_views.discard') as discard:
+            with self.assertRaises(OSError):
+                self.post(upload('first.png', png_bytes((200, 10, 10))), upload('second.png', png_bytes((10, 200, 10))))
+        self.assertFalse(RoutePhoto.objects.filter(route=self.route).exists())
+        # Файлы первого фото уже сохранены и отдаются на удаление: оригинал и все производные
+        discarded = discard.call_args.args[0]
+        self.assertEqual(len(discarded), 1 + len(DERIVATIVE_SIZES) * len(DERIVATIVE_FORMATS))
+        self.assertTrue(all(default_storage.exists(name) for name in discarded))
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='recommend', email='recommend@example.com', password='password')
+        cls.tag = Tag.objects.create(name='лес')
+        UserTagPreference.objects.create(user=cls.user, tag=cls.tag, weight=1)
+        cls.routes = Route.objects.bulk_create([
+            Route(name=f'Маршрут {index}', location_area='Область', author=cls.user, is_public=True, views=index)
+            for index in range(70)
+        ])
+        Route.tags.through.objects.bulk_create(
+            [Route.tags.through(route_id=route.id, tag_id=cls.tag.id) for route in cls.routes]
+        )
+        # По убыванию просмотров: вес у всех одинаковый
+        cls.ranking = [route.id for route in reversed(cls.routes)]
+
+    def setUp(self):
+        self.engine = RouteTagMatrix()
+        recommendation_engine.invalidate()
+
+    def test_limit_and_offset(self):
+        preferences = {self.tag.id: 1}
+        self.assertEqual(self.engine.recommend(preferences), self.ranking[:50])
+        self.assertEqual(self.engine.recommend(preferences, limit=None), self.ranking)
+        pages = [self.engine.recommend(preferences, 30, offset) for offset in (0, 30, 60)]
+        self.assertEqual(sum(pages, []), self.ranking)
+        self.assertEqual(self.engine.recommend(preferences, 10, 100), [])
+
+    def test_view_pages_past_default_limit(self):
+        url = reverse('route-recommendation', kwargs={'user_id': self.user.id})
+        client = APIClient()
+        self.assertEqual(len(client.get(url).data), 50)
+        response = client.get(url, {'limit': 20, 'offset': 60})
+        self.assertEqual([route['id'] for route in response.data], self.ranking[60:])
+        for params in ({'limit': 'много'}, {'limit': 0}, {'offset': -1}):
+            with self.subTest(params=params):
+                self.assertEqual(client.get(url, params).status_code, 400)
+
+    def test_private_route_dropped_while_matrix_is_stale(self):
+        url = reverse('route-recommendation', kwargs={'user_id': self.user.id})
+        client = APIClient()
+        hidden = self.ranking[0]
+        self.assertEqual(client.get(url).data[0]['id'], hidden)
+        # update() не шлёт сигналов - как изменение, сделанное в другом воркере
+        Route.objects.filter(id=hidden).update(is_public=False)
+        self.assertIn(hidden, recommendation_engine.recommend({self.tag.id: 1}))
+        response = client.get(url, {'limit': 5})
+        self.assertEqual([route['id'] for route in response.data], self.ranking[1:5])
+
+    def test_fallback_without_preferences_pages(self):
+        newcomer = User.objects.create_user(username='newcomer', email='newcomer@example.com', password='password')
+        url = reverse('route-recommendation', kwargs={'user_id': newcomer.id})
+        client = APIClient()
+        self.assertEqual([route['id'] for route in client.get(url).data], self.ranking[:50])
+        response = client.get(url, {'limit': 15, 'offset': 60})
+        self.assertEqual([route['id'] for route in response.data], self.ranking[60:])
+        Route.objects.filter(id=self.ranking[0]).update(is_public=False)
+        self.assertEqual(client.get(url, {'limit': 1}).data[0]['id'], self.ranking[1])
+
+    def test_load_builds_matrix_outside_lock(self):
+        hidden = self.routes[-1]
+        build = RouteTagMatrix._build
+        updated = threading.Event()
+
+        def slow_build():
+            matrix = build()
+            # Маршрут меняется, пока строится матрица: поток с сигналом не должен ждать загрузки
+            Route.objects.filter(id=hidden.id).update(is_public=False)
+            thread = threading.Thread(target=lambda: (self.engine.update_route(hidden.id, 0, False), updated.set()))
+            thread.start()
+            thread.join(5)
+            return matrix
+
+        with mock.patch.object(RouteTagMatrix, '_build', side_effect=slow_build):
+            self.engine.load()
+        self.assertTrue(updated.is_set())
+        recommended = self.engine.recommend({self.tag.id: 1}, limit=None)
+        self.assertNotIn(hidden.id, recommended)
+        self.assertEqual(recommended, self.ranking[1:])
+
+    def test_invalidate_during_load_forces_reload(self):
+        build = RouteTagMatrix._build
+
+        def build_then_invalidate():
+            matrix = build()
+            self.engine.invalidate()
+            return matrix
+
+        with mock.patch.object(RouteTagMatrix, '_build', side_effect=build_then_invalidate):
+            self.engine.load()
+        with mock.patch.object(RouteTagMatrix, '_build', wraps=build) as rebuild:
+            self.engine.recommend({self.tag.id: 1})
+            self.engine.recommend({self.tag.id: 1})
+        self.assertEqual(rebuild.call_count, 1)
+
+
+def apply_route_view_legacy(user, tag_ids):
+    """Прежний построчный пересчёт весов из UserPreferencesUpdateView - эталон для apply_route_view."""
+    UserTagPreference.objects.filter(user=user).exclude(tag_id__in=tag_ids).update(weight=F('weight') * (1 - 0.05))
+    for tag_id in tag_ids:
+        pref, _ = UserTagPreference.objects.get_or_create(user=user, tag_id=tag_id)
+        pref.weight += 0.1 * (1 - pref.weight)
+        pref.weight = round(min(pref.weight, 1.0), 4)
+        pref.save()
+
+
+class ApplyRouteViewTests(TestCase):
+    """Пакетный пересчёт предпочтений даёт ровно те же веса, что прежний цикл по тегам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(name=f'предпочтение {i}') for i in range(6)]
+        cls.users = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('batched', 'legacy')
+        ]
+
+    def weights(self, user):
+        return dict(UserTagPreference.objects.filter(user=user).values_list('tag_id', 'weight'))
+
+    def test_matches_legacy_loop(self):
+        batched, legacy = self.users
+        ids = [tag.id for tag in self.tags]
+        for user in self.users:
+            set_initial_preferences(user.id, [tag.name for tag in self.tags[:2]])
+        views = [
+            ids[:1], ids[1:4], [], ids[3:], ids[:1], ids[2:3], ids, ids[4:5], ids[4:5], ids[:2],
+        ] + [ids[:3]] * 30 + [ids[5:]]
+        for number, tag_ids in enumerate(views):
+            apply_route_view(batched.id, tag_ids)
+            apply_route_view_legacy(legacy, tag_ids)
+            with self.subTest(view=number):
+                self.assertEqual(self.weights(batched), self.weights(legacy))
+
+    def test_exact_weights(self):
+        user = self.users[0]
+        first, second, third = (tag.id for tag in self.tags[:3])
+        set_initial_preferences(user.id, [self.tags[1].name])
+        apply_route_view(user.id, [first])
+        self.assertEqual(self.weights(user), {first: 0.1, second: 0.475})
+        apply_route_view(user.id, [first, third])
+        self.assertEqual(self.weights(user), {first: 0.19, second: 0.45125, third: 0.1})
+        # Затухание в UPDATE не округляется: вес умножается на 0.95 столько раз, сколько было просмотров
+        apply_route_view(user.id, [])
+        self.assertEqual(self.weights(user), {first: 0.1805, second: 0.5 * 0.95 * 0.95 * 0.95, third: 0.095})
+
+class RouteRatingAggregateTests(TestCase):
+    """Агрегаты оценок маршрута сходятся с таблицей отзывов при любом способе удаления."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author', email='author@example.com', password='password')
+        cls.reviewer = User.objects.create_user(username='reviewer', email='reviewer@example.com', password='password')
+        cls.route = Route.objects.create(name='Оценки', location_area='Область', author=cls.author, is_public=True)
+
+    def review(self, user, rating):
+        response = APIClient().post(reverse('route_review-list-create'),
+                                    {'route': self.route.id, 'user': user.id, 'rating': rating}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def assertAggregates(self, rating_sum, rating_count):
+        self.route.refresh_from_db()
+        self.assertEqual((self.route.rating_sum, self.route.rating_count), (rating_sum, rating_count))
+
+    def test_api_delete(self):
+        review_id = self.review(self.reviewer, 4)
+        self.review(self.author, 2)
+        response = APIClient().delete(reverse('route_review-detail', kwargs={'pk': review_id}))
+        self.assertEqual(response.status_code, 204)
+        self.assertAggregates(2, 1)
+
+    def test_queryset_delete(self):
+        self.review(self.reviewer, 4)
+        self.review(self.reviewer, 5)
+        self.review(self.author, 3)
+        RouteReview.objects.filter(user=self.reviewer).delete()
+        self.assertAggregates(3, 1)
+
+    def test_cascade_from_user(self):
+        self.review(self.reviewer, 4)
+        self.review(self.author, 1)
+        self.reviewer.delete()
+        self.assertAggregates(1, 1)
+
+    def test_route_delete(self):
+        self.review(self.reviewer, 4)
+        self.route.delete()
+        self.assertFalse(RouteReview.objects.exists())
+
+
+class MapPointGeoFilterTests(TestCase):
+    """Отбор точек по ячейкам сетки совпадает с полным перебором, в том числе у антимеридиана и полюсов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(9)
+        coordinates = [(55.75, 37.62), (55.78, 37.66), (56.2, 37.62), (60.0, 179.97), (60.0, -179.97),
+                       (89.95, 10.0), (89.95, -170.0), (-89.95, 0.0)]
+        coordinates += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(300)]
+        coordinates += [(rng.uniform(55, 57), rng.uniform(36, 39)) for _ in range(200)]
+        cls.points = MapPoint.objects.bulk_create(assign_grid_cells([
+            MapPoint(type='camp', latitude=lat, longitude=lon, name=f'Точка {index}')
+            for index, (lat, lon) in enumerate(coordinates)
+        ]))
+        cls.url = reverse('map_point-list-create')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def brute_force_circle(self, lat, lon, radius_km):
+        return {point.id for point in self.points
+                if haversine_km(lat, lon, point.latitude, point.longitude) <= radius_km}
+
+    def brute_force_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        def inside_lon(lon):
+            return min_lon <= lon <= max_lon if min_lon <= max_lon else lon >= min_lon or lon <= max_lon
+        return {point.id for point in self.points
+                if min_lat <= point.latitude <= max_lat and inside_lon(point.longitude)}
+
+    def circle(self, lat, lon, radius_km):
+        response = self.client.get(self.url, {'lat': lat, 'lon': lon, 'radius_km': radius_km})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_radius_matches_brute_force(self):
+        rng = random.Random(10)
+        circles = [(55.75, 37.62, 5), (60.0, 179.99, 20), (89.9, 0, 50), (-89.9, 90, 30), (0, 0, 1000)]
+        circles += [(rng.uniform(-90, 90), rng.uniform(-180, 180), rng.uniform(1, 1000)) for _ in range(20)]
+        circles += [(rng.uniform(55, 57), rng.uniform(36, 39), rng.uniform(1, 60)) for _ in range(20)]
+        for lat, lon, radius_km in circles:
+            with self.subTest(lat=lat, lon=lon, radius_km=radius_km):
+                data = self.circle(lat, lon, radius_km)
+                self.assertEqual({item['id'] for item in data}, self.brute_force_circle(lat, lon, radius_km))
+                distances = [item['distance_km'] for item in data]
+                self.assertEqual(distances, sorted(distances))
+                self.assertTrue(all(distance <= radius_km + 1e-3 for distance in distances))
+
+    def test_bbox_matches_brute_force(self):
+        rng = random.Random(11)
+        boxes = [(37.5, 55.7, 37.7, 55.8), (179.9, 59.9, -179.9, 60.1), (-180, 89.9, 180, 90), (-180, -90, 180, 90)]
+        for _ in range(20):
+            min_lat, max_lat = sorted(rng.uniform(-90, 90) for _ in range(2))
+            boxes.append((rng.uniform(-180, 180), min_lat, rng.uniform(-180, 180), max_lat))
+        for bbox in boxes:
+            with self.subTest(bbox=bbox):
+                response = self.client.get(self.url, {'bbox': ','.join(map(str, bbox))})
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual({item['id'] for item in response.data}, self.brute_force_bbox(*bbox))
+
+    def test_antimeridian_neighbours(self):
+        ids = {item['id'] for item in self.circle(60.0, 179.99, 5)}
+        self.assertTrue({self.points[3].id, self.points[4].id} <= ids)
+
+    def test_nearest_first(self):
+        data = self.circle(55.75, 37.62, 10)
+        self.assertEqual(data[0]['id'], self.points[0].id)
+        self.assertEqual(data[0]['distance_km'], 0)
+
+    def test_invalid_parameters(self):
+        for params in ({'bbox': '1,2,3'}, {'bbox': '0,10,1,5'}, {'lat': 56, 'lon': 37},
+                       {'lat': 91, 'lon': 37, 'radius_km': 5}, {'lat': 56, 'lon': 37, 'radius_km': 5000}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_without_filters_lists_all_points(self):
+        self.assertEqual(len(self.client.get(self.url).data), len(self.points))
+
+
+class NearbyRoutesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='nearby', email='nearby@example.com', password='password')
+        cls.url = reverse('route-nearby')
+
+    def route(self, lat, lon, **fields):
+        fields = {'name': 'Рядом', 'location_area': 'Область', 'author': self.user, 'is_public': True, **fields}
+        return Route.objects.create(start_latitude=lat, start_longitude=lon, **fields)
+
+    def nearby(self, **params):
+        response = APIClient().get(self.url, {'lat': 56.0, 'lon': 37.0, 'radius_km': 30, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_public_routes_by_distance(self):
+        far = self.route(56.2, 37.0)
+        near = self.route(56.01, 37.0)
+        self.route(56.0, 37.0, is_public=False)
+        self.route(57.0, 37.0)
+        data = self.nearby()
+        self.assertEqual([item['id'] for item in data], [near.id, far.id])
+        self.assertAlmostEqual(data[0]['distance_km'], 1.112, places=2)
+
+    def test_type_and_difficulty_filters(self):
+        wild = self.route(56.01, 37.0, type=2, difficulty=3)
+        self.route(56.01, 37.0, type=1, difficulty=3)
+        self.assertEqual([item['id'] for item in self.nearby(type=2, difficulty=3)], [wild.id])
+        self.assertEqual(APIClient().get(self.url, {'lat': 56, 'lon': 37, 'radius_km': 30, 'type': 'x'}).status_code, 400)
+
+    def test_results_are_capped(self):
+        Route.objects.bulk_create(assign_grid_cells([
+            Route(name=f'Маршрут {index}', location_area='Область', author=self.user, is_public=True,
+                  start_latitude=56.0 + index * 1e-4, start_longitude=37.0)
+            for index in reversed(range(120))
+        ], 'start_latitude', 'start_longitude', 'start_cell'))
+        data = self.nearby()
+        self.assertEqual([item['name'] for item in data], [f'Маршрут {index}' for index in range(100)])
+
+    def test_only_nearest_routes_loaded_in_full(self):
+        Route.objects.bulk_create(assign_grid_cells([
+            Route(name=f'Маршрут {index}', description='Длинное описание ' * 50, location_area='Область',
+                  author=self.user, is_public=True, start_latitude=56.0 + index * 1e-4, start_longitude=37.0)
+            for index in range(150)
+        ], 'start_latitude', 'start_longitude', 'start_cell'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.nearby()), 100)
+        candidates, full = [query['sql'] for query in queries][:2]
+        self.assertNotIn('description', candidates)
+        self.assertIn('description', full)
+        self.assertLessEqual(full.split(' IN (')[1].count(','), 99)
+
+    def test_nearest_ranks_coordinate_rows(self):
+        rows = [(5, 56.02, 37.0), (3, 56.01, 37.0), (4, 56.01, 37.0), (9, 57.0, 37.0), (1, 56.0, 37.0)]
+        self.assertEqual([pk for pk, _ in nearest(rows, 56.0, 37.0, 30, 10)], [1, 3, 4, 5])
+        self.assertEqual([pk for pk, _ in nearest(rows, 56.0, 37.0, 30, 2)], [1, 3])
+        self.assertEqual(nearest([], 56.0, 37.0, 30, 10), [])
+
+    def test_moved_start_updates_cell(self):
+        route = self.route(50.0, 30.0)
+        self.assertEqual(self.nearby(), [])
+        route.start_latitude, route.start_longitude = 56.01, 37.0
+        route.save(update_fields=['start_latitude', 'start_longitude'])
+        self.assertEqual([item['id'] for item in self.nearby()], [route.id])
+
+    def test_route_without_gpx_starts_at_its_start_point(self):
+        route = Route.objects.create(name='Без трека', location_area='Область', author=self.user, is_public=True)
+        self.assertEqual(self.nearby(), [])
+        point = MapPoint.objects.create(route=route, type='start', latitude=56.01, longitude=37.0, name='Старт')
+        self.assertEqual([item['id'] for item in self.nearby()], [route.id])
+        point.delete()
+        self.assertEqual(self.nearby(), [])
+
+
+def jpeg_bytes(size, orientation=None):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    Image.new('RGB', size, (120, 140, 90)).save(buffer, format='JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class ImageDerivativeTests(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = Route.objects.create(name='Производные', location_area='Область')
+
+    def test_sizes_formats_and_orientation(self):
+        # EXIF orientation 6: снимок повёрнут на 90°, по пикселям он портретный
+        rendered = render_derivatives(io.BytesIO(jpeg_bytes((3000, 2000), orientation=6)))
+        self.assertEqual({name: rendered[name][:2] for name in rendered}, {'medium': (853, 1280), 'thumb': (213, 320)})
+        for size_name, (width, height, encoded) in rendered.items():
+            for format_name, content in encoded.items():
+                with self.subTest(size=size_name, format=format_name):
+                    image = Image.open(io.BytesIO(content))
+                    self.assertEqual(image.format, DERIVATIVE_FORMATS[format_name][0])
+                    self.assertEqual(image.size, (width, height))
+
+    def test_small_image_is_not_upscaled_and_alpha_is_flattened(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (40, 20), (0, 0, 0, 0)).save(buffer, format='PNG')
+        rendered = render_derivatives(io.BytesIO(buffer.getvalue()))
+        width, height, encoded = rendered['thumb']
+        self.assertEqual((width, height), (40, 20))
+        self.assertEqual(Image.open(io.BytesIO(encoded['jpeg'])).convert('RGB').getpixel((5, 5)), (255, 255, 255))
+
+    def test_saved_photo_gets_derivatives_and_urls(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = RoutePhoto.objects.create(route=self.route, is_checked=True,
+                                              image=ContentFile(jpeg_bytes((2000, 1500)), name='photo.jpg'))
+        photo.refresh_from_db()
+        self.assertEqual(photo.derivatives['source'], photo.image.name)
+        names = media.derivative_names(photo.derivatives)
+        self.assertEqual(len(names), len(DERIVATIVE_SIZES) * len(DERIVATIVE_FORMATS))
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        self.assertEqual(set(MediaBlob.objects.filter(name__in=names).values_list('refcount', flat=True)), {1})
+
+        response = APIClient().get(reverse('route-photo-list', kwargs={'pk': self.route.id}))
+        images = response.data[0]['images']
+        self.assertTrue(images['original'].endswith(photo.image.url))
+        self.assertEqual(set(images), {'original', *DERIVATIVE_SIZES})
+        self.assertTrue(images['thumb']['webp'].endswith(default_storage.url(photo.derivatives['sizes']['thumb']['webp'])))
+
+    def test_replaced_image_releases_old_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            point = MapPoint.objects.create(route=self.route, type='camp', latitude=56, longitude=37, name='Точка',
+                                            image=ContentFile(png_bytes((200, 0, 0)), name='red.png'))
+        point.refresh_from_db()
+        old_names = media.derivative_names(point.derivatives)
+        with self.captureOnCommitCallbacks(execute=True):
+            point.image = ContentFile(png_bytes((0, 0, 200)), name='blue.png')
+            point.save()
+        point.refresh_from_db()
+        self.assertEqual(point.derivatives['source'], point.image.name)
+        self.assertFalse(set(old_names) & set(media.derivative_names(point.derivatives)))
+        self.assertFalse(MediaBlob.objects.filter(name__in=old_names, refcount__gt=0).exists())
+
+    def test_stale_or_broken_source_is_skipped(self):
+        photo = RoutePhoto.objects.create(route=self.route, image=ContentFile(b'not an image', name='broken.png'))
+        with self.assertLogs('core.images', 'WARNING'):
+            generate_derivatives('core.RoutePhoto', photo.pk, photo.image.name)
+        generate_derivatives('core.RoutePhoto', photo.pk, 'photos/route_photos/replaced.png')
+        photo.refresh_from_db()
+        self.assertEqual(photo.derivatives, {})
+
+
+class ParseRangesTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = [
+            ('bytes=0-99', [(0, 99)]),
+            ('bytes=900-', [(900, 999)]),
+            ('bytes=-100', [(900, 999)]),
+            ('bytes=-5000', [(0, 999)]),
+            ('bytes=990-2000', [(990, 999)]),
+            ('bytes=0-10, 5-20, 22-30', [(0, 20), (22, 30)]),
+            ('bytes=21-30,0-20', [(0, 30)]),
+            ('bytes=1000-', []),
+            ('bytes=-0', []),
+            ('bytes=10-5', None),
+            ('bytes=abc', None),
+            ('items=0-10', None),
+            ('bytes=' + ','.join(f'{i * 10}-{i * 10}' for i in range(MAX_RANGES + 1)), None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(parse_ranges(header, 1000), expected)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class ConditionalDownloadTests(TempMediaTestCase):
+    """Условные запросы и Range при скачивании чек-листа (несжатый файл) и GPX (gzip)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = Route.objects.create(name='Скачивание', location_area='Область')
+        cls.content = bytes(range(256)) * 4
+        cls.checklist = Checklist.objects.create(name='wild_checklist',
+                                                 pdf_url=ContentFile(cls.content, name='list.pdf'))
+        cls.url = reverse('route-checklist-get', kwargs={'pk': cls.route.id})
+
+    def get(self, status_code, **headers):
+        response = self.client.get(self.url, **headers)
+        self.assertEqual(response.status_code, status_code)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_response_headers(self):
+        response, body = self.get(200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{os.path.basename(self.checklist.pdf_url.name).partition(".")[0]}"')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertIn('wild_checklist.pdf', response['Content-Disposition'])
+
+    def test_not_modified(self):
+        response, _ = self.get(200)
+        with mock.patch.object(ContentAddressedStorage, 'open') as storage_open:
+            for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+                with self.subTest(headers=headers):
+                    not_modified, body = self.get(304, **headers)
+                    self.assertEqual(body, b'')
+                    self.assertEqual(not_modified['ETag'], response['ETag'])
+            head = self.client.head(self.url)
+            self.assertEqual(int(head['Content-Length']), len(self.content))
+        storage_open.assert_not_called()
+        self.get(200, HTTP_IF_NONE_MATCH='"other"')
+
+    def test_single_range(self):
+        for header, (start, end) in (('bytes=0-99', (0, 99)), ('bytes=-24', (1000, 1023)), ('bytes=1000-', (1000, 1023))):
+            with self.subTest(range=header):
+                response, body = self.get(206, HTTP_RANGE=header)
+                self.assertEqual(body, self.content[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(self.content)}')
+                self.assertEqual(int(response['Content-Length']), end - start + 1)
+
+    def test_multiple_ranges(self):
+        response, body = self.get(206, HTTP_RANGE='bytes=0-9,100-109,5-12')
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        self.assertEqual(int(response['Content-Length']), len(body))
+        parts = [part for part in body.split(f'--{boundary}'.encode()) if part.strip(b'\r\n-')]
+        self.assertEqual(len(parts), 2)
+        for part, (start, end) in zip(parts, [(0, 12), (100, 109)]):
+            headers, _, data = part.partition(b'\r\n\r\n')
+            self.assertIn(f'Content-Range: bytes {start}-{end}/{len(self.content)}'.encode(), headers)
+            self.assertEqual(data.removesuffix(b'\r\n'), self.content[start:end + 1])
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response, _ = self.get(416, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+        too_many = 'bytes=' + ','.join(f'{i * 10}-{i * 10}' for i in range(MAX_RANGES + 1))
+        for header in ('bytes=10-5', 'lines=1-2', too_many):
+            with self.subTest(range=header):
+                _, body = self.get(200, HTTP_RANGE=header)
+                self.assertEqual(body, self.content)
+
+    def test_if_range(self):
+        response, _ = self.get(200)
+        _, body = self.get(206, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(body, self.content[:10])
+        self.get(206, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=response['Last-Modified'])
+        _, body = self.get(200, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(body, self.content)
+        self.get(200, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Mon, 01 Jan 2001 00:00:00 GMT')
+
+    def test_missing_file(self):
+        Checklist.objects.filter(pk=self.checklist.pk).update(pdf_url='pdf_files/missing.pdf')
+        self.get(404)
+
+    def test_gzip_variants(self):
+        track = gpx_bytes()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload-gpx', kwargs={'id': self.route.id}),
+                                        {'gpx_file': upload('track.gpx', track)}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        url = reverse('route-gpx-download', kwargs={'pk': self.route.id})
+
+        gzipped = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        compressed = b''.join(gzipped.streaming_content)
+        self.assertEqual(gzipped['Accept-Ranges'], 'bytes')
+        # Range относится к сжатому представлению
+        partial = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_RANGE='bytes=0-9')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), compressed[:10])
+
+        identity = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(identity.status_code, 200)
+        self.assertEqual(identity['Accept-Ranges'], 'none')
+        self.assertEqual(b''.join(identity.streaming_content), track)
+        self.assertNotEqual(identity['ETag'], gzipped['ETag'])
+        # ETag одного представления не подходит для другого
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=identity['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip',
+                                         HTTP_IF_NONE_MATCH=identity['ETag']).status_code, 200)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'view-counter-tests'}},
+    VIEW_COUNTER_FLUSH_INTERVAL=3600,
+)
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.routes = [
+            Route.objects.create(name=f'Просмотры {index}', location_area='Область', is_public=True, views=10)
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.counter = ViewCounter()
+        self.addCleanup(self.counter.shutdown)
+
+    def views(self):
+        return [route.views for route in Route.objects.filter(pk__in=[r.pk for r in self.routes]).order_by('pk')]
+
+    def test_flush_groups_routes_by_count(self):
+        first, second, third = self.routes
+        for route_id in (first.id, first.id, second.id, second.id, third.id):
+            self.counter.add(route_id)
+        self.assertEqual(self.views(), [10, 10, 10])
+        with mock.patch.object(recommendation_engine, 'add_views') as add_views, \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.counter.flush(), 3)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2, format_queries(updates))
+        add_views.assert_called_once_with({first.id: 2, second.id: 2, third.id: 1})
+        self.assertEqual(self.views(), [12, 12, 11])
+        self.assertEqual(self.counter.pending(), {})
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_failed_write_keeps_counts(self):
+        route = self.routes[0]
+        self.counter.add(route.id, 3)
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError('locked')), \
+                self.assertLogs('core.view_counter', 'ERROR'):
+            self.assertEqual(self.counter.flush(), 0)
+        self.counter.add(route.id)
+        self.assertEqual(self.counter.pending(), {route.id: 4})
+        self.counter.flush()
+        self.assertEqual(self.views()[0], 14)
+
+    def test_timer_flushes_once_per_interval(self):
+        flushed = threading.Event()
+        with self.settings(VIEW_COUNTER_FLUSH_INTERVAL=0.2), \
+                mock.patch.object(self.counter, 'flush', side_effect=flushed.set) as flush:
+            self.counter.add(self.routes[0].id)
+            self.counter.add(self.routes[1].id)
+            self.assertTrue(flushed.wait(5))
+        flush.assert_called_once_with()
+
+    def test_zero_interval_writes_immediately(self):
+        with self.settings(VIEW_COUNTER_FLUSH_INTERVAL=0):
+            self.counter.add(self.routes[0].id)
+        self.assertEqual(self.views()[0], 11)
+
+    def test_detail_views_are_counted_including_cached(self):
+        route = self.routes[0]
+        client = APIClient()
+        with mock.patch('core.views.route_views.view_counter', self.counter):
+            for name in ('route-detail', 'route-detail', 'route-full'):
+                self.assertEqual(client.get(reverse(name, kwargs={'pk': route.id})).status_code, 200)
+            self.assertEqual(client.get(reverse('route-detail', kwargs={'pk': 0})).status_code, 404)
+        self.assertEqual(self.counter.pending(), {route.id: 3})
+        self.assertEqual(self.views()[0], 10)
+        self.counter.flush()
+        self.assertEqual(self.views()[0], 13)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'moderation-tests'}},
+    BACKGROUND_TASKS_EAGER=True,
+    MEDIA_PURGE_GRACE_PERIOD=0,
+)
+class PhotoModerationTests(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = Route.objects.create(name='Модерация', location_area='Область')
+        cls.other_route = Route.objects.create(name='Другой', location_area='Область')
+        cls.url = reverse('route-photo-moderate')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def photo(self, route, color):
+        return RoutePhoto.objects.create(route=route, image=ContentFile(png_bytes(color), name='photo.png'))
+
+    def moderate(self, items, status_code=200):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'items': items}, format='json')
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response.data
+
+    def checked_photo_ids(self, route):
+        response = self.client.get(reverse('route-photo-list', kwargs={'pk': route.id}))
+        return [photo['id'] for photo in response.data]
+
+    def test_verdicts_are_applied(self):
+        approved = self.photo(self.route, (1, 2, 3))
+        rejected = self.photo(self.route, (4, 5, 6))
+        other = self.photo(self.other_route, (7, 8, 9))
+        rejected_name = rejected.image.name
+        # Кэшируем пустые списки проверенных фото обоих маршрутов
+        self.assertEqual(self.checked_photo_ids(self.route), [])
+        self.assertEqual(self.checked_photo_ids(self.other_route), [])
+
+        data = self.moderate([
+            {'id': rejected.id, 'verdict': 'reject'},
+            {'id': 999999, 'verdict': 'approve'},
+            {'id': approved.id, 'verdict': 'approve'},
+            {'id': other.id, 'verdict': 'approve'},
+            {'id': approved.id, 'verdict': 'approve'},
+        ])
+        self.assertEqual(data['results'], [
+            {'id': rejected.id, 'result': 'rejected'},
+            {'id': 999999, 'result': 'not_found'},
+            {'id': approved.id, 'result': 'approved'},
+            {'id': other.id, 'result': 'approved'},
+        ])
+        self.assertEqual(self.checked_photo_ids(self.route), [approved.id])
+        self.assertEqual(self.checked_photo_ids(self.other_route), [other.id])
+        self.assertFalse(RoutePhoto.objects.filter(id=rejected.id).exists())
+        self.assertFalse(default_storage.exists(rejected_name))
+        self.assertFalse(MediaBlob.objects.filter(name=rejected_name).exists())
+        self.assertTrue(default_storage.exists(approved.image.name))
+
+    def test_shared_file_of_rejected_photo_is_kept(self):
+        kept = self.photo(self.route, (10, 20, 30))
+        rejected = self.photo(self.route, (10, 20, 30))
+        self.assertEqual(kept.image.name, rejected.image.name)
+        self.moderate([{'id': rejected.id, 'verdict': 'reject'}])
+        self.assertTrue(default_storage.exists(kept.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=kept.image.name).refcount, 1)
+
+    def test_invalid_requests(self):
+        photo = self.photo(self.route, (40, 50, 60))
+        too_many = [{'id': index, 'verdict': 'approve'} for index in range(1, PhotoModerationSerializer.MAX_ITEMS + 2)]
+        for items in ([], too_many, [{'id': photo.id, 'verdict': 'maybe'}], [{'id': 0, 'verdict': 'approve'}],
+                      [{'id': photo.id, 'verdict': 'approve'}, {'id': photo.id, 'verdict': 'reject'}]):
+            with self.subTest(items=items[:2]):
+                self.moderate(items, status_code=400)
+        photo.refresh_from_db()
+        self.assertFalse(photo.is_checked)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    VIEW_COUNTER_FLUSH_INTERVAL=3600,
+)
+class RouteFullTests(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='full', email='full@example.com', password='password')
+        cls.image_name = default_storage.save('photos/full.png', ContentFile(png_bytes()))
+        cls.pdf_name = default_storage.save('pdf_files/full.pdf', ContentFile(PDF_BYTES))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.addCleanup(view_counter.flush)
+
+    def make_route(self, scale, reviews=None):
+        route = Route.objects.create(name='Страница', location_area='Область', author=self.author, is_public=True)
+        route.tags.set([Tag.objects.get_or_create(name=f'тег {index}')[0] for index in range(scale)])
+        for index in range(scale):
+            RoutePhoto.objects.create(route=route, image=self.image_name, is_checked=index % 2 == 0)
+            MapPoint.objects.create(route=route, type='camp', latitude=56, longitude=37, name=f'Точка {index}')
+            Checklist.objects.create(name=f'Список {index}', pdf_url=self.pdf_name, route_id=route)
+        for index in range(scale if reviews is None else reviews):
+            response = self.client.post(reverse('route_review-list-create'),
+                                        {'route': route.id, 'user': self.author.id, 'rating': 1 + index % 5})
+            self.assertEqual(response.status_code, 201)
+        return route
+
+    def full(self, route):
+        response = self.client.get(reverse('route-full', kwargs={'pk': route.id}))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_page_content(self):
+        route = self.make_route(4, reviews=12)
+        # Отзыв чужого маршрута не должен попасть в выборку окна
+        other = self.make_route(1)
+        data = self.full(route)
+        detail = self.client.get(reverse('route-detail', kwargs={'pk': route.id})).data
+        for key, value in detail.items():
+            if key not in ('author', 'tags'):
+                self.assertEqual(data[key], value, key)
+        self.assertEqual(data['author'], {'id': self.author.id, 'username': 'full'})
+        self.assertEqual({tag['name'] for tag in data['tags']}, {f'тег {index}' for index in range(4)})
+
+        checked = RoutePhoto.objects.filter(route=route, is_checked=True).order_by('-uploaded_at', '-id')
+        self.assertEqual([photo['id'] for photo in data['photos']], [photo.id for photo in checked])
+        self.assertTrue(all(photo['images'] for photo in data['photos']))
+        self.assertEqual([point['id'] for point in data['points']],
+                         list(route.points.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(len(data['checklists']), 4)
+
+        newest = RouteReview.objects.filter(route=route).order_by('-created_at', '-id')[:10]
+        self.assertEqual(data['reviews']['count'], 12)
+        self.assertTrue(data['reviews']['has_more'])
+        self.assertEqual([review['id'] for review in data['reviews']['results']], [review.id for review in newest])
+        self.assertEqual(self.full(other)['reviews']['count'], 1)
+
+    def test_exact_page_of_reviews(self):
+        reviews = self.full(self.make_route(1, reviews=10))['reviews']
+        self.assertEqual((reviews['count'], reviews['has_more'], len(reviews['results'])), (10, False, 10))
+
+    def test_query_count_does_not_depend_on_content(self):
+        counts = []
+        for scale in (1, 30):
+            route = self.make_route(scale)
+            with CaptureQueriesContext(connection) as queries:
+                self.full(route)
+            counts.append(len(queries.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_missing_route(self):
+        self.assertEqual(self.client.get(reverse('route-full', kwargs={'pk': 0})).status_code, 404)
+
+    def test_counts_as_view(self):
+        route = self.make_route(1)
+        with mock.patch.object(view_counter, 'add') as add:
+            self.full(route)
+        add.assert_called_once_with(route.id)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    VIEW_COUNTER_FLUSH_INTERVAL=3600,
+)
+class RouteListSerializerTests(TempMediaTestCase):
+    """Быстрый сериализатор списков отдаёт ровно то же, что RouteSerializer, на каждом списочном эндпоинте."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lists', email='lists@example.com', password='password')
+        tags = [Tag.objects.create(name=name) for name in ('лес', 'вода', 'горы')]
+        gpx_name = default_storage.save('gpx_files/list.gpx', ContentFile(gpx_bytes()))
+        cls.routes = [
+            Route.objects.create(
+                name='Сосновый бор', description='Лес и озеро', location_area='Тверская область', author=cls.user,
+                is_public=True, type=1, difficulty=2, length_in_km=12.5, height=210, elevation_gain=340.5,
+                duration=timedelta(hours=30, minutes=15), start_latitude=56.0, start_longitude=37.0,
+                rating_sum=9, rating_count=2, views=5, gpx_url=gpx_name, chat_link='https://t.me/bor',
+            ),
+            Route.objects.create(name='Сосновый ручей', location_area='Область', author=cls.user, is_public=True,
+                                 type=2, difficulty=4, start_latitude=56.01, start_longitude=37.0),
+            Route.objects.create(name='Сосновый скрытый', location_area='Область', author=cls.user, is_public=False,
+                                 type=1, difficulty=2, start_latitude=56.0, start_longitude=37.0),
+        ]
+        cls.routes[0].tags.set(tags)
+        cls.routes[1].tags.set(tags[1:])
+        UserTagPreference.objects.create(user=cls.user, tag=tags[1], weight=1)
+
+    def setUp(self):
+        recommendation_engine.invalidate()
+
+    def assertSameAsRouteSerializer(self, response):
+        self.assertEqual(response.status_code, 200, response.data)
+        items = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertTrue(items)
+        context = {'request': response.wsgi_request}
+        for item in items:
+            item = dict(item)
+            item.pop('distance_km', None)
+            expected = RouteSerializer(Route.objects.get(pk=item['id']), context=context).data
+            self.assertEqual(json.loads(json.dumps(item)), json.loads(json.dumps(expected)))
+
+    def test_list_endpoints(self):
+        requests = [
+            ('route-list-create', {}, {}),
+            ('route-equip-list', {}, {}),
+            ('route-wild-list', {}, {}),
+            ('route-user', {'user_id': self.user.id}, {}),
+            ('route-nearby', {}, {'lat': 56, 'lon': 37, 'radius_km': 10}),
+            ('route-search', {}, {'q': 'сосновый'}),
+            ('route-filter', {}, {'difficulty': '2,4'}),
+            ('route-recommendation', {'user_id': self.user.id}, {}),
+        ]
+        client = APIClient()
+        for name, kwargs, params in requests:
+            with self.subTest(endpoint=name):
+                self.assertSameAsRouteSerializer(client.get(reverse(name, kwargs=kwargs), params))
+
+    def test_without_request_context(self):
+        routes = RouteListSerializer.setup_queryset(Route.objects.order_by('id'))
+        self.assertEqual(RouteListSerializer(routes, many=True).data,
+                         RouteSerializer(Route.objects.order_by('id'), many=True).data)
+
+    def test_tags_loaded_with_one_query(self):
+        routes = RouteListSerializer.setup_queryset(Route.objects.order_by('id'))
+        with self.assertNumQueries(2):
+            data = RouteListSerializer(routes, many=True).data
+        self.assertEqual([sorted(item['tags']) for item in data],
+                         [sorted(route.tags.values_list('id', flat=True)) for route in self.routes])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class RouteSearchTests(TestCase):
+    """Полнотекстовый поиск: нормализация запроса, ранжирование и синхронизация индекса триггерами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher', email='searcher@example.com', password='password')
+        cls.lake = cls.create_route(name='Ёлки у озера', description='Тропа вдоль берега', type=1, difficulty=2)
+        cls.lakes = cls.create_route(name='Поход по лесу', description='Много озёр, везде ёлки', type=2, difficulty=3)
+        cls.mountain = cls.create_route(name='Горный перевал', description='Подъём на хребет', type=1, difficulty=5)
+        cls.hidden = cls.create_route(name='Озеро закрытое', is_public=False)
+
+    @classmethod
+    def create_route(cls, **fields):
+        fields = {'location_area': 'Карелия', 'author': cls.user, 'is_public': True, **fields}
+        return Route.objects.create(**fields)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('route-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['id'] for item in response.data]
+
+    def test_fts5_index_is_used(self):
+        self.assertTrue(search.is_supported())
+        with mock.patch.object(search, '_fallback_search') as fallback:
+            search.search_route_ids('озеро')
+        fallback.assert_not_called()
+
+    def test_query_terms(self):
+        self.assertEqual(search.query_terms('Озёра озеро ОЗЕРАХ'), ['озер'])
+        self.assertEqual(search.query_terms('"лес" OR NEAR(горы)'), ['лес', 'or', 'near', 'гор'])
+        self.assertEqual(search.query_terms(' ,.- '), [])
+        self.assertEqual(len(search.query_terms(' '.join(f'слово{i}' for i in range(20)))), search.MAX_TERMS)
+
+    def test_word_forms_and_yo_match(self):
+        for query in ('озеро', 'озёра', 'озерах', 'ОЗЕР'):
+            with self.subTest(query=query):
+                self.assertEqual(set(self.search(query)), {self.lake.id, self.lakes.id})
+        self.assertEqual(set(self.search('елки')), {self.lake.id, self.lakes.id})
+
+    def test_all_terms_required(self):
+        self.assertEqual(self.search('озеро тропа'), [self.lake.id])
+        self.assertEqual(self.search('озеро хребет'), [])
+
+    def test_name_ranks_above_description(self):
+        self.assertEqual(self.search('озеро'), [self.lake.id, self.lakes.id])
+        self.assertEqual(self.search('лес'), [self.lakes.id])
+
+    def test_fts_syntax_is_inert(self):
+        for query in ('"озеро', 'озеро OR горный', 'NEAR(озеро горный)', 'name:горный', 'озеро AND NOT', '*', '^озеро'):
+            with self.subTest(query=query):
+                response = self.client.get(reverse('route-search'), {'q': query})
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search('озеро OR горный'), [])
+
+    def test_private_routes_excluded(self):
+        self.assertNotIn(self.hidden.id, self.search('закрытое озеро'))
+
+    def test_filters_limit_and_offset(self):
+        self.assertEqual(self.search('озеро', type=2), [self.lakes.id])
+        self.assertEqual(self.search('озеро', difficulty=2), [self.lake.id])
+        self.assertEqual(self.search('озеро', limit=1), [self.lake.id])
+        self.assertEqual(self.search('озеро', limit=1, offset=1), [self.lakes.id])
+        self.assertEqual(self.search('озеро', offset=2), [])
+
+    def test_bad_parameters(self):
+        url = reverse('route-search')
+        for params in ({}, {'q': '  '}, {'q': 'озеро', 'type': 'x'}, {'q': 'озеро', 'limit': 'x'},
+                       {'q': 'озеро', 'limit': 0}, {'q': 'озеро', 'offset': -1}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.mountain.name = 'Перевал у озера'
+        self.mountain.save()
+        self.assertIn(self.mountain.id, self.search('озеро'))
+        self.assertEqual(self.search('горный'), [])
+
+        Route.objects.filter(pk=self.lake.pk).update(description='Тропа к водопаду')
+        self.assertEqual(self.search('водопад'), [self.lake.id])
+
+        self.lakes.delete()
+        self.assertNotIn(self.lakes.id, self.search('озеро'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {search.FTS_TABLE} WHERE rowid = %s', [self.lakes.id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_index_follows_bulk_create(self):
+        created = Route.objects.bulk_create([
+            Route(name=f'Болото {i}', location_area='Карелия', author=self.user, is_public=True) for i in range(3)
+        ])
+        self.assertEqual(set(self.search('болото')), {route.id for route in created})
+
+    def test_rebuild_matches_triggers(self):
+        before = self.search('озеро')
+        self.assertEqual(search.rebuild_search_index(), Route.objects.count())
+        self.assertEqual(self.search('озеро'), before)
+
+    def test_fallback_without_index(self):
+        with mock.patch.object(search, 'is_supported', return_value=False):
+            self.assertEqual(set(search.search_route_ids('тропа лес')), set())
+            self.assertEqual(set(search.search_route_ids('озера')), {self.lake.id})
+            self.assertEqual(search.search_route_ids('лес', {'type': 2}), [self.lakes.id])
+            self.assertEqual(search.search_route_ids('лес', {'type': 1}), [])
+            self.assertEqual(search.search_route_ids('закрыт'), [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class RouteFilterTests(TestCase):
+    """Фильтр маршрутов сверяется с перебором в Python: выдача, курсоры и счётчики фасетов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='filterer', email='filterer@example.com', password='password')
+        cls.tags = [Tag.objects.create(name=f'фасет {i}') for i in range(4)]
+        rng = random.Random(23)
+        durations = [None, timedelta(hours=2), timedelta(hours=3), timedelta(hours=8), timedelta(hours=30)]
+        lengths = [None, 3.0, 5.0, 14.9, 15.0, 42.0]
+        cls.expected = {}
+        for i in range(40):
+            route = Route.objects.create(
+                name=f'Маршрут {i}', location_area='Область', author=cls.user, is_public=i % 7 != 0,
+                difficulty=rng.randint(1, 4), type=rng.randint(1, 2),
+                duration=rng.choice(durations), length_in_km=rng.choice(lengths),
+            )
+            tag_ids = {tag.id for tag in rng.sample(cls.tags, rng.randint(0, 3))}
+            route.tags.set(tag_ids)
+            if route.is_public:
+                cls.expected[route.id] = {
+                    'difficulty': route.difficulty, 'type': route.type, 'tags': tag_ids,
+                    'duration': cls.bucket(route.duration, DURATION_BUCKETS),
+                    'length': route.length_in_km,
+                    'length_bucket': cls.bucket(route.length_in_km, LENGTH_BUCKETS),
+                }
+
+    @staticmethod
+    def bucket(value, buckets):
+        for name, low, high in buckets:
+            if value is not None and (low is None or value >= low) and (high is None or value < high):
+                return name
+        return None
+
+    def matches(self, route, params, exclude=None):
+        def values(name, convert=int):
+            return {convert(part) for part in params[name].split(',')} if params.get(name) else None
+
+        checks = {
+            'difficulty': lambda: route['difficulty'] in values('difficulty'),
+            'type': lambda: route['type'] in values('type'),
+            'duration': lambda: route['duration'] in values('duration', str),
+            'length': lambda: route['length'] is not None
+            and float(params.get('length_min', '-inf')) <= route['length'] <= float(params.get('length_max', 'inf')),
+            'tags': lambda: (values('tags') <= route['tags'] if params.get('tags_mode', 'all') == 'all'
+                             else bool(values('tags') & route['tags'])),
+        }
+        active = {
+            'difficulty': 'difficulty' in params, 'type': 'type' in params, 'duration': 'duration' in params,
+            'length': 'length_min' in params or 'length_max' in params, 'tags': 'tags' in params,
+        }
+        return all(check() for name, check in checks.items() if active[name] and name != exclude)
+
+    def expected_facets(self, params):
+        def counter(dimension, key, choices):
+            routes = [route for route in self.expected.values() if self.matches(route, params, exclude=dimension)]
+            return [{'value': value, 'count': sum(route[key] == value for route in routes)} for value in choices]
+
+        tag_routes = [route for route in self.expected.values() if self.matches(route, params, exclude='tags')]
+        tag_counts = {tag.id: sum(tag.id in route['tags'] for route in tag_routes) for tag in self.tags}
+        return {
+            'difficulty': counter('difficulty', 'difficulty', [value for value, _ in Route.DIFFICULTY_CHOICES]),
+            'type': counter('type', 'type', [value for value, _ in Route.TYPES]),
+            'duration': counter('duration', 'duration', [name for name, _, _ in DURATION_BUCKETS]),
+            'length': counter('length', 'length_bucket', [name for name, _, _ in LENGTH_BUCKETS]),
+            'tags': sorted(({'value': tag_id, 'count': count} for tag_id, count in tag_counts.items() if count),
+                           key=lambda row: (-row['count'], row['value'])),
+        }
+
+    def fetch_all(self, params):
+        """Обходит все страницы по ссылкам next; возвращает id и ответ первой страницы."""
+        response = self.client.get(reverse('route-filter'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        first, ids = response.data, []
+        while True:
+            ids += [item['id'] for item in response.data['results']]
+            if not response.data['next']:
+                return ids, first
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('facets', response.data)
+
+    def cases(self):
+        tag_a, tag_b = self.tags[0].id, self.tags[1].id
+        return [
+            {},
+            {'difficulty': '1,3'},
+            {'type': '2'},
+            {'duration': 'half_day,multi_day'},
+            {'duration': 'short'},
+            {'length_min': '5', 'length_max': '15'},
+            {'length_min': '15'},
+            {'tags': f'{tag_a},{tag_b}'},
+            {'tags': f'{tag_a},{tag_b}', 'tags_mode': 'any'},
+            {'tags': str(tag_a), 'difficulty': '2,3,4', 'type': '1', 'length_max': '20'},
+        ]
+
+    def test_results_and_facets_match_brute_force(self):
+        for params in self.cases():
+            with self.subTest(params=params):
+                ids, first = self.fetch_all({**params, 'page_size': 7})
+                expected = [pk for pk, route in self.expected.items() if self.matches(route, params)]
+                self.assertTrue(expected)
+                self.assertEqual(ids, sorted(expected, reverse=True))
+                self.assertEqual(first['facets'], self.expected_facets(params))
+
+    def test_facet_ignores_own_dimension(self):
+        facets = self.client.get(reverse('route-filter'), {'difficulty': '1'}).data['facets']
+        totals = {row['value']: row['count'] for row in facets['difficulty']}
+        for difficulty in (1, 2, 3, 4):
+            self.assertEqual(totals[difficulty],
+                             sum(route['difficulty'] == difficulty for route in self.expected.values()))
+        self.assertEqual(sum(row['count'] for row in facets['type']),
+                         sum(route['difficulty'] == 1 for route in self.expected.values()))
+
+    def test_cursor_walks_back(self):
+        response = self.client.get(reverse('route-filter'), {'page_size': 5})
+        first_page = [item['id'] for item in response.data['results']]
+        second = self.client.get(response.data['next']).data
+        self.assertIsNone(response.data['previous'])
+        back = self.client.get(second['previous']).data
+        self.assertEqual([item['id'] for item in back['results']], first_page)
+        self.assertNotIn('facets', back)
+
+    def test_bad_parameters(self):
+        url = reverse('route-filter')
+        for params in ({'difficulty': '9'}, {'difficulty': 'x'}, {'type': '3'}, {'duration': 'week'},
+                       {'length_min': 'x'}, {'length_min': '10', 'length_max': '5'}, {'tags_mode': 'some'},
+                       {'tags': ','.join(str(i) for i in range(MAX_TAGS + 1))}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+
+    def test_query_count_does_not_depend_on_filters(self):
+        tag_ids = ','.join(str(tag.id) for tag in self.tags[:2])
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get(reverse('route-filter'))
+        with CaptureQueriesContext(connection) as filtered:
+            self.client.get(reverse('route-filter'), {'tags': tag_ids, 'difficulty': '1,2', 'duration': 'short'})
+        self.assertEqual(len(plain), len(filtered))
@@ -28,9 +28,14 @@ urlpatterns = [
     path('routes/', RouteListCreateView.as_view(), name='route-list-create'),
     path('routes/equip/', EquipRouteGetView.as_view(), name='route-equip-list'),
     path('routes/wild/', WildRouteGetView.as_view(), name='route-wild-list'),
+    path('routes/nearby/', NearbyRoutesView.as_view(), name='route-nearby'),
+    path('routes/search/', RouteSearchView.as_view(), name='route-search'),
+    path('routes/filter/', RouteFilterView.as_view(), name='route-filter'),
     path('routes/<int:pk>/', RouteRetrieveUpdateDestroyView.as_view(), name='route-detail'),
+    path('routes/<int:pk>/full/', RouteFullView.as_view(), name='route-full'),
     path('routes/<int:route_id>/reviews/', RouteReviewsView.as_view(), name='route-reviews'),
     path('routes/<int:id>/upload_gpx/', UploadGpxFileView.as_view(), name='upload-gpx'),
+    path('routes/<int:pk>/geometry/', RouteGeometryView.as_view(), name='route-geometry'),
     path('routes/<int:pk>/gpx/', GPXFileGetView.as_view(), name='route-gpx-get'),
     path('routes/<int:pk>/checklist/', DownloadCheckListPdfFileView.as_view(), name='route-checklist-get'),
     path('routes/<int:pk>/download/gpx/', GPXFileDownloadView.as_view(), name='route-gpx-download'),
@@ -39,6 +44,7 @@ urlpatterns = [
 
     path('route_photo/', RoutePhotoListView.as_view(), name='route-photo-list'),
     path('route_photo/unchecked/', RoutePhotoUnchekedListView.as_view(), name='route-photo-unchecked'),
+    path('route_photo/moderate/', ModerateRoutePhotosView.as_view(), name='route-photo-moderate'),
     path('route_photo/<int:pk>/', RoutePhotoRetrieveUpdateDestroyView.as_view(), name='route-photo-detail'),
     path('routes/<int:pk>/photos/', RoutePhotoByIdView.as_view(), name='route-photo-list'),
     path('route_photo/<int:id>/upload_image/', UploadRoutePhotoView.as_view(), name='upload-file'),
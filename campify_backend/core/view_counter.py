@@ -0,0 +1,91 @@
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+
+from .models import Route
+from .recommendations import recommendation_engine
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    Счётчик просмотров маршрутов с отложенной записью.
+
+    Просмотры копятся в памяти процесса и раз в VIEW_COUNTER_FLUSH_INTERVAL
+    секунд записываются в базу: по одному UPDATE ... SET views = views + n
+    на каждое встречающееся n, а не по строке на каждый запрос. При штатном
+    завершении процесса накопленное дописывается (atexit); если запись не
+    удалась, счётчики возвращаются в буфер до следующей попытки.
+    При интервале 0 каждый просмотр записывается сразу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._timer = None
+
+    @property
+    def interval(self):
+        return getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10)
+
+    def add(self, route_id, count=1):
+        with self._lock:
+            self._pending[route_id] += count
+            if self.interval > 0 and self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if self.interval <= 0:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        close_old_connections()
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        """Записывает накопленные просмотры. Возвращает число обновлённых маршрутов."""
+        with self._lock:
+            counts, self._pending = self._pending, Counter()
+        if not counts:
+            return 0
+
+        by_count = defaultdict(list)
+        for route_id, count in counts.items():
+            by_count[count].append(route_id)
+        try:
+            with transaction.atomic():
+                for count, route_ids in by_count.items():
+                    Route.objects.filter(id__in=route_ids).update(views=F('views') + count)
+        except DatabaseError:
+            logger.exception('Не удалось записать просмотры маршрутов, повторим позже')
+            with self._lock:
+                self._pending.update(counts)
+            return 0
+        recommendation_engine.add_views(counts)
+        return len(counts)
+
+    def shutdown(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.shutdown)
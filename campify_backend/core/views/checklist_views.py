@@ -1,4 +1,3 @@
-from django.http import FileResponse
 from drf_yasg import openapi
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
@@ -6,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from ..serializers import *
 from ..models import *
+from ..downloads import file_response
 from drf_yasg.utils import swagger_auto_schema
 
 class ChecklistListCreateView(generics.ListCreateAPIView):
@@ -62,9 +62,8 @@ class ChecklistItemsByIdView(generics.ListAPIView):
     serializer_class = ItemSerializer
 
     def get_queryset(self):
-        checklist_id = self.kwargs['checklist_id']
-        checklist =  Checklist.objects.get(id=checklist_id)
-        return checklist.items.all()
+        # checklist.items - строки ChecklistItems, а сериализуются сами вещи
+        return Item.objects.filter(checklist_items__checklist_id=self.kwargs['checklist_id'])
 
     @swagger_auto_schema(
         operation_summary="Список вещей чек-листа по id",
@@ -91,12 +90,12 @@ class DownloadCheckListPdfFileView(APIView):
             if not pdf_url:
                 return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
 
-            response = FileResponse(pdf_url.open('rb'), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{pdf_url.name}"'
-            return response
+            return file_response(request, pdf_url, 'application/pdf', f'{checklist.name}.pdf', as_attachment=True)
 
         except Checklist.DoesNotExist:
             return Response({"detail": "Чеклист не найден."}, status=status.HTTP_404_NOT_FOUND)
+        except FileNotFoundError:
+            return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
 
     def get_checkist_name(self, route_id):
         route = Route.objects.get(id=route_id)
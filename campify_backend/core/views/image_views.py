@@ -1,3 +1,4 @@
+from django.db import transaction
 from drf_yasg import openapi
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
@@ -5,6 +6,11 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from ..serializers import *
 from ..models import *
+from ..pagination import RoutePhotoCursorPagination
+from ..images import InvalidImageError, prepare_image_upload
+from ..media import acquire, derivative_names, discard, release
+from ..response_cache import CachedResponseMixin, bump_on_commit
+from ..workers import upload_pool
 from drf_yasg.utils import swagger_auto_schema
 
 # Фото к маршрутам
@@ -12,6 +18,7 @@ from drf_yasg.utils import swagger_auto_schema
 class RoutePhotoListView(generics.ListCreateAPIView):
     queryset = RoutePhoto.objects.all()
     serializer_class = RoutePhotoSerializer
+    pagination_class = RoutePhotoCursorPagination
     http_method_names = ['get']
 
     def get_queryset(self):
@@ -27,6 +34,7 @@ class RoutePhotoListView(generics.ListCreateAPIView):
 class RoutePhotoUnchekedListView(generics.ListCreateAPIView):
     queryset = RoutePhoto.objects.all()
     serializer_class = RoutePhotoSerializer
+    pagination_class = RoutePhotoCursorPagination
     http_method_names = ['get']
 
     def get_queryset(self):
@@ -76,8 +84,50 @@ class UpdatePhotoValidationStatusView(APIView):
 
         return Response({"id": photo.id, "is_checked": photo.is_checked}, status=status.HTTP_200_OK)
 
-class RoutePhotoByIdView(generics.ListAPIView):
+class ModerateRoutePhotosView(APIView):
+    serializer_class = PhotoModerationSerializer
+
+    @swagger_auto_schema(
+        operation_summary="Массовая модерация фото к маршрутам",
+        operation_description="Одобренные фото помечаются проверенными, отклонённые удаляются "
+                              "вместе с файлами. Для каждого id возвращается результат: "
+                              "approved, rejected или not_found.",
+        request_body=PhotoModerationSerializer,
+        tags=["RoutePhoto"]
+    )
+    def post(self, request):
+        serializer = PhotoModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        verdicts = serializer.validated_data['items']
+
+        with transaction.atomic():
+            route_ids = dict(
+                RoutePhoto.objects.filter(id__in=verdicts).select_for_update().values_list('id', 'route_id')
+            )
+            approved = [pk for pk in route_ids if verdicts[pk] == PhotoVerdictSerializer.APPROVE]
+            rejected = [pk for pk in route_ids if verdicts[pk] == PhotoVerdictSerializer.REJECT]
+            if approved:
+                # update() не шлёт post_save, поэтому кэш фото маршрутов сбрасываем сами
+                RoutePhoto.objects.filter(id__in=approved).update(is_checked=True)
+                bump_on_commit(*{f'route_photos:{route_ids[pk]}' for pk in approved})
+            if rejected:
+                # Обычное удаление: сигналы освобождают ссылки на файлы, а сами
+                # файлы удаляются в фоне после фиксации транзакции
+                RoutePhoto.objects.filter(id__in=rejected).delete()
+
+        outcomes = {
+            PhotoVerdictSerializer.APPROVE: 'approved',
+            PhotoVerdictSerializer.REJECT: 'rejected',
+        }
+        results = [
+            {"id": pk, "result": outcomes[verdict] if pk in route_ids else 'not_found'}
+            for pk, verdict in verdicts.items()
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+class RoutePhotoByIdView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = RoutePhotoSerializer
+    cache_namespaces = ('route_photos:{pk}',)
 
     def get_queryset(self):
         pk = self.kwargs.get('pk')
@@ -93,33 +143,67 @@ class RoutePhotoByIdView(generics.ListAPIView):
 
 class UploadRoutePhotoView(APIView):
     parser_classes = [MultiPartParser, FormParser]
+    max_files = 50
 
     @swagger_auto_schema(
-        operation_summary="Загрузка изображения по ID маршрута",
+        operation_summary="Загрузка изображений по ID маршрута",
+        operation_description="Поле image можно передать несколько раз (до 50 файлов). "
+                              "Файлы обрабатываются параллельно, результат возвращается по каждому.",
         tags=["RoutePhoto"],
         manual_parameters=[
             openapi.Parameter('id', openapi.IN_PATH, description="ID маршрута", type=openapi.TYPE_INTEGER),
             openapi.Parameter('image', openapi.IN_FORM, type=openapi.TYPE_FILE, description="Фото маршрута"),
         ],
-        responses={201: openapi.Response('Фото успешно загружено')}
+        responses={201: openapi.Response('Фото успешно загружены')}
     )
     def post(self, request, id):
-        try:
-            route = Route.objects.get(id=id)
-        except Route.DoesNotExist:
+        if not Route.objects.filter(id=id).exists():
             return Response({"detail": "Маршрут не найден."}, status=status.HTTP_404_NOT_FOUND)
 
-        image = request.FILES.get('image')
-        if not image:
+        images = request.FILES.getlist('image')
+        if not images:
             return Response({"detail": "Файл не найден в запросе."}, status=status.HTTP_400_BAD_REQUEST)
-
-        photo = RoutePhoto.objects.create(route=route, image=image)
-
-        return Response({
-            "detail": "Фото успешно загружено.",
-            "photo_id": photo.id,
-            "image_url": photo.image.url
-        }, status=status.HTTP_201_CREATED)
+        if len(images) > self.max_files:
+            return Response({"detail": f"За один запрос можно загрузить не больше {self.max_files} файлов."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Декодирование и сжатие - в общем пуле потоков (Pillow отпускает GIL), база - только здесь
+        field = RoutePhoto._meta.get_field('image')
+        outcomes = upload_pool.run_all(lambda image: prepare_image_upload(image, field), images)
+        prepared = [result for result, _ in outcomes]
+        saved = [name for name, derivatives in filter(None, prepared) for name in (name, *derivative_names(derivatives))]
+        for _, error in outcomes:
+            if error is not None and not isinstance(error, InvalidImageError):
+                # Сбой хранилища, а не плохой файл: это ошибка сервера, а файлы
+                # остальных фото уже никому не понадобятся
+                discard(saved)
+                raise error
+
+        photos = [
+            RoutePhoto(route_id=id, image=name, derivatives=derivatives)
+            for name, derivatives in filter(None, prepared)
+        ]
+        with transaction.atomic():
+            # bulk_create не шлёт post_save: ссылки на файлы и кэш фото маршрута обновляем сами
+            RoutePhoto.objects.bulk_create(photos)
+            acquire(saved)
+            if photos:
+                bump_on_commit(f'route_photos:{id}')
+
+        created = iter(photos)
+        results = []
+        for image, item in zip(images, prepared):
+            if item is None:
+                results.append({"file": image.name, "detail": "Файл не является изображением."})
+                continue
+            photo = next(created)
+            results.append({"file": image.name, "photo_id": photo.id, "image_url": photo.image.url})
+
+        data = {"detail": f"Загружено фото: {len(photos)} из {len(images)}.", "results": results}
+        if len(images) == 1 and photos:
+            # Прежний формат ответа для загрузки одного файла
+            data.update(detail="Фото успешно загружено.", photo_id=photos[0].id, image_url=photos[0].image.url)
+        return Response(data, status=status.HTTP_201_CREATED if photos else status.HTTP_400_BAD_REQUEST)
 
 # Фото к локациям
 
@@ -143,9 +227,12 @@ class DeleteMapPointImageView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        point.image.delete(save=False)
-        point.image = None
-        point.save()
+        with transaction.atomic():
+            release(derivative_names(point.derivatives))
+            point.image.delete(save=False)
+            point.image = None
+            point.derivatives = {}
+            point.save()
 
         return Response(
             status=status.HTTP_204_NO_CONTENT
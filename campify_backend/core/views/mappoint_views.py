@@ -1,5 +1,8 @@
+from drf_yasg import openapi
 from rest_framework import status, generics
+from rest_framework.response import Response
 from ..serializers import *
+from ..geo import bbox_center, bbox_q, circle_bbox, parse_bbox, parse_circle, sort_by_distance
 from drf_yasg.utils import swagger_auto_schema
 
 
@@ -7,9 +10,38 @@ class MapPointListCreateView(generics.ListCreateAPIView):
     queryset = MapPoint.objects.all()
     serializer_class = MapPointSerializer
 
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        radius_km = None
+        try:
+            if {'lat', 'lon', 'radius_km'} & params.keys():
+                lat, lon, radius_km = parse_circle(params.get('lat'), params.get('lon'), params.get('radius_km'))
+                bbox = circle_bbox(lat, lon, radius_km)
+            elif 'bbox' in params:
+                bbox = parse_bbox(params['bbox'])
+                lat, lon = bbox_center(bbox)
+            else:
+                return super().list(request, *args, **kwargs)
+        except ValueError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Грубый отбор по ячейкам сетки в базе, точный - по расстоянию в numpy
+        found = sort_by_distance(self.get_queryset().filter(bbox_q(bbox)), lat, lon, radius_km)
+        data = self.get_serializer([point for point, _ in found], many=True).data
+        for item, (_, distance) in zip(data, found):
+            item['distance_km'] = round(distance, 3)
+        return Response(data)
+
     @swagger_auto_schema(
         operation_summary="Список локаций",
-        tags=["MapPoint"]
+        tags=["MapPoint"],
+        manual_parameters=[
+            openapi.Parameter('bbox', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Область карты: min_lon,min_lat,max_lon,max_lat"),
+            openapi.Parameter('lat', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Широта центра поиска"),
+            openapi.Parameter('lon', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Долгота центра поиска"),
+            openapi.Parameter('radius_km', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Радиус поиска в км"),
+        ],
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
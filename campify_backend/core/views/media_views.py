@@ -0,0 +1,58 @@
+import mimetypes
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import Http404
+from django.views.static import serve
+
+from ..compression import GZIP_SUFFIX
+from ..downloads import offload_response, storage_response
+from ..storage import BLOB_DIR, TEMP_DIR
+
+# Блоб под именем-хешем никогда не меняется, его можно кэшировать навсегда
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _serve_compressed(request, path):
+    # Сжатые файлы (GPX в .gpx.gz) отдаются с учётом Accept-Encoding, как
+    # скачивание маршрута: клиенту без gzip - распакованными
+    original = path[:-len(GZIP_SUFFIX)]
+    content_type = mimetypes.guess_type(original)[0] or 'application/octet-stream'
+    try:
+        return storage_response(request, default_storage, path, content_type, original.rsplit('/', 1)[-1])
+    except FileNotFoundError:
+        raise Http404
+
+
+def _is_hidden(path):
+    # Недописанные загрузки и блокировка хранилища лежат в .incoming/;
+    # служебные файлы с точкой в начале имени не отдаются нигде
+    parts = posixpath.normpath(path).split('/')
+    return parts[0] == TEMP_DIR or any(part.startswith('.') for part in parts)
+
+
+def serve_media(request, path):
+    """
+    Отдаёт загруженные файлы; файлы из хранилища блобов - с вечным
+    кэшированием. При MEDIA_OFFLOAD файл отдаёт фронтовой прокси.
+    Сжатые файлы идут через storage_response и выбор Content-Encoding.
+    Служебные файлы хранилища (.incoming/) не отдаются.
+    """
+    if _is_hidden(path):
+        raise Http404
+    try:
+        if path.endswith(GZIP_SUFFIX):
+            response = _serve_compressed(request, path)
+        else:
+            response = offload_response(path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if response is None:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if path.startswith(BLOB_DIR + '/'):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = 'no-cache'
+    return response
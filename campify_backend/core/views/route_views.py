@@ -1,7 +1,6 @@
-import re
-
-from django.db.models import Avg, F, Sum, Case, When, FloatField, Value
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.duration import duration_string
 from drf_yasg import openapi
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
@@ -9,122 +8,35 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from ..serializers import *
 from ..models import *
+from ..pagination import RouteCursorPagination
+from .. import ratings
+from ..recommendations import DEFAULT_LIMIT, recommendation_engine
+from ..tagging import create_tags_for_route
+from ..tag_registry import tag_registry
+from ..response_cache import CachedResponseMixin
+from ..view_counter import view_counter
+from ..compression import compress_file, save_brotli_variant
+from ..downloads import file_response
+from ..gpx import GPXError, TrackPoints, measure_track
+from ..geometry import GEOMETRY_LEVELS, level_for_zoom, store_route_geometry
+from ..geo import bbox_q, circle_bbox, nearest, parse_circle
+from ..route_filters import RouteFilter
+from ..search import search_route_ids
 from drf_yasg.utils import swagger_auto_schema
 
 
-def create_tags_for_route(data):
-    tags = []
-
-    if data.get('difficulty') == 1:
-        tags.append('новичок')
-        tags.append('легко')
-    elif data.get('difficulty') == 2:
-        tags.append('средне')
-    elif data.get('difficulty') == 3:
-        tags.append('опытный')
-        tags.append('сложно')
-    elif data.get('difficulty') == 4:
-        tags.append('профи')
-        tags.append('сложно')
-
-    if data.get('type') == 1:
-        tags.append('обустроенный')
-    elif data.get('type') == 2:
-        tags.append('дикий')
-        tags.append('экстрим')
-
-    if data.get('duration'):
-        duration = data['duration']
-        total_hours = duration.total_seconds() // 3600
-        if total_hours <= 8:
-            tags.append('1_день')
-        elif 8 < total_hours <= 18:
-            tags.append('выходные')
-        elif 18 < total_hours <= 150:
-            tags.append('неделя')
-        else:
-            tags.append('экспедиция')
-
-    text = f"{data.get('description', '') or ''} {data.get('name', '') or ''}".lower()
-
-    if 'пешком' in text or 'пеший' in text or 'ногами' in text:
-        tags.append('пеший')
-    if 'сплав' in text or 'байдарк' in text or 'SUP' in text:
-        tags.append('сплав')
-    if 'фото' in text or 'пейзаж' in text:
-        tags.append('фото')
-    if 'пещер' in text or 'ущель' in text:
-        tags.append('пещеры')
-    if 'йог' in text or 'медитац' in text:
-        tags.append('релакс')
-
-    if 'глэмпинг' in text:
-        tags.append('глэмпинг')
-        tags.append('укрытие')
-    if 'кемпинг' in text:
-        tags.append('кемпинг')
-
-
-    if 'машин' in text or 'авто' in text or 'колес' in text:
-        tags.append('комфорт_авто')
-        tags.append('транспорт')
-
-    if 'аренда' in text:
-        if 'палатка' in text or 'спальник' in text:
-            tags.append('аренда_снаряжение')
-        if 'газов' in text or 'горелк' in text:
-            tags.append('аренда_кухня')
-        if 'байдар' in text or 'велосипед' in text:
-            tags.append('аренда_транспорт')
-    else:
-        tags.append('без_аренды')
-
-    if 'гора' in text or 'горы' in text:
-        tags.append('горы')
-    if 'озер' in text or 'рек' in text or 'мор' in text  or 'водоем' in text:
-        tags.append('вода')
-    if 'лес' in text or re.search(r'\bрощ[аеиуыюя]\b', text) or 'бор' in text:
-        tags.append('лес')
-    if 'истор' in text or 'заброшк' in text or 'петроглиф' in text:
-        tags.append('история')
-    if 'малоизвест' in text or 'секрет' in text:
-        tags.append('секретные')
-
-    if 'один' in text or 'друзья' in text:
-        tags.append('взрослые')
-    if (re.search(r'\bдет(и|ям|ями|ях)\b', text) or
-            re.search(r'\bреб(ё|е)н(ка|ок|ку|ке)\b', text)):
-        tags.append('дети')
-    if 'собак' in text or 'пёс' in text:
-        tags.append('с_собакой')
-    if 'групп' in text or 'гид' in text:
-        tags.append('группа')
-
-    if 'летом' in text or 'лет' in text:
-        tags.append('лето')
-    if 'осень' in text:
-        tags.append('осень')
-    if 'зим' in text:
-        tags.append('зима')
-    if 'весн' in text:
-        tags.append('весна')
-
-    if 'экстрим' in text:
-        tags.append('экстрим')
-    if 'природ' in text:
-        tags.append('природа')
-    if 'культур' in text:
-        tags.append('культура')
-
-    return tags
-
-
 class RouteListCreateView(generics.ListCreateAPIView):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
+    pagination_class = RouteCursorPagination
 
     def get_queryset(self):
-        return Route.objects.filter(is_public=True).annotate(average_rating=Avg('reviews__rating'))
+        return RouteListSerializer.setup_queryset(Route.objects.filter(is_public=True))
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return RouteListSerializer
+        return RouteSerializer
 
     @swagger_auto_schema(
         operation_summary="Список маршрутов",
@@ -149,18 +61,18 @@ class RouteListCreateView(generics.ListCreateAPIView):
 
         instance = serializer.instance
         tags = create_tags_for_route(serializer.validated_data)
-        tag_objs = [Tag.objects.get_or_create(name=tag)[0] for tag in tags]
-        instance.tags.set(tag_objs)
+        instance.tags.set(tag_registry.resolve(tags).values())
 
         return Response({'id': serializer.instance.id}, status=status.HTTP_201_CREATED)
 
 
 class UserRouteGetView(generics.ListAPIView):
-    serializer_class = RouteSerializer
+    serializer_class = RouteListSerializer
+    pagination_class = RouteCursorPagination
 
     def get_queryset(self):
         user_id = self.kwargs['user_id']
-        return Route.objects.filter(author=user_id).annotate(average_rating=Avg('reviews__rating'))
+        return RouteListSerializer.setup_queryset(Route.objects.filter(author=user_id))
 
     @swagger_auto_schema(
         operation_summary="Список маршрутов пользователя",
@@ -169,11 +81,13 @@ class UserRouteGetView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
-class EquipRouteGetView(generics.ListAPIView):
-    serializer_class = RouteSerializer
+class EquipRouteGetView(CachedResponseMixin, generics.ListAPIView):
+    serializer_class = RouteListSerializer
+    cache_namespaces = ('routes', 'tags')
+    pagination_class = RouteCursorPagination
 
     def get_queryset(self):
-        return Route.objects.filter(type = 1, is_public=True)
+        return RouteListSerializer.setup_queryset(Route.objects.filter(type = 1, is_public=True))
 
     @swagger_auto_schema(
         operation_summary="Список оборудованных маршрутов",
@@ -182,11 +96,13 @@ class EquipRouteGetView(generics.ListAPIView):
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
-class WildRouteGetView(generics.ListAPIView):
-    serializer_class = RouteSerializer
+class WildRouteGetView(CachedResponseMixin, generics.ListAPIView):
+    serializer_class = RouteListSerializer
+    cache_namespaces = ('routes', 'tags')
+    pagination_class = RouteCursorPagination
 
     def get_queryset(self):
-        return Route.objects.filter(type = 2, is_public=True)
+        return RouteListSerializer.setup_queryset(Route.objects.filter(type = 2, is_public=True))
 
     @swagger_auto_schema(
         operation_summary="Список диких маршрутов",
@@ -197,52 +113,191 @@ class WildRouteGetView(generics.ListAPIView):
 
 
 class RecommendedRoutesView(generics.ListAPIView):
-    serializer_class = RouteSerializer
+    serializer_class = RouteListSerializer
+    max_results = 100
 
-    def get_queryset(self):
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            limit = min(int(params.get('limit', DEFAULT_LIMIT)), self.max_results)
+            offset = int(params.get('offset', 0))
+        except ValueError:
+            return Response({"detail": "Параметры limit и offset должны быть целыми числами."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0 or offset < 0:
+            return Response({"detail": "limit должен быть положительным, offset - неотрицательным."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_routes(limit, offset), many=True).data)
+
+    def get_routes(self, limit, offset):
         user_id = self.kwargs.get('user_id')
         if not user_id:
-            return Route.objects.none()
+            return []
 
-        user = User.objects.get(id=user_id)
+        preferences = dict(
+            UserTagPreference.objects.filter(user_id=user_id).values_list('tag_id', 'weight')
+        )
 
-        preferences = UserTagPreference.objects.filter(user=user)
+        if not preferences:
+            popular = Route.objects.filter(is_public=True).order_by('-views', '-id')
+            return RouteListSerializer.setup_queryset(popular)[offset:offset + limit]  # fallback
 
-        if not preferences.exists():
-            return Route.objects.filter(is_public=True).order_by('-views')[:10]  # fallback
+        route_ids = recommendation_engine.recommend(preferences, limit, offset)
+        # Матрица в этом процессе может отставать от изменений, сделанных в
+        # других воркерах, поэтому видимость маршрута проверяется по базе
+        routes = RouteListSerializer.setup_queryset(Route.objects.filter(is_public=True)).in_bulk(route_ids)
+        return [routes[route_id] for route_id in route_ids if route_id in routes]
 
-        whens = [
-            When(tags=pref.tag, then=Value(pref.weight))
-            for pref in preferences
-        ]
+    @swagger_auto_schema(
+        operation_summary="Список рекомендованных маршрутов для пользователя",
+        tags=["Route"],
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description=f"Число результатов (до 100, по умолчанию {DEFAULT_LIMIT})"),
+            openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Сколько результатов пропустить"),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
-        return (
-            Route.objects
-            .filter(is_public=True, tags__in=[p.tag for p in preferences])
-            .annotate(score=Sum(
-                Case(*whens, output_field=FloatField())
-            ))
-            .order_by('-score', '-views')
-            .distinct()
+class NearbyRoutesView(generics.ListAPIView):
+    serializer_class = RouteListSerializer
+    max_results = 100
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            lat, lon, radius_km = parse_circle(params.get('lat'), params.get('lon'), params.get('radius_km'))
+        except ValueError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            filters = {name: int(params[name]) for name in ('type', 'difficulty') if params.get(name)}
+        except ValueError:
+            return Response({"detail": "Параметры type и difficulty должны быть целыми числами."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Грубый отбор по ячейкам сетки стартовых точек, точный - по расстоянию в numpy.
+        # Кандидатов в радиусе до MAX_RADIUS_KM может быть весь каталог, поэтому
+        # для них читаются только id и координаты, а целиком - max_results лучших
+        candidates = Route.objects.filter(is_public=True, **filters).filter(bbox_q(
+            circle_bbox(lat, lon, radius_km),
+            lat_field='start_latitude', lon_field='start_longitude', cell_field='start_cell',
+        )).values_list('id', 'start_latitude', 'start_longitude')
+        found = nearest(candidates, lat, lon, radius_km, self.max_results)
+
+        routes = RouteListSerializer.setup_queryset(Route.objects.filter(is_public=True)).in_bulk(
+            [route_id for route_id, _ in found]
         )
+        found = [(routes[route_id], distance) for route_id, distance in found if route_id in routes]
+        data = self.get_serializer([route for route, _ in found], many=True).data
+        for item, (_, distance) in zip(data, found):
+            item['distance_km'] = round(distance, 3)
+        return Response(data)
 
     @swagger_auto_schema(
-        operation_summary="Список рекомендованных маршрутов для пользователя",
-        tags=["Route"]
+        operation_summary="Публичные маршруты рядом с точкой, по расстоянию до старта",
+        tags=["Route"],
+        manual_parameters=[
+            openapi.Parameter('lat', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, required=True, description="Широта"),
+            openapi.Parameter('lon', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, required=True, description="Долгота"),
+            openapi.Parameter('radius_km', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, required=True, description="Радиус поиска в км"),
+            openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Тип маршрута"),
+            openapi.Parameter('difficulty', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Сложность маршрута"),
+        ],
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
-class RouteRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class RouteSearchView(generics.ListAPIView):
+    serializer_class = RouteListSerializer
+    max_results = 100
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "Параметр q обязателен."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filters = {name: int(params[name]) for name in ('type', 'difficulty') if params.get(name)}
+            limit = min(int(params.get('limit', 20)), self.max_results)
+            offset = int(params.get('offset', 0))
+        except ValueError:
+            return Response({"detail": "Параметры type, difficulty, limit и offset должны быть целыми числами."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0 or offset < 0:
+            return Response({"detail": "limit должен быть положительным, offset - неотрицательным."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        route_ids = search_route_ids(query, filters, limit, offset)
+        routes = RouteListSerializer.setup_queryset(Route.objects.all()).in_bulk(route_ids)
+        return Response(self.get_serializer([routes[pk] for pk in route_ids if pk in routes], many=True).data)
+
+    @swagger_auto_schema(
+        operation_summary="Полнотекстовый поиск публичных маршрутов по названию, описанию и местности",
+        tags=["Route"],
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description="Поисковый запрос"),
+            openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Тип маршрута"),
+            openapi.Parameter('difficulty', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Сложность маршрута"),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Число результатов (до 100)"),
+            openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Сколько результатов пропустить"),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+class RouteFilterView(generics.ListAPIView):
+    serializer_class = RouteListSerializer
+    pagination_class = RouteCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        try:
+            route_filter = RouteFilter.from_params(request.query_params)
+        except ValueError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(RouteListSerializer.setup_queryset(route_filter.queryset()))
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        # Фасеты не зависят от страницы - считаем их только для первой
+        if not request.query_params.get(self.paginator.cursor_query_param):
+            response.data['facets'] = route_filter.facets()
+        return response
+
+    @swagger_auto_schema(
+        operation_summary="Фильтр публичных маршрутов со счётчиками фасетов",
+        operation_description="Списки значений передаются через запятую. Фасеты (число маршрутов для каждого "
+                              "значения при остальных условиях) возвращаются на первой странице.",
+        tags=["Route"],
+        manual_parameters=[
+            openapi.Parameter('difficulty', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Сложности, например 1,2"),
+            openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Типы маршрута, например 1,2"),
+            openapi.Parameter('duration', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Длительность: short, half_day, day, multi_day"),
+            openapi.Parameter('length_min', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Минимальная длина, км"),
+            openapi.Parameter('length_max', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="Максимальная длина, км"),
+            openapi.Parameter('tags', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="id тегов через запятую"),
+            openapi.Parameter('tags_mode', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="all - все теги (по умолчанию), any - любой"),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+class RouteRetrieveUpdateDestroyView(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
+    cache_namespaces = ('route:{pk}', 'tags')
 
     @swagger_auto_schema(
         operation_summary="Получение маршрута по id",
         tags=["Route"]
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        response = super().get(request, *args, **kwargs)
+        # Считаем и ответы из кэша; в базу просмотры пишутся пачками
+        view_counter.add(response.data['id'])
+        return response
 
     @swagger_auto_schema(
         operation_summary="Полное обновление маршрута",
@@ -266,8 +321,35 @@ class RouteRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return super().delete(request, *args, **kwargs)
 
 
-class RouteReviewsView(generics.ListAPIView):
+class RouteFullView(generics.RetrieveAPIView):
+    serializer_class = RouteFullSerializer
+
+    def get_queryset(self):
+        # Фиксированное число запросов: маршрут с автором, теги, фото, точки,
+        # чек-листы и первая страница отзывов - независимо от их количества
+        reviews = RouteReview.objects.order_by('-created_at', '-id')[:RouteFullSerializer.reviews_page_size + 1]
+        return Route.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('photos', queryset=RoutePhoto.objects.filter(is_checked=True).order_by('-uploaded_at', '-id'),
+                     to_attr='checked_photos'),
+            Prefetch('points', queryset=MapPoint.objects.order_by('id')),
+            Prefetch('checklists', queryset=Checklist.objects.order_by('id')),
+            Prefetch('reviews', queryset=reviews, to_attr='first_reviews'),
+        )
+
+    @swagger_auto_schema(
+        operation_summary="Маршрут со всем содержимым страницы: автор, теги, фото, точки, чек-листы, отзывы",
+        tags=["Route"]
+    )
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        view_counter.add(response.data['id'])
+        return response
+
+
+class RouteReviewsView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = RouteReviewSerializer
+    cache_namespaces = ('route_reviews:{route_id}',)
 
     def get_queryset(self):
         route_id = self.kwargs['route_id']
@@ -320,6 +402,11 @@ class RouteReviewListCreateView(generics.ListCreateAPIView):
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            review = serializer.save()
+            ratings.review_created(review)
+
 class RouteReviewRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = RouteReview.objects.all()
     serializer_class = RouteReviewSerializer
@@ -353,6 +440,13 @@ class RouteReviewRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        old_route_id = serializer.instance.route_id
+        old_rating = serializer.instance.rating
+        with transaction.atomic():
+            review = serializer.save()
+            ratings.review_updated(old_route_id, old_rating, review)
+
 
 
 class UploadGpxFileView(APIView):
@@ -377,15 +471,64 @@ class UploadGpxFileView(APIView):
         if not gpx_file:
             return Response({"detail": "Файл не найден в запросе."}, status=status.HTTP_400_BAD_REQUEST)
 
-        route.gpx_url = gpx_file
-        route.save()
+        points = TrackPoints()
+        try:
+            metrics = measure_track(gpx_file, points)
+        except GPXError as error:
+            return Response({"detail": f"Некорректный GPX-файл: {error}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Храним GPX сжатым: gzip всегда, br - если установлен brotli
+        gzip_file, brotli_file = compress_file(gpx_file, gpx_file.name)
+        route.gpx_url = gzip_file
+        metrics.apply_to(route)
+        with transaction.atomic():
+            route.save()
+            store_route_geometry(route, points.lat, points.lon)
+        save_brotli_variant(route.gpx_url, brotli_file)
 
         return Response({
             "detail": "Файл успешно загружен",
-            "gpx_url": route.gpx_url.url
+            "gpx_url": route.gpx_url.url,
+            "length_in_km": route.length_in_km,
+            "elevation_gain": route.elevation_gain,
+            "height": route.height,
+            "duration": duration_string(route.duration) if route.duration else None,
         })
 
 
+class RouteGeometryView(APIView):
+    @swagger_auto_schema(
+        operation_summary="Упрощённая линия трека маршрута для зума карты",
+        tags=["Route"],
+        manual_parameters=[
+            openapi.Parameter('zoom', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description="Зум карты (по умолчанию - самый детальный уровень)"),
+        ],
+        responses={200: openapi.Response('Линия трека в формате Encoded Polyline'), 404: "Геометрия не найдена"},
+    )
+    def get(self, request, pk):
+        zoom = request.query_params.get('zoom')
+        if zoom is None:
+            level = len(GEOMETRY_LEVELS) - 1
+        else:
+            try:
+                level = level_for_zoom(int(zoom))
+            except ValueError:
+                return Response({"detail": "Параметр zoom должен быть целым числом."}, status=status.HTTP_400_BAD_REQUEST)
+
+        geometry = (
+            RouteGeometry.objects
+            .filter(route_id=pk, level=level)
+            .values('level', 'min_zoom', 'tolerance', 'point_count', 'polyline')
+            .first()
+        )
+        if geometry is None:
+            if not Route.objects.filter(pk=pk).exists():
+                return Response({"detail": "Маршрут не найден."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"detail": "Геометрия трека не рассчитана."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"route": pk, **geometry})
+
+
 class GPXFileDownloadView(APIView):
     @swagger_auto_schema(
         operation_summary="Скачивание GPX файла маршрута",
@@ -405,12 +548,12 @@ class GPXFileDownloadView(APIView):
             if not gpx_file:
                 return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
 
-            response = FileResponse(gpx_file.open('rb'), content_type='application/gpx+xml')
-            response['Content-Disposition'] = f'attachment; filename="{gpx_file.name}"'
-            return response
+            return file_response(request, gpx_file, 'application/gpx+xml', f'route_{route.id}.gpx', as_attachment=True)
 
         except Route.DoesNotExist:
             return Response({"detail": "Маршрут не найден."}, status=status.HTTP_404_NOT_FOUND)
+        except FileNotFoundError:
+            return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
 
 
 class GPXFileGetView(APIView):
@@ -431,6 +574,8 @@ class GPXFileGetView(APIView):
             gpx_file = route.gpx_url
             if not gpx_file:
                 return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
-            return FileResponse(gpx_file.open('rb'), content_type='application/gpx', filename=gpx_file.name)
+            return file_response(request, gpx_file, 'application/gpx', f'route_{route.id}.gpx')
         except Route.DoesNotExist:
-            return Response({"detail": "Маршрут не найден."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({"detail": "Маршрут не найден."}, status=status.HTTP_404_NOT_FOUND)
+        except FileNotFoundError:
+            return Response({"detail": "Файл не найден."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
@@ -1,11 +1,13 @@
 from rest_framework import generics
 from ..serializers import *
+from ..response_cache import CachedResponseMixin
 from drf_yasg.utils import swagger_auto_schema
 
 
-class TagListView(generics.ListCreateAPIView):
+class TagListView(CachedResponseMixin, generics.ListCreateAPIView):
     queryset = Tag.objects.all()
     serializer_class = TagsItemsSerializer
+    cache_namespaces = ('tags',)
 
     @swagger_auto_schema(
         operation_summary="Список тегов",
@@ -10,7 +10,8 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from ..serializers import *
 from drf_yasg.utils import swagger_auto_schema
-from django.db.models import F
+from django.db import transaction
+from ..preferences import apply_route_view, set_initial_preferences
 
 @swagger_auto_schema(
     method='post',
@@ -155,14 +156,10 @@ class UserPreferencesCreateView(APIView):
         except User.DoesNotExist:
             return Response({"error": "Пользователь не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-        for tag_name in tags:
-            tag, _ = Tag.objects.get_or_create(name=tag_name)
-            preference, created = UserTagPreference.objects.get_or_create(user=user, tag=tag)
-            preference.weight = 0.5  # фиксированный вес
-            preference.save()
-
-        user.is_pass_test = True;
-        user.save()
+        with transaction.atomic():
+            set_initial_preferences(user.id, tags)
+            user.is_pass_test = True
+            user.save(update_fields=['is_pass_test'])
         return Response({'detail': 'Предпочтения обновлены.'}, status=status.HTTP_200_OK)
 
 class UserPreferencesUpdateView(APIView):
@@ -193,18 +190,5 @@ class UserPreferencesUpdateView(APIView):
         return Response({'detail': 'Предпочтения обновлены.'}, status=status.HTTP_200_OK)
 
     def update_user_preferences(self, user, route):
-        STEP = 0.1  # Шаг наращивания
         tag_ids = route.tags.values_list('id', flat=True)
-        self.decay_user_preferences(user, tag_ids)
-
-        for tag_id in tag_ids:
-            pref, _ = UserTagPreference.objects.get_or_create(user=user, tag_id=tag_id)
-            pref.weight += STEP * (1 - pref.weight)
-            pref.weight = round(min(pref.weight, 1.0), 4)
-            pref.save()
-
-    def decay_user_preferences(self, user, viewed_tag_ids, decay_rate=0.05):
-        # Понижаем веса для всех тегов, которые не участвовали в текущем просмотре
-        UserTagPreference.objects.filter(user=user).exclude(tag_id__in=viewed_tag_ids).update(
-            weight=F('weight') * (1 - decay_rate)
-        )
\ No newline at end of file
+        apply_route_view(user.id, tag_ids)
@@ -0,0 +1,95 @@
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    Пул потоков процесса для работы, которую не нужно делать в потоке запроса.
+
+    Задачи не переживают перезапуск процесса, поэтому всё, что они делают,
+    должно уметь досчитываться заново (см. команды rebuild_*). Каждая задача
+    получает собственное соединение с базой и закрывает его по завершении.
+    """
+
+    def __init__(self, workers_setting='BACKGROUND_WORKERS', default_workers=2, thread_name_prefix='campify-worker'):
+        self.workers_setting = workers_setting
+        self.default_workers = default_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, self.workers_setting, self.default_workers),
+                    thread_name_prefix=self.thread_name_prefix,
+                )
+            return self._executor
+
+    @staticmethod
+    def _run(func, args, kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            logger.exception('Фоновая задача %s завершилась ошибкой', getattr(func, '__name__', func))
+        finally:
+            close_old_connections()
+
+    def submit(self, func, *args, **kwargs):
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                logger.exception('Фоновая задача %s завершилась ошибкой', getattr(func, '__name__', func))
+                return None
+        return self._get_executor().submit(self._run, func, args, kwargs)
+
+    def run_all(self, func, items):
+        """
+        Выполняет func(item) для всех items в пуле и ждёт, пока закончатся
+        все. Возвращает пары (результат, исключение) в порядке items: ошибка
+        одного элемента не прерывает остальные. Для работы без базы данных,
+        которую вызывающий поток не может сделать сам быстрее.
+        """
+        def settle(item):
+            try:
+                return func(item), None
+            except Exception as error:
+                return None, error
+
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            return [settle(item) for item in items]
+        return list(self._get_executor().map(settle, items))
+
+    def submit_later(self, delay, func, *args, **kwargs):
+        """Ставит задачу в пул через delay секунд (таймер не переживает перезапуск процесса)."""
+        timer = threading.Timer(delay, self.submit, (func, *args), kwargs)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def submit_on_commit(self, func, *args, **kwargs):
+        """Ставит задачу в пул после фиксации текущей транзакции (сразу, если транзакции нет)."""
+        transaction.on_commit(lambda: self.submit(func, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+background = WorkerPool()
+atexit.register(background.shutdown)
+# Обработка файлов пакетной загрузки: один ограниченный пул на процесс, а не на запрос
+upload_pool = WorkerPool('UPLOAD_WORKERS', 4, 'campify-upload')
+atexit.register(upload_pool.shutdown)